@@ -0,0 +1,22 @@
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .user_cache import current_version, user_cache
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that reuses recently resolved users (see user_cache)."""
+
+    def get_user(self, validated_token):
+        if settings.AUTH_USER_CACHE_SIZE <= 0:
+            return super().get_user(validated_token)
+
+        # Read before loading the user: a change committed meanwhile must
+        # not end up cached under the stamp that came before it
+        version = current_version(validated_token)
+        user = user_cache.get(validated_token, version)
+        if user is None:
+            # Raises for unknown or inactive users, which are never cached
+            user = super().get_user(validated_token)
+            user_cache.set(validated_token, user, version)
+        return user
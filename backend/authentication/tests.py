@@ -1,3 +1,55 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from base.middleware import get_token_user
+
+from .user_cache import UserCache, bump_version, current_version, user_cache
+
+# The version stamps live in the Django cache, shared by every worker
+TEST_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class UserCacheVersionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("alice", password="old-password")
+        self.token = AccessToken.for_user(self.user)
+        user_cache.clear()
+
+    def tearDown(self):
+        user_cache.clear()
+
+    def test_saving_a_user_orphans_entries_of_other_workers(self):
+        other_worker = UserCache()
+        other_worker.set(self.token, self.user, current_version(self.token))
+        self.assertEqual(other_worker.get(self.token, current_version(self.token)), self.user)
+
+        self.user.set_password("new-password")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+
+        self.assertIsNone(other_worker.get(self.token, current_version(self.token)))
+
+    def test_rest_auth_sees_a_deactivation_made_elsewhere(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        self.assertEqual(client.get("/api/profile/me/").status_code, 200)
+
+        # As another worker would: no signal ran in this one, only the stamp moved
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_version(self.user.pk)
+
+        self.assertEqual(client.get("/api/profile/me/").status_code, 401)
+
+    def test_websocket_auth_sees_a_deactivation_made_elsewhere(self):
+        self.assertEqual(async_to_sync(get_token_user)(self.token), self.user)
+
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_version(self.user.pk)
+
+        self.assertTrue(async_to_sync(get_token_user)(self.token).is_anonymous)
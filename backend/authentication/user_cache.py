@@ -0,0 +1,114 @@
+"""
+Short-lived cache of the users behind JWT access tokens.
+
+Both the REST authentication class and the WebSocket JWT middleware resolve
+the token's user through here, so a burst of requests or reconnects with
+the same token costs one user query per worker instead of one per call.
+
+Entries are keyed by (user id, token jti), live for AUTH_USER_CACHE_TTL
+seconds and are evicted least recently used beyond AUTH_USER_CACHE_SIZE.
+Each worker has its own cache, so entries also carry the user's version
+stamp from the shared Django cache as it was before the user was loaded.
+Saving or deleting a user (password change, deactivation) replaces the
+stamp once the transaction commits (see signals.py), and a hit whose stamp
+no longer matches is a miss: the change takes effect on every worker with
+the next request, at the cost of one cache read per hit.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework_simplejwt.settings import api_settings
+
+# Stamps only need to outlive the entries cached under them
+VERSION_TTL = 24 * 3600  # seconds
+
+
+def version_key(user_id):
+    return f"auth_user:version:{user_id}"
+
+
+def current_version(validated_token):
+    """The shared version stamp of the token's user (None if never changed)."""
+    return cache.get(version_key(validated_token[api_settings.USER_ID_CLAIM]))
+
+
+async def acurrent_version(validated_token):
+    return await cache.aget(version_key(validated_token[api_settings.USER_ID_CLAIM]))
+
+
+def bump_version(user_id):
+    """Orphan the user's entries in every worker once the current transaction commits."""
+    transaction.on_commit(
+        lambda: cache.set(version_key(user_id), time.time_ns(), VERSION_TTL)
+    )
+
+
+class UserCache:
+    def __init__(self):
+        self.entries = OrderedDict()  # (user_id, jti) -> (expires, version, user)
+        self.tokens = {}  # user_id -> set of jtis with an entry
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(validated_token):
+        return (
+            str(validated_token[api_settings.USER_ID_CLAIM]),
+            validated_token.get(api_settings.JTI_CLAIM),
+        )
+
+    def get(self, validated_token, version):
+        """The cached user, if cached under ``version`` (see current_version)."""
+        key = self.key(validated_token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, cached_version, user = entry
+            if expires < time.monotonic() or cached_version != version:
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+        # Callers may annotate or modify their user, never share the instance
+        return copy.copy(user)
+
+    def set(self, validated_token, user, version):
+        """Cache ``user``, loaded after reading ``version``."""
+        size = settings.AUTH_USER_CACHE_SIZE
+        if size <= 0:
+            return
+        key = self.key(validated_token)
+        with self.lock:
+            self.entries[key] = (
+                time.monotonic() + settings.AUTH_USER_CACHE_TTL, version, copy.copy(user)
+            )
+            self.entries.move_to_end(key)
+            self.tokens.setdefault(key[0], set()).add(key[1])
+            while len(self.entries) > size:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate(self, user_id):
+        user_id = str(user_id)
+        with self.lock:
+            for jti in self.tokens.pop(user_id, ()):
+                self.entries.pop((user_id, jti), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tokens.clear()
+
+    def _remove(self, key):
+        del self.entries[key]
+        jtis = self.tokens.get(key[0])
+        if jtis is not None:
+            jtis.discard(key[1])
+            if not jtis:
+                del self.tokens[key[0]]
+
+
+user_cache = UserCache()
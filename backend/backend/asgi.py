@@ -9,9 +9,11 @@ django.setup()
 
 import base.routing
 from base.middleware import JWTAuthMiddleware
+from base.lifespan import lifespan_app
 
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
+    "lifespan": lifespan_app,
     "websocket": JWTAuthMiddleware(
         URLRouter(base.routing.websocket_urlpatterns)
     ),
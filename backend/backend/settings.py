@@ -62,13 +62,31 @@ CORS_ALLOWED_ORIGINS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'authentication.authentication.CachedJWTAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'base.fastjson.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'base.fastjson.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ]
 }
 
+# Hub chat history is served newest page first with keyset cursors
+HUB_MESSAGE_PAGE_SIZE = 50
+HUB_MESSAGE_MAX_PAGE_SIZE = 200
+
+# Per-worker cache of users behind JWT access tokens (REST and WebSocket),
+# checked against a per-user version stamp in the shared cache on every hit
+AUTH_USER_CACHE_SIZE = 10000
+AUTH_USER_CACHE_TTL = 30  # seconds
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -144,11 +162,94 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 ASGI_APPLICATION = "backend.asgi.application"
 
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379")
+
+# Shared async Redis pool used by the hub consumers (one per worker process)
+REDIS_MAX_CONNECTIONS = 50
+REDIS_POOL_TIMEOUT = 5  # seconds to wait for a free connection
+
+# Hub presence: sockets refresh a heartbeat, stale ones are swept as offline
+HUB_PRESENCE_HEARTBEAT_INTERVAL = 20
+HUB_PRESENCE_TTL = 60
+HUB_PRESENCE_SWEEP_INTERVAL = 15
+
+# Typing indicators: per-user debounce, hub snapshots at most every interval
+HUB_TYPING_DEBOUNCE = 1.0
+HUB_TYPING_TIMEOUT = 5
+HUB_TYPING_SNAPSHOT_INTERVAL = 0.5
+
+# Write-behind persistence for WebSocket chat messages: bulk insert per
+# micro-batch, broadcast only after the batch commits. Messages still in a
+# worker's buffer are lost if it crashes (they were never acknowledged).
+HUB_CHAT_WRITE_BEHIND = False
+HUB_CHAT_BATCH_SIZE = 100
+HUB_CHAT_BATCH_DELAY = 0.02  # seconds
+
+# Recent chat/edit/delete events kept per hub for resuming sockets
+HUB_REPLAY_BUFFER_SIZE = 500
+HUB_REPLAY_TTL = 7 * 24 * 3600
+
+# Broadcasts from HTTP views go through the BroadcastOutbox table and are sent
+# after commit, up to BATCH_SIZE rows per round, once BATCH_DELAY has passed
+HUB_OUTBOX_BATCH_SIZE = 500
+HUB_OUTBOX_BATCH_DELAY = 0.005  # seconds
+# Rows not sent within the lease (failure, shutdown, crash) are sent again;
+# dispatchers look for them every RETRY_INTERVAL
+HUB_OUTBOX_LEASE = 30  # seconds
+HUB_OUTBOX_RETRY_INTERVAL = 10  # seconds
+
+# Newest serialized messages kept per hub in Redis (base.recent) to serve
+# the first /messages/ page without a database query
+HUB_RECENT_MESSAGES = 200
+HUB_RECENT_TTL = 24 * 3600
+
+# Superuser dashboard summaries are dropped on every hub, event and RSVP
+# write; the TTL bounds staleness of the rest (user totals, memberships)
+HUB_DASHBOARD_CACHE_TTL = 30
+
+# Message search ranks at most this many of the newest matches
+HUB_SEARCH_CANDIDATES = 1000
+
+# Worker-local realtime counters are added to Redis this often (seconds)
+HUB_METRICS_FLUSH_INTERVAL = 10
+
+# Per-socket outbound queue: ephemeral frames are dropped past QUEUE_SIZE,
+# backlogs above BATCH_THRESHOLD go out as one "batch" frame, and a socket
+# stuck over the limit for SLOW_TIMEOUT seconds is closed (code 4008)
+HUB_WS_QUEUE_SIZE = 200
+HUB_WS_BATCH_THRESHOLD = 20
+HUB_WS_SLOW_TIMEOUT = 10
+
+# Multiplexed per-user socket (ws/user/): most hubs one socket may subscribe to
+HUB_USER_SOCKET_MAX_HUBS = 50
+
+# Token buckets for frames sent by clients, as (tokens per second, burst).
+# "user" spans all of a user's sockets, "hub" caps one room as a whole.
+HUB_RATE_LIMIT_ENABLED = True
+HUB_RATE_LIMITS = {
+    "message": {"user": (2, 10), "hub": (30, 100)},
+    "typing": {"user": (2, 5), "hub": (30, 60)},
+}
+
+# Shared cache (hub access roles and other cross-worker lookups)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+    }
+}
+
+# Per-user hub role maps are dropped by signals on every change; the TTL
+# only bounds staleness from writes that bypass signals (queryset.update)
+HUB_ACCESS_CACHE_TTL = 300
+
+# Redis channel layer that delivers to sockets on the same worker in memory
+# and only goes through Redis for members on other workers
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "BACKEND": "base.channel_layer.HybridChannelLayer",
         "CONFIG": {
-            "hosts": [("127.0.0.1", 6379)],
+            "hosts": [REDIS_URL],
         },
     }
 }
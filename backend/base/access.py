@@ -0,0 +1,113 @@
+"""
+Hub access roles, cached per user.
+
+A user's relationship with every hub they touch (owner, approved or pending
+member, banned) is loaded with three small queries into one map,
+``{hub_id: role}``, and kept in the shared Django cache. Any role check,
+single or batched over a page of hubs, then costs one cache read. The
+signal handlers in ``base.signals`` drop a user's map whenever one of their
+memberships, bans or owned hubs changes.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import BanHistory, Hub, HubMembership
+
+ADMIN = "admin"
+APPROVED = "approved"
+PENDING = "pending"
+BANNED = "banned"
+NONE = "none"
+
+# Roles that may read and post in a hub
+MEMBER_ROLES = (ADMIN, APPROVED)
+
+
+def cache_key(user_id):
+    return f"hub_access:{user_id}"
+
+
+def load_roles(user_id):
+    """Build the ``{hub_id: role}`` map for a user from the database."""
+    roles = {}
+    for hub_id, is_approved in HubMembership.objects.filter(
+        user_id=user_id
+    ).values_list("hub_id", "is_approved"):
+        roles[hub_id] = APPROVED if is_approved else PENDING
+    for hub_id in BanHistory.objects.filter(
+        user_id=user_id, unbanned_at__isnull=True
+    ).values_list("hub_id", flat=True):
+        roles[hub_id] = BANNED
+    for hub_id in Hub.objects.filter(admin_id=user_id).values_list("id", flat=True):
+        roles[hub_id] = ADMIN
+    return roles
+
+
+def user_roles(user):
+    """Cached ``{hub_id: role}`` map; hubs missing from it are NONE."""
+    if not user or user.is_anonymous:
+        return {}
+    key = cache_key(user.id)
+    roles = cache.get(key)
+    if roles is None:
+        roles = load_roles(user.id)
+        cache.set(key, roles, settings.HUB_ACCESS_CACHE_TTL)
+    return roles
+
+
+def _hub_id(hub):
+    return hub.pk if isinstance(hub, Hub) else int(hub)
+
+
+def get_role(user, hub):
+    return user_roles(user).get(_hub_id(hub), NONE)
+
+
+def get_roles(user, hubs):
+    """Batch variant of get_role(): ``{hub_id: role}`` for every hub given."""
+    roles = user_roles(user)
+    return {hub_id: roles.get(hub_id, NONE) for hub_id in map(_hub_id, hubs)}
+
+
+def is_admin(user, hub):
+    if isinstance(hub, Hub) and user and not user.is_anonymous:
+        # The owner is on the row already, no need to load the admin user
+        return hub.admin_id == user.id
+    return get_role(user, hub) == ADMIN
+
+
+def is_member(user, hub):
+    """Owner or approved member."""
+    return get_role(user, hub) in MEMBER_ROLES
+
+
+def member_hub_ids(user):
+    """
+    Ids of the hubs ``user`` may read (owner or approved member), or None
+    for a superuser, who may read every hub.
+    """
+    if user.is_superuser:
+        return None
+    return [hub_id for hub_id, role in user_roles(user).items() if role in MEMBER_ROLES]
+
+
+def can_read(user, hub):
+    """is_member(), plus superusers everywhere."""
+    return bool(user and user.is_superuser) or is_member(user, hub)
+
+
+def membership_status(role):
+    """Role as exposed by the API's ``membership_status`` field."""
+    if role in MEMBER_ROLES:
+        return "approved"
+    if role == PENDING:
+        return "pending"
+    return None
+
+
+def invalidate(*user_ids):
+    """Forget cached roles once the current transaction commits."""
+    keys = [cache_key(user_id) for user_id in user_ids if user_id]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
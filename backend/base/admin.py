@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import BanHistory, EventAttendance, Hub, HubMembership, Message, Event
+from . import search
 
 
 class HubMembershipInline(admin.TabularInline):
@@ -52,9 +53,17 @@ class HubMembershipAdmin(admin.ModelAdmin):
 class MessageAdmin(admin.ModelAdmin):
     list_display = ("hub", "sender", "short_content", "timestamp", "has_media", "has_audio")
     list_filter = ("timestamp", "hub")
-    search_fields = ("sender__username", "hub__name", "content")
+    search_fields = ("sender__username", "hub__name")
     autocomplete_fields = ("hub", "sender")
 
+    def get_search_results(self, request, queryset, search_term):
+        # Content goes through the full-text index instead of an icontains scan
+        by_content = queryset.filter(id__in=search.matching_ids(search_term)) if search_term else None
+        queryset, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if by_content is not None:
+            queryset |= by_content
+        return queryset, may_have_duplicates
+
     def short_content(self, obj):
         return (obj.content[:50] + "...") if obj.content and len(obj.content) > 50 else obj.content
     short_content.short_description = "Content"
@@ -82,11 +91,6 @@ class HubEventAdmin(admin.ModelAdmin):
     search_fields = ("title", "description", "hub__name")
     readonly_fields = ("created_at",)
 
-    def attendees_count(self, obj):
-        return obj.attendances.count()
-
-    attendees_count.short_description = "Attendees"
-
 @admin.register(EventAttendance)
 class EventAttendanceAdmin(admin.ModelAdmin):
     list_display = (
@@ -0,0 +1,89 @@
+"""
+RSVPs and the denormalized ``Event.attendees_count``.
+
+The counter moves with the attendance row in the same transaction, and
+only when the row actually flips: the flip is a conditional UPDATE
+(``attending=False`` -> True and back), so two concurrent RSVPs of the
+same user change the count once. Counters are adjusted with F()
+expressions, never read-modify-write.
+
+Rows deleted through the ORM (a user or event going away) are taken off
+the count by a signal. Anything else that edits attendance rows directly
+can be reconciled with ``manage.py repair_attendee_counts``.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from . import dashboard
+from .models import Event, EventAttendance
+
+
+def adjust(event_id, delta):
+    Event.objects.filter(pk=event_id).update(
+        attendees_count=Greatest(F("attendees_count") + delta, 0)
+    )
+    dashboard.invalidate()
+
+
+def current_count(event_id):
+    return Event.objects.filter(pk=event_id).values_list("attendees_count", flat=True).first() or 0
+
+
+def attend(event, user):
+    """
+    Mark ``user`` as attending ``event``. Call inside a transaction.
+    Returns (changed, attendees count).
+    """
+    record, created = EventAttendance.objects.get_or_create(
+        event=event, user=user, defaults={"attending": True}
+    )
+    # Losing a creation race lands here too: get_or_create returns the other row
+    changed = created or bool(
+        EventAttendance.objects.filter(pk=record.pk, attending=False).update(attending=True)
+    )
+    if changed:
+        adjust(event.pk, 1)
+    return changed, current_count(event.pk)
+
+
+def unattend(event, user):
+    """
+    Mark ``user`` as not attending ``event``. Call inside a transaction.
+    Returns (changed, attendees count).
+    """
+    changed = bool(
+        EventAttendance.objects.filter(event=event, user=user, attending=True).update(attending=False)
+    )
+    if changed:
+        adjust(event.pk, -1)
+    return changed, current_count(event.pk)
+
+
+def actual_count():
+    """Subquery counting an event's attending rows, for Event querysets."""
+    rows = (
+        EventAttendance.objects.filter(event=OuterRef("pk"), attending=True)
+        .order_by()
+        .values("event")
+        .annotate(n=Count("pk"))
+        .values("n")
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+def stale_events(events=None):
+    """Events whose stored count differs from their attendance rows."""
+    events = Event.objects.all() if events is None else events
+    return events.annotate(actual=actual_count()).exclude(attendees_count=F("actual"))
+
+
+def repair(events=None):
+    """
+    Recount the stale ones among ``events`` (default: all) from their
+    attendance rows. Each is recounted by the UPDATE itself, so RSVPs made
+    meanwhile are not overwritten. Returns the number of events fixed.
+    """
+    stale = list(stale_events(events).values_list("pk", flat=True))
+    if not stale:
+        return 0
+    return Event.objects.filter(pk__in=stale).update(attendees_count=actual_count())
@@ -0,0 +1,60 @@
+"""
+Serialize-once fan-out for hub broadcasts.
+
+A frame is encoded to its final wire text once, when it is handed to the
+channel layer. Every recipient consumer then forwards that text untouched
+(see HubChatConsumer.ws_frame) instead of running json.dumps per socket.
+
+Hub group events also carry the hub id next to the text, so per-user sockets
+subscribed to several hubs (see UserSocketConsumer) can tell them apart.
+
+JSON text is the canonical form. Sockets that negotiated the MessagePack
+subprotocol get the same frame as binary, converted once per worker.
+"""
+from functools import lru_cache
+
+import msgpack
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from . import fastjson
+
+MSGPACK_SUBPROTOCOL = "hub.msgpack"
+HUB_GROUP_PREFIX = "hub_"
+
+
+def encode_frame(data):
+    return fastjson.dumps(data)
+
+
+@lru_cache(maxsize=1024)
+def msgpack_frame(text):
+    """MessagePack form of a JSON frame, shared by all binary sockets."""
+    return msgpack.packb(fastjson.loads(text))
+
+
+def frame_event(data=None, text=None, ephemeral=False, eid=None):
+    """Channel-layer event carrying a pre-encoded WebSocket frame."""
+    event = {
+        "type": "ws.frame",
+        "text": encode_frame(data) if text is None else text,
+    }
+    # Ephemeral frames (typing, presence) are the first to go for slow sockets
+    if ephemeral:
+        event["ephemeral"] = True
+    if eid is not None:
+        event["eid"] = eid
+    return event
+
+
+async def group_send_frame(group, data=None, channel_layer=None, text=None, ephemeral=False, eid=None):
+    channel_layer = channel_layer or get_channel_layer()
+    event = frame_event(data, text, ephemeral, eid)
+    if group.startswith(HUB_GROUP_PREFIX):
+        event["hub"] = int(group[len(HUB_GROUP_PREFIX):])
+    await channel_layer.group_send(group, event)
+
+
+def group_send_frame_sync(group, data=None, text=None, eid=None):
+    """Blocking variant for Django/DRF views."""
+    async_to_sync(group_send_frame)(group, data, text=text, eid=eid)
@@ -0,0 +1,205 @@
+"""
+Redis channel layer with an in-process fast path.
+
+With the stock RedisChannelLayer a group_send to sockets on the same worker
+still goes out to Redis and comes back: one Lua call to push the message,
+then a BRPOP and a deserialize per receiving worker. Most hub members of a
+single-node deployment share one process, so HybridChannelLayer keeps a
+local index of which groups its own channels are in and hands the message
+straight to their receive buffers. Only the members that belong to other
+workers are forwarded through Redis, in one script call per shard.
+
+Group membership is still written to Redis, so remote workers reach this
+worker's channels exactly as before and the two layers interoperate.
+Locally delivered messages are not serialized: every recipient gets its own
+shallow copy of the event dict.
+
+Receiving is reorganised to match: the stock layer lets one waiting
+consumer at a time block on Redis for the whole worker, which would leave
+that consumer deaf to local deliveries. Here a pump task per worker moves
+Redis messages into the receive buffers, and consumers only ever wait on
+their own buffer.
+"""
+import asyncio
+import collections
+import logging
+import time
+
+from channels.exceptions import ChannelFull
+from channels_redis.core import RedisChannelLayer
+
+logger = logging.getLogger(__name__)
+
+# KEYS: channel keys | ARGV: messages, capacities, now, expiry
+# Returns the number of channels that were over capacity.
+GROUP_SEND_LUA = """
+local over_capacity = 0
+local current_time = ARGV[#ARGV - 1]
+local expiry = ARGV[#ARGV]
+for i=1,#KEYS do
+    redis.call('ZREMRANGEBYSCORE', KEYS[i], 0, current_time - expiry)
+    if redis.call('ZCOUNT', KEYS[i], '-inf', '+inf') < tonumber(ARGV[i + #KEYS]) then
+        redis.call('ZADD', KEYS[i], current_time, ARGV[i])
+        redis.call('EXPIRE', KEYS[i], expiry)
+    else
+        over_capacity = over_capacity + 1
+    end
+end
+return over_capacity
+"""
+
+
+class HybridChannelLayer(RedisChannelLayer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # group -> {channel: added at}, for this worker's channels only
+        self.local_groups = collections.defaultdict(dict)
+        # non-local channel name ("specific.<client_prefix>!") -> pump task
+        self.pumps = {}
+
+    def is_local(self, channel):
+        return "!" in channel and self.non_local_name(channel).endswith(self.client_prefix + "!")
+
+    def deliver_local(self, channel, message):
+        """Put a message straight into a local channel's receive buffer."""
+        queue = self.receive_buffer[channel]
+        if queue.qsize() >= self.get_capacity(channel):
+            return False
+        queue.put_nowait(dict(message))
+        return True
+
+    ### Channel layer API ###
+
+    async def send(self, channel, message):
+        if not self.is_local(channel):
+            return await super().send(channel, message)
+        assert isinstance(message, dict), "message is not a dict"
+        assert self.require_valid_channel_name(channel), "Channel name not valid"
+        if not self.deliver_local(channel, message):
+            raise ChannelFull()
+
+    async def receive(self, channel):
+        if not self.is_local(channel):
+            return await super().receive(channel)
+        assert self.require_valid_channel_name(channel)
+
+        self.receive_count += 1
+        self.ensure_pump(self.non_local_name(channel))
+        queue = self.receive_buffer[channel]
+        try:
+            return await queue.get()
+        finally:
+            if queue.empty() and self.receive_buffer.get(channel) is queue:
+                del self.receive_buffer[channel]
+            self.receive_count -= 1
+            # Same as the stock layer, nobody listening means nothing is read
+            # from Redis; with some slack, consumers are back between messages
+            if self.receive_count == 0:
+                asyncio.get_running_loop().call_later(self.brpop_timeout, self.stop_idle_pumps)
+
+    def ensure_pump(self, real_channel):
+        pump = self.pumps.get(real_channel)
+        if pump is None or pump.done():
+            self.pumps[real_channel] = asyncio.ensure_future(self.pump(real_channel))
+
+    def stop_idle_pumps(self):
+        if self.receive_count == 0:
+            self.stop_pumps()
+
+    def stop_pumps(self):
+        for pump in self.pumps.values():
+            pump.cancel()
+        self.pumps.clear()
+
+    async def pump(self, real_channel):
+        """Move messages other workers sent to this worker into the receive buffers."""
+        while True:
+            try:
+                message_channel, message = await self.receive_single(real_channel)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Channel layer receive failed, retrying")
+                await asyncio.sleep(1)
+                continue
+            if isinstance(message_channel, list):
+                for channel in message_channel:
+                    self.receive_buffer[channel].put_nowait(message)
+            else:
+                self.receive_buffer[message_channel].put_nowait(message)
+
+    async def flush(self):
+        self.local_groups.clear()
+        await super().flush()
+
+    async def close_pools(self):
+        self.stop_pumps()
+        await super().close_pools()
+
+    ### Groups extension ###
+
+    async def group_add(self, group, channel):
+        await super().group_add(group, channel)
+        if self.is_local(channel):
+            self.local_groups[group][channel] = time.time()
+
+    async def group_discard(self, group, channel):
+        members = self.local_groups.get(group)
+        if members is not None:
+            members.pop(channel, None)
+            if not members:
+                del self.local_groups[group]
+        await super().group_discard(group, channel)
+
+    async def group_send(self, group, message):
+        assert self.require_valid_group_name(group), "Group name not valid"
+
+        # Local members first: they do not wait for Redis at all
+        over_capacity = 0
+        members = self.local_groups.get(group, {})
+        expired = time.time() - self.group_expiry
+        for channel, added in list(members.items()):
+            if added < expired:
+                del members[channel]
+            elif not self.deliver_local(channel, message):
+                over_capacity += 1
+
+        # Then whoever is left in the Redis group lives on another worker
+        key = self._group_key(group)
+        connection = self.connection(self.consistent_hash(group))
+        pipe = connection.pipeline(transaction=False)
+        pipe.zremrangebyscore(key, min=0, max=int(time.time()) - self.group_expiry)
+        pipe.zrange(key, 0, -1)
+        _, channel_names = await pipe.execute()
+        remote = [
+            name for name in (x.decode("utf8") for x in channel_names)
+            if not self.is_local(name)
+        ]
+        if remote:
+            over_capacity += await self.send_remote(remote, message)
+
+        if over_capacity > 0:
+            logger.info(
+                "%s of %s channels over capacity in group %s",
+                over_capacity,
+                len(members) + len(remote),
+                group,
+            )
+
+    async def send_remote(self, channel_names, message):
+        """Push a group message to other workers' channels, one script call per shard."""
+        (
+            connection_to_channel_keys,
+            channel_keys_to_message,
+            channel_keys_to_capacity,
+        ) = self._map_channel_keys_to_connection(channel_names, message)
+
+        over_capacity = 0
+        for index, channel_keys in connection_to_channel_keys.items():
+            args = [channel_keys_to_message[k] for k in channel_keys]
+            args += [channel_keys_to_capacity[k] for k in channel_keys]
+            args += [time.time(), self.expiry]
+            over_capacity += await self.connection(index).eval(
+                GROUP_SEND_LUA, len(channel_keys), *channel_keys, *args
+            )
+        return over_capacity
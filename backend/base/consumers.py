@@ -1,75 +1,160 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-import json
-from django.core.exceptions import PermissionDenied
-from .models import HubMembership, Message
-from asgiref.sync import sync_to_async
-import redis.asyncio as redis
+import asyncio
+import logging
+import msgpack
+from django.conf import settings
+from .models import Message
+from urllib.parse import parse_qs
+from . import access, fastjson, message_writer, metrics, notifications, outbound, presence, ratelimit, recent, replay, typing_indicators
+from .broadcast import MSGPACK_SUBPROTOCOL, encode_frame, group_send_frame, msgpack_frame
 
+logger = logging.getLogger(__name__)
+
+
+def decode_frame(text_data=None, bytes_data=None):
+    if bytes_data is not None:
+        return msgpack.unpackb(bytes_data)
+    return fastjson.loads(text_data)
+
+
+def with_hub(text, hub_id):
+    """Tag a pre-encoded hub frame with its hub for multiplexed sockets."""
+    return '{"hub":%d,%s' % (hub_id, text[1:])
+
+
+@database_sync_to_async
+def save_message(hub_id, user, content, parent_id=None):
+    if parent_id in ("undefined", "", None):
+        parent_id = None
+
+    return Message.objects.create(
+        hub_id=hub_id,
+        sender=user,
+        content=content,
+        parent_id=parent_id,
+    )
+
+
+class HubSocketMixin:
+    """
+    Hub chat plumbing shared by the per-hub socket (HubChatConsumer) and the
+    multiplexed per-user socket (UserSocketConsumer): the bounded outbound
+    queue, the MessagePack subprotocol, rate limits, posting chat messages,
+    typing and presence announcements.
+    """
 
-# ONLINE_USERS = {}
-REDIS_URL = "redis://localhost:6379"
-class HubChatConsumer(AsyncWebsocketConsumer):
     def user_payload(self):
         return {
             "id": self.user.id,
             "username": self.user.username,
         }
 
-    # async def connect(self):
-    #     self.hub_id = self.scope["url_route"]["kwargs"]["hub_id"]
-    #     self.user = self.scope["user"]
-
-    #     if not self.user or self.user.is_anonymous or not self.user.username:
-    #         await self.close()
-    #         return
-
-    #     is_member = await self.is_approved_member()
-    #     if not is_member:
-    #         await self.close()
-    #         return
-
-    #     self.room_group_name = f"hub_{self.hub_id}"
-    #     await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-    #     await self.accept()
-
-    #     # Add to global online users set
-    #     ONLINE_USERS.setdefault(self.hub_id, set()).add(self.user.username)
-
-    #     # Send current online users to this client
-    #     await self.send(text_data=json.dumps({
-    #         "type": "online_users",
-    #         "users": [{"username": u} for u in ONLINE_USERS[self.hub_id]]
-    #     }))
-
-    #     # Broadcast online presence to others
-    #     await self.channel_layer.group_send(
-    #         self.room_group_name,
-    #         {
-    #             "type": "presence_event",
-    #             "action": "online",
-    #             "user": self.user_payload(),
-    #         }
-    #     )
-
-    # async def disconnect(self, close_code):
-    #     if hasattr(self, "room_group_name"):
-    #         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
-
-    #         # Remove from global set
-    #         if self.hub_id in ONLINE_USERS:
-    #             ONLINE_USERS[self.hub_id].discard(self.user.username)
-            
-    #         # Broadcast offline
-    #         await self.channel_layer.group_send(
-    #             self.room_group_name,
-    #             {
-    #                 "type": "presence_event",
-    #                 "action": "offline",
-    #                 "user": self.user_payload(),
-    #             }
-    #         )
+    def setup_outbound(self):
+        # Everything sent to the client goes through the bounded queue
+        self.outbound = outbound.OutboundQueue(self.send_now, self.close)
+        # Clients on slow links can ask for MessagePack binary frames
+        self.binary = MSGPACK_SUBPROTOCOL in self.scope.get("subprotocols", [])
+
+    async def accept_socket(self):
+        await self.accept(subprotocol=MSGPACK_SUBPROTOCOL if self.binary else None)
+        self.outbound.start()
+
+    async def send_now(self, text):
+        if self.binary:
+            await AsyncWebsocketConsumer.send(self, bytes_data=msgpack_frame(text))
+        else:
+            await AsyncWebsocketConsumer.send(self, text_data=text)
+
+    def enqueue(self, text, ephemeral=False, eid=None):
+        self.outbound.put(text, ephemeral, eid)
+
+    async def throttled(self, kind, hub_id, **extra):
+        """Check the rate limits for ``kind``; tell the client when it is over."""
+        limited = await ratelimit.hit(kind, self.user.id, hub_id)
+        if limited is None:
+            return False
+        scope, retry_after = limited
+        self.enqueue(encode_frame({
+            "type": "throttled",
+            **extra,
+            "kind": kind,
+            "scope": scope,
+            "retry_after": retry_after,
+        }), ephemeral=kind == "typing")
+        return True
+
+    async def announce_presence(self, hub_id, action):
+        await group_send_frame(
+            f"hub_{hub_id}",
+            {
+                "type": "presence",
+                "action": action,
+                "user": self.user_payload(),
+            },
+            self.channel_layer,
+            ephemeral=True,
+        )
+
+    async def update_typing(self, hub_id, debouncer, is_typing, **extra):
+        # ✍️ typing indicator (ephemeral, coalesced into hub snapshots)
+        metrics.incr("typing", "frames_received")
+        if not debouncer.accept(is_typing):
+            metrics.incr("typing", "frames_debounced")
+            return
+        if await self.throttled("typing", hub_id, **extra):
+            return
+        await typing_indicators.update(
+            hub_id, self.user.username, is_typing, self.channel_layer
+        )
+
+    async def post_message(self, hub_id, data, **extra):
+        try:
+            content = data.get("content")
+            parent_id = data.get("parent")
+
+            if not content:
+                return
+
+            if await self.throttled("message", hub_id, **extra):
+                return
+
+            if parent_id in ("undefined", ""):
+                parent_id = None
+
+            if settings.HUB_CHAT_WRITE_BEHIND:
+                # Buffered and bulk inserted; returns once the batch is committed
+                msg = await message_writer.get_writer().submit(
+                    hub_id, self.user, content, parent_id
+                )
+            else:
+                msg = await save_message(hub_id, self.user, content, parent_id)
 
+            await replay.publish(
+                hub_id,
+                {
+                    "type": "chat_message",
+                    "message": {
+                        "id": msg.id,
+                        "sender": msg.sender.username,
+                        "content": msg.content,
+                        "parent_id": msg.parent_id,
+                        "seq": msg.seq,
+                        "timestamp": msg.timestamp.isoformat(),
+                    },
+                },
+                self.channel_layer,
+            )
+
+            # Keep the hub's recent messages buffer (REST first page) current
+            msg.thread_replies = []
+            entries = await database_sync_to_async(recent.entries_for)(msg)
+            await recent.apply(hub_id, entries)
+        except Exception:
+            logger.exception("Posting a message to hub %s failed", hub_id)
+
+
+class HubChatConsumer(HubSocketMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.hub_id = self.scope["url_route"]["kwargs"]["hub_id"]
         self.user = self.scope["user"]
@@ -84,157 +169,250 @@ class HubChatConsumer(AsyncWebsocketConsumer):
             return
 
         self.room_group_name = f"hub_{self.hub_id}"
+        self.typing = typing_indicators.TypingDebouncer()
+        self.setup_outbound()
+        self.outbound.last_eid = self.since_eid()
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.accept()
+        await self.accept_socket()
 
-        # Connect to Redis
-        self.redis = await redis.from_url(REDIS_URL, decode_responses=True)
-        self.redis_key = f"hub:{self.hub_id}:online_users"
+        # Heartbeat-based presence: one entry per connection, refcounted per user
+        went_online = await presence.join(self.hub_id, self.user, self.channel_name)
+        presence.ensure_sweeper(self.channel_layer)
+        self.heartbeat_task = asyncio.create_task(self.heartbeat())
 
-        # Add user to Redis set
-        await self.redis.sadd(self.redis_key, self.user.username)
-
-        # Fetch current online users and send to this client
-        online_users = await self.redis.smembers(self.redis_key)
-        await self.send(text_data=json.dumps({
+        # Send current online users to this client
+        self.enqueue(encode_frame({
             "type": "online_users",
-            "users": [{"username": u} for u in online_users]
+            "users": await presence.online_users(self.hub_id),
         }))
 
-        # Broadcast online presence to the group
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "presence_event",
-                "action": "online",
-                "user": self.user_payload(),
-            }
-        )
+        # Resume: replay what was missed since ?since=<eid>, or just tell a
+        # fresh client where the hub's event stream currently is
+        since = self.since_eid()
+        if since is not None:
+            self.enqueue(await replay.replay_frame(self.hub_id, since))
+        else:
+            last_eid = await replay.last_eid(self.hub_id)
+            self.enqueue(encode_frame({"type": "session", "last_eid": last_eid}), eid=last_eid)
+
+        # Broadcast only a real offline -> online transition
+        if went_online:
+            await self.announce_presence(self.hub_id, "online")
 
     async def disconnect(self, close_code):
         # Only remove from group if room_group_name exists
         if hasattr(self, "room_group_name"):
             await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
-            # Remove user from Redis set
-            if hasattr(self, "redis") and hasattr(self, "redis_key"):
-                await self.redis.srem(self.redis_key, self.user.username)
+            if hasattr(self, "heartbeat_task"):
+                self.heartbeat_task.cancel()
 
-            # Broadcast offline
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "presence_event",
-                    "action": "offline",
-                    "user": self.user_payload(),
-                }
-            )
+            self.outbound.stop()
+            await outbound.forget(self.channel_name)
 
+            if self.typing.is_typing:
+                await typing_indicators.update(
+                    self.hub_id, self.user.username, False, self.channel_layer
+                )
 
-    async def presence_event(self, event):
-        await self.send(text_data=json.dumps({
-            "type": "presence",
-            "action": event["action"],
-            "user": event["user"],
-        }))
+            went_offline = await presence.leave(self.hub_id, self.user, self.channel_name)
+
+            # Other tabs of the same user keep them online
+            if went_offline:
+                await self.announce_presence(self.hub_id, "offline")
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    def since_eid(self):
+        params = parse_qs(self.scope.get("query_string", b"").decode())
+        try:
+            return int(params["since"][0])
+        except (KeyError, ValueError):
+            return None
+
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(settings.HUB_PRESENCE_HEARTBEAT_INTERVAL)
+            try:
+                # A sweep expired us (e.g. a stalled loop): back online
+                if await presence.heartbeat(self.hub_id, self.user, self.channel_name):
+                    await self.announce_presence(self.hub_id, "online")
+                await outbound.report(
+                    self.channel_name, self.hub_id, self.user.id, self.outbound.stats
+                )
+            except Exception:
+                logger.exception("Presence heartbeat failed for hub %s", self.hub_id)
+
+    async def ws_frame(self, event):
+        # Pre-encoded once by the sender (base.broadcast), forwarded as is
+        self.enqueue(event["text"], event.get("ephemeral", False), event.get("eid"))
+
+    async def receive(self, text_data=None, bytes_data=None):
+        data = decode_frame(text_data, bytes_data)
 
-        # ✍️ typing indicator (ephemeral)
         if data.get("type") == "typing":
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "typing_indicator",
-                    "user": self.user.username,
-                    "is_typing": data.get("is_typing", False),
-                }
+            await self.update_typing(
+                self.hub_id, self.typing, bool(data.get("is_typing", False))
             )
             return
 
-        try:
-            data = json.loads(text_data)
-            content = data.get("content")
-            parent_id = data.get("parent")
+        await self.post_message(self.hub_id, data)
 
-            if not content:
-                return
+    @database_sync_to_async
+    def is_approved_member(self):
+        return access.is_member(self.user, self.hub_id)
 
-            msg = await self.save_message(content, parent_id)
 
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "chat_message",
-                    "message": {
-                        "id": msg.id,
-                        "sender": msg.sender.username,
-                        "content": msg.content,
-                        "parent_id": msg.parent_id,
-                        "timestamp": msg.timestamp.isoformat(),
-                    },
-                }
+class UserSocketConsumer(HubSocketMixin, AsyncWebsocketConsumer):
+    """
+    One socket per user for all their hubs (ws/user/).
+
+    The client subscribes to hubs with control frames::
+
+        {"type": "subscribe", "hub": 3, "since": 120}
+        {"type": "unsubscribe", "hub": 3}
+
+    and then sends the usual chat/typing frames with a ``hub`` key. Every
+    hub frame it receives is tagged with ``hub``; frames without one are
+    user notifications (see base.notifications). Authentication, the
+    outbound queue and the heartbeat are shared by all subscriptions.
+    """
+
+    async def connect(self):
+        self.user = self.scope["user"]
+
+        if not self.user or self.user.is_anonymous or not self.user.username:
+            await self.close()
+            return
+
+        self.hubs = {}  # hub_id -> TypingDebouncer
+        self.user_group = notifications.user_group(self.user.id)
+        self.setup_outbound()
+        await self.channel_layer.group_add(self.user_group, self.channel_name)
+        await self.accept_socket()
+
+        presence.ensure_sweeper(self.channel_layer)
+        self.heartbeat_task = asyncio.create_task(self.heartbeat())
+
+    async def disconnect(self, close_code):
+        if not hasattr(self, "user_group"):
+            return
+
+        await self.channel_layer.group_discard(self.user_group, self.channel_name)
+        self.heartbeat_task.cancel()
+        self.outbound.stop()
+        await outbound.forget(self.channel_name)
+
+        for hub_id in list(self.hubs):
+            await self.leave_hub(hub_id)
+
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(settings.HUB_PRESENCE_HEARTBEAT_INTERVAL)
+            try:
+                for hub_id in list(self.hubs):
+                    if await presence.heartbeat(hub_id, self.user, self.channel_name):
+                        await self.announce_presence(hub_id, "online")
+                await outbound.report(
+                    self.channel_name, None, self.user.id, self.outbound.stats
+                )
+            except Exception:
+                logger.exception("Presence heartbeat failed for user %s", self.user.id)
+
+    def error(self, detail, hub_id=None):
+        frame = {"type": "error", "detail": detail}
+        if hub_id is not None:
+            frame["hub"] = hub_id
+        self.enqueue(encode_frame(frame))
+
+    async def receive(self, text_data=None, bytes_data=None):
+        data = decode_frame(text_data, bytes_data)
+        kind = data.get("type")
+
+        try:
+            hub_id = int(data.get("hub"))
+        except (TypeError, ValueError):
+            self.error("hub is required")
+            return
+
+        if kind == "subscribe":
+            await self.subscribe(hub_id, data.get("since"))
+        elif kind == "unsubscribe":
+            if hub_id in self.hubs:
+                await self.leave_hub(hub_id)
+            self.enqueue(encode_frame({"type": "unsubscribed", "hub": hub_id}))
+        elif hub_id not in self.hubs:
+            self.error("not subscribed", hub_id)
+        elif kind == "typing":
+            await self.update_typing(
+                hub_id, self.hubs[hub_id], bool(data.get("is_typing", False)), hub=hub_id
             )
-        except Exception as e:
-            print("🔥 WS ERROR:", e)
-
-    async def typing_indicator(self, event):
-        await self.send(text_data=json.dumps({
-            "type": "typing",
-            "user": event["user"],
-            "is_typing": event["is_typing"],
-        }))
+        else:
+            await self.post_message(hub_id, data, hub=hub_id)
 
-    async def chat_message(self, event):
-        await self.send(text_data=json.dumps({
-            "type": "chat_message",
-            "message": event["message"]
-        }))
+    async def subscribe(self, hub_id, since=None):
+        try:
+            since = None if since is None else int(since)
+        except (TypeError, ValueError):
+            since = None
 
-    async def event_update(self, event):
-        await self.send(text_data=json.dumps({
-            "type": "event_update",
-            "event": event["event"]
-        }))
+        if hub_id not in self.hubs:
+            if len(self.hubs) >= settings.HUB_USER_SOCKET_MAX_HUBS:
+                self.error("too many subscriptions", hub_id)
+                return
+            if not await self.is_approved_member(hub_id):
+                self.error("not a member", hub_id)
+                return
 
-    async def event_notification(self, event):
-        await self.send(text_data=json.dumps({
-            "type": "event_notification",
-            "event": event["event"]
+            self.hubs[hub_id] = typing_indicators.TypingDebouncer()
+            await self.channel_layer.group_add(f"hub_{hub_id}", self.channel_name)
+            went_online = await presence.join(hub_id, self.user, self.channel_name)
+        else:
+            # Re-subscribing only resends the snapshot (e.g. to resume)
+            went_online = False
+
+        self.enqueue(encode_frame({
+            "type": "subscribed",
+            "hub": hub_id,
+            "online_users": await presence.online_users(hub_id),
         }))
 
-    async def message_edit(self, event):
-        await self.send(text_data=json.dumps({
-            "type": "message_edit",
-            "message": event["message"]
-        }))
+        if since is not None:
+            self.enqueue(with_hub(await replay.replay_frame(hub_id, since), hub_id))
+        else:
+            last_eid = await replay.last_eid(hub_id)
+            self.enqueue(encode_frame({"type": "session", "hub": hub_id, "last_eid": last_eid}))
 
-    async def message_delete(self, event):
-        await self.send(text_data=json.dumps({
-            "type": "message_delete",
-            "message_id": event["message_id"]
-        }))
+        if went_online:
+            await self.announce_presence(hub_id, "online")
 
-    @database_sync_to_async
-    def is_approved_member(self):
-        from .models import Hub  # import inside method if circular
-        hub = Hub.objects.get(id=self.hub_id)
-        return self.user == hub.admin or HubMembership.objects.filter(
-            hub_id=self.hub_id,
-            user=self.user,
-            is_approved=True
-        ).exists()
+    async def leave_hub(self, hub_id):
+        debouncer = self.hubs.pop(hub_id)
+        await self.channel_layer.group_discard(f"hub_{hub_id}", self.channel_name)
 
-    @database_sync_to_async
-    def save_message(self, content, parent_id=None):
-        if parent_id in ("undefined", "", None):
-            parent_id = None
-
-        return Message.objects.create(
-            hub_id=self.hub_id,
-            sender=self.user,
-            content=content,
-            parent_id=parent_id,
-        )
+        if debouncer.is_typing:
+            await typing_indicators.update(
+                hub_id, self.user.username, False, self.channel_layer
+            )
+
+        if await presence.leave(hub_id, self.user, self.channel_name):
+            await self.announce_presence(hub_id, "offline")
+
+    async def ws_frame(self, event):
+        hub_id = event.get("hub")
+        if hub_id is None:
+            # User notification
+            self.enqueue(event["text"], event.get("ephemeral", False))
+            revoked = event.get("revoke_hub")
+            if revoked is not None and revoked in self.hubs:
+                await self.leave_hub(revoked)
+                self.enqueue(encode_frame({"type": "unsubscribed", "hub": revoked, "reason": "revoked"}))
+            return
 
+        # Frames already in flight when the hub was unsubscribed
+        if hub_id not in self.hubs:
+            return
+        # Resume ids are per hub: clients resubscribe with their own "since"
+        self.enqueue(with_hub(event["text"], hub_id), event.get("ephemeral", False))
+
+    @database_sync_to_async
+    def is_approved_member(self, hub_id):
+        return access.is_member(self.user, hub_id)
@@ -0,0 +1,88 @@
+"""
+Superuser dashboard summary.
+
+One payload with every hub, the next events of each, and the totals shown
+on the dashboard, built from a fixed number of queries (see
+base.event_listing) instead of one request per hub.
+
+The payload is cached for HUB_DASHBOARD_CACHE_TTL seconds per user (it
+carries the caller's RSVPs and memberships). All cached payloads share a
+version stamp, and any hub, event, attendance or membership write, or a
+user joining or leaving, replaces the stamp once its transaction commits,
+which orphans every cached copy at once. Messages are not part of the
+payload, so chat traffic leaves the cache alone.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import event_listing
+from .models import Event, Hub
+from .serializers import EventSerializer, HubSerializer
+
+VERSION_KEY = "dashboard_summary:version"
+
+# Events listed per hub, as on a hub's upcoming_events
+EVENTS_PER_HUB = 5
+
+
+def cache_key(user_id, version):
+    return f"dashboard_summary:{version}:{user_id}"
+
+
+def build(user, request):
+    now = timezone.now()
+    context = {"request": request}
+    hubs = Hub.objects.select_related("admin").annotate(
+        members_count=Count("hubmembership", filter=Q(hubmembership__is_approved=True))
+    ).order_by("id")
+
+    upcoming = Event.objects.filter(start_time__gte=now)
+    by_hub = event_listing.top_per_hub(event_listing.annotate(upcoming, user), EVENTS_PER_HUB)
+    event_listing.attach_attendees([event for _, events in by_hub for event in events])
+
+    hub_data = HubSerializer(hubs, many=True, context=context).data
+    return {
+        "hubs": hub_data,
+        "events": [
+            {
+                "hub_id": hub.id,
+                "hub_name": hub.name,
+                "events": EventSerializer(events, many=True, context=context).data,
+            }
+            for hub, events in by_hub
+        ],
+        "totals": {
+            "hubs": len(hub_data),
+            "upcoming_events": upcoming.count(),
+            "users": User.objects.count(),
+        },
+        "generated_at": now,
+    }
+
+
+def summary(user, request):
+    """The dashboard payload for ``user``, from the cache when fresh."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        # Another worker may have set one first; use whichever won
+        if not cache.add(VERSION_KEY, version, None):
+            version = cache.get(VERSION_KEY, version)
+
+    key = cache_key(user.id, version)
+    data = cache.get(key)
+    if data is None:
+        data = build(user, request)
+        cache.set(key, data, settings.HUB_DASHBOARD_CACHE_TTL)
+    return data
+
+
+def invalidate():
+    """Drop every cached summary once the current transaction commits."""
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, time.time_ns(), None))
@@ -0,0 +1,83 @@
+"""
+Calendar date ranges for event queries.
+
+Dates picked in a calendar are days in the user's timezone. Filtering with
+``start_time__date`` wraps the column in a function (and converts it to the
+server's timezone), so no index on start_time can be used. Instead each
+day becomes a half-open range of instants, [local midnight, next local
+midnight), compared against the bare column: the ``(hub, start_time)``
+and ``start_time`` indexes on Event serve it as a range scan.
+
+Month and week views return events grouped per local day, in a compact
+form (no attendees, images or per-user fields).
+"""
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.conf import settings
+from django.utils import timezone
+
+VIEWS = ("month", "week")
+
+# Fields of an event in a calendar bucket
+BUCKET_FIELDS = ("id", "hub_id", "title", "location", "start_time", "end_time", "attendees_count")
+
+
+def get_timezone(name):
+    """ZoneInfo for an IANA name (default: TIME_ZONE). ValueError if unknown."""
+    try:
+        return ZoneInfo(name or settings.TIME_ZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone: {name}")
+
+
+def day_start(day, tz):
+    """The instant ``day`` begins in ``tz``."""
+    return datetime.combine(day, time.min, tzinfo=tz)
+
+
+def day_range(first, last, tz):
+    """[start, end) instants covering the local days ``first`` to ``last`` inclusive."""
+    start = day_start(first, tz) if first else None
+    end = day_start(last + timedelta(days=1), tz) if last else None
+    return start, end
+
+
+def view_days(view, anchor):
+    """First day and the day after the last of the month or (Monday) week holding ``anchor``."""
+    if view == "month":
+        first = anchor.replace(day=1)
+        after = (first + timedelta(days=32)).replace(day=1)
+    elif view == "week":
+        first = anchor - timedelta(days=anchor.weekday())
+        after = first + timedelta(days=7)
+    else:
+        raise ValueError(f"view must be one of {', '.join(VIEWS)}")
+    return first, after
+
+
+def today(tz):
+    return timezone.now().astimezone(tz).date()
+
+
+def day_buckets(events, tz):
+    """
+    ``events`` (a queryset) grouped by local day of start_time, as
+    ``[{"date", "count", "events": [...]}]`` for the days that have any.
+    """
+    buckets = {}
+    for event in events.order_by("start_time", "id").values(*BUCKET_FIELDS):
+        day = event["start_time"].astimezone(tz).date()
+        buckets.setdefault(day, []).append(event)
+    return [
+        {"date": day, "count": len(day_events), "events": day_events}
+        for day, day_events in buckets.items()
+    ]
+
+
+def parse_day(value):
+    """A YYYY-MM-DD query parameter as a date. ValueError if malformed."""
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid date: {value!r}, expected YYYY-MM-DD")
@@ -0,0 +1,95 @@
+"""
+Event listings without per-row queries.
+
+EventSerializer needs, for every event, whether the caller attends, the
+first attendees and the caller's membership of the hub (the attendee count
+is a column, see base.attendance). ``annotate()`` adds the first as an
+EXISTS subquery, so joins added by filters cannot duplicate rows, and
+``attach_attendees()`` loads the first attendees of a whole page in one
+window query. Membership comes from the caller's cached role map
+(base.access), which HubRoleMixin reads once per serialization.
+
+A page of events therefore costs the same few queries whatever its size.
+"""
+from collections import defaultdict
+
+from django.db.models import Exists, F, OuterRef, Q, Value
+from django.db.models.expressions import Window
+from django.db.models.functions import RowNumber
+
+from . import access
+from .models import EventAttendance
+
+# Attendees shown on an event card
+TOP_ATTENDEES = 5
+
+# Upper bound for my_events' limit_per_hub
+MAX_EVENTS_PER_HUB = 50
+
+
+def annotate(queryset, user):
+    """``queryset`` with everything EventSerializer reads joined or annotated."""
+    attending = EventAttendance.objects.filter(event=OuterRef("pk"), attending=True)
+    if user and not user.is_anonymous:
+        user_attending = Exists(attending.filter(user=user))
+    else:
+        user_attending = Value(False)
+    return queryset.select_related("hub", "created_by").annotate(user_attending=user_attending)
+
+
+def attach_attendees(events, limit=TOP_ATTENDEES):
+    """
+    Load the first ``limit`` attendees of every event in ``events`` with one
+    ROW_NUMBER() query and hang them off each instance as ``top_attendees``.
+    """
+    events = list(events)
+    if not events:
+        return events
+
+    ranked = (
+        EventAttendance.objects.filter(event_id__in=[e.id for e in events], attending=True)
+        .annotate(
+            position=Window(RowNumber(), partition_by=[F("event_id")], order_by=F("id").asc())
+        )
+        .filter(position__lte=limit)
+        .select_related("user")
+        .order_by("event_id", "position")
+    )
+    by_event = defaultdict(list)
+    for attendance in ranked:
+        by_event[attendance.event_id].append(attendance.user)
+
+    for event in events:
+        event.top_attendees = by_event.get(event.id, [])
+    return events
+
+
+def top_per_hub(events, per_hub):
+    """
+    The first ``per_hub`` events of every hub in ``events`` by start time,
+    in one ROW_NUMBER() query, as a list of (hub, [events]) ordered by hub.
+    """
+    ranked = (
+        events.annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=[F("hub_id")],
+                order_by=[F("start_time").asc(), F("id").asc()],
+            )
+        )
+        .filter(position__lte=per_hub)
+        .select_related("hub")
+        .order_by("hub_id", "position")
+    )
+    by_hub = []
+    for event in ranked:
+        if not by_hub or by_hub[-1][0].id != event.hub_id:
+            by_hub.append((event.hub, []))
+        by_hub[-1][1].append(event)
+    return by_hub
+
+
+def member_hub_filter(user):
+    """Q limiting events to the hubs the user may read (superusers: no limit)."""
+    hub_ids = access.member_hub_ids(user)
+    return Q() if hub_ids is None else Q(hub_id__in=hub_ids)
@@ -0,0 +1,122 @@
+"""
+Fast JSON encoding for the REST API and hub sockets.
+
+Uses orjson when it is installed and falls back to the standard library
+otherwise; the output is the same either way. Types orjson does not handle
+natively (Decimal, lazy translation strings, querysets, ...) go through
+DRF's own JSONEncoder.default, and datetimes use DRF's format, so values
+render exactly as they did with DRF's JSONRenderer. What orjson would get
+wrong (integers beyond 64 bits, NaN and infinities) is left to the standard
+library with DRF's settings.
+"""
+import codecs
+import json
+import math
+from decimal import Decimal
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.json import strict_constant
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speed-up
+    orjson = None
+
+_encoder = JSONEncoder()
+
+
+def _stdlib_dumps(data):
+    # As JSONRenderer does: NaN and infinities are an error under STRICT_JSON
+    return json.dumps(
+        data,
+        cls=JSONEncoder,
+        ensure_ascii=False,
+        allow_nan=not api_settings.STRICT_JSON,
+        separators=(",", ":"),
+    )
+
+
+def _has_non_finite(data):
+    # Walks containers only, as cheaply as it gets: it runs on most payloads
+    stack = [[data]]
+    while stack:
+        container = stack.pop()
+        for value in container.values() if isinstance(container, dict) else container:
+            kind = type(value)
+            # Decimals become floats too, in DRF's JSONEncoder.default
+            if kind is float or kind is Decimal:
+                if not math.isfinite(value):
+                    return True
+            elif (
+                kind is not str and kind is not int and value is not None
+                and isinstance(value, (dict, list, tuple))
+            ):
+                stack.append(value)
+    return False
+
+
+if orjson is not None:
+    # Datetimes natively, with DRF's "Z" for UTC
+    OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+
+    def dumps_bytes(data):
+        try:
+            ret = orjson.dumps(data, default=_encoder.default, option=OPTIONS)
+        except TypeError:
+            # Integers beyond 64 bits (or a type nobody can encode, which
+            # then raises the same way DRF would)
+            return _stdlib_dumps(data).encode()
+        # orjson writes NaN and infinities as null where DRF refuses them;
+        # only output with a null can hide one
+        if b"null" in ret and _has_non_finite(data):
+            return _stdlib_dumps(data).encode()
+        return ret
+
+    def dumps(data):
+        return dumps_bytes(data).decode()
+
+    loads = orjson.loads
+else:
+    dumps = _stdlib_dumps
+
+    def dumps_bytes(data):
+        return dumps(data).encode()
+
+    def loads(data):
+        return json.loads(data, parse_constant=strict_constant)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer producing compact output through ``dumps_bytes``."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        # Pretty printing (browsable API, ?indent=) is rare: leave it to DRF
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = dumps_bytes(data)
+        # Same as DRF: keep the output a strict JavaScript subset
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", "utf-8")
+        try:
+            body = stream.read()
+            if codecs.lookup(encoding).name != "utf-8":
+                body = body.decode(encoding)
+            return loads(body)
+        except ValueError as exc:
+            raise ParseError("JSON parse error - %s" % str(exc))
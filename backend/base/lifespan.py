@@ -0,0 +1,55 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+_startup_hooks = []
+_shutdown_hooks = []
+
+
+def on_startup(func):
+    """Register an async callable to run when the ASGI server starts."""
+    _startup_hooks.append(func)
+    return func
+
+
+def on_shutdown(func):
+    """Register an async callable to run when the ASGI server stops."""
+    _shutdown_hooks.append(func)
+    return func
+
+
+async def run_startup():
+    for hook in _startup_hooks:
+        await hook()
+
+
+async def run_shutdown():
+    # Shut down in reverse order so later hooks can rely on earlier ones
+    for hook in reversed(_shutdown_hooks):
+        try:
+            await hook()
+        except Exception:
+            logger.exception("Shutdown hook %r failed", hook)
+
+
+async def lifespan_app(scope, receive, send):
+    """
+    ASGI ``lifespan`` protocol handler.
+
+    Mounted under ProtocolTypeRouter so per-process resources (Redis pool,
+    background sweepers) are started and closed together with the worker.
+    """
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await run_startup()
+            except Exception as e:
+                logger.exception("Startup failed")
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await run_shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
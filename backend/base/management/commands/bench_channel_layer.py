@@ -0,0 +1,86 @@
+import asyncio
+import statistics
+import time
+import uuid
+
+from channels_redis.core import RedisChannelLayer
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from base.broadcast import frame_event
+from base.channel_layer import HybridChannelLayer
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark hub fan-out latency through the channel layer: one "
+        "group_send to a hub whose sockets all live on this worker (plus "
+        "--remote sockets on a second simulated worker), with "
+        "RedisChannelLayer and HybridChannelLayer. Needs the Redis at "
+        "CHANNEL_LAYERS; uses a throwaway group."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+        parser.add_argument("--remote", type=int, default=0, help="Members on a second worker")
+        parser.add_argument("--messages", type=int, default=50)
+
+    def handle(self, *args, **options):
+        config = settings.CHANNEL_LAYERS["default"].get("CONFIG", {})
+        self.stdout.write(
+            f"{'layer':<8} {'members':>8} {'first p50':>10} {'all p50':>10} {'all p99':>10}"
+        )
+        for size in options["sizes"]:
+            for name, cls in (("redis", RedisChannelLayer), ("hybrid", HybridChannelLayer)):
+                # Each run gets fresh layers: pools are bound to asyncio.run's loop
+                local, remote = cls(**config), cls(**config)
+                first, done = asyncio.run(
+                    self.run(local, remote, size, options["remote"], options["messages"])
+                )
+                self.stdout.write(
+                    f"{name:<8} {size:>8} {statistics.median(first) * 1e3:>7.2f} ms"
+                    f" {statistics.median(done) * 1e3:>7.2f} ms {self.pct(done, 0.99) * 1e3:>7.2f} ms"
+                )
+        self.stdout.write("(first: until the first socket has the frame, all: until every socket has it)")
+
+    async def run(self, local, remote, size, remote_size, messages):
+        group = f"bench_{uuid.uuid4().hex[:8]}"
+        members = [(local, await local.new_channel()) for _ in range(size)]
+        members += [(remote, await remote.new_channel()) for _ in range(remote_size)]
+        for layer, channel in members:
+            await layer.group_add(group, channel)
+
+        arrivals = []
+        all_in = asyncio.Event()
+
+        async def socket(layer, channel):
+            while True:
+                await layer.receive(channel)
+                arrivals.append(time.perf_counter())
+                if len(arrivals) == len(members):
+                    all_in.set()
+
+        readers = [asyncio.create_task(socket(layer, channel)) for layer, channel in members]
+        first, done = [], []
+        try:
+            for n in range(messages):
+                arrivals.clear()
+                all_in.clear()
+                started = time.perf_counter()
+                await local.group_send(group, frame_event({"type": "chat_message", "message": {"id": n}}))
+                await asyncio.wait_for(all_in.wait(), 30)
+                first.append(min(arrivals) - started)
+                done.append(max(arrivals) - started)
+        finally:
+            for task in readers:
+                task.cancel()
+            await asyncio.gather(*readers, return_exceptions=True)
+            for layer, channel in members:
+                await layer.group_discard(group, channel)
+            await local.close_pools()
+            await remote.close_pools()
+        return first, done
+
+    def pct(self, values, p):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * p))]
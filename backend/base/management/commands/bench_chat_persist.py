@@ -0,0 +1,56 @@
+import asyncio
+import time
+
+from channels.db import database_sync_to_async
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils.crypto import get_random_string
+
+from base.message_writer import MessageWriter
+from base.models import Hub, Message
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark WebSocket chat persistence: one INSERT per message through "
+        "database_sync_to_async versus write-behind micro-batches. Creates a "
+        "throwaway hub and user in the configured database and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=2000)
+        parser.add_argument("--senders", type=int, default=50, help="Concurrent sockets sending")
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(f"bench_{get_random_string(8)}")
+        hub = Hub.objects.create(name="bench hub", admin=user)
+        try:
+            for mode in ("per-message", "write-behind"):
+                elapsed = asyncio.run(self.run(mode, hub, user, options["messages"], options["senders"]))
+                self.stdout.write(
+                    f"{mode:>12}: {options['messages']} messages in {elapsed:.2f}s "
+                    f"({options['messages'] / elapsed:.0f} msg/s)"
+                )
+        finally:
+            hub.delete()
+            user.delete()
+
+    async def run(self, mode, hub, user, messages, senders):
+        writer = MessageWriter()
+
+        @database_sync_to_async
+        def save_message(content):
+            # Same call HubChatConsumer.save_message makes
+            return Message.objects.create(hub_id=hub.id, sender=user, content=content)
+
+        async def sender(n):
+            for i in range(n, messages, senders):
+                if mode == "per-message":
+                    await save_message(f"message {i}")
+                else:
+                    await writer.submit(hub.id, user, f"message {i}")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(sender(n) for n in range(senders)))
+        await writer.close()
+        return time.perf_counter() - started
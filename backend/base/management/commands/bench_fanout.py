@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+
+from base import outbound
+from base.broadcast import encode_frame, frame_event
+from base.consumers import HubChatConsumer
+
+
+def sample_message(n):
+    return {
+        "id": n,
+        "sender": {"id": 7, "username": "jane.doe", "avatar_url": "http://127.0.0.1:8000/media/avatars/jane.png"},
+        "content": "Are we still on for the volunteering session on Saturday? " * 3,
+        "media": None,
+        "media_url": None,
+        "parent_id": None,
+        "replies": [],
+        "timestamp": "2026-01-15T10:42:31.123456Z",
+        "is_deleted": False,
+        "is_edited": False,
+        "edited_at": None,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark the CPU cost of delivering one chat message to every "
+        "socket in a hub: json.dumps per recipient versus a pre-encoded frame."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+        parser.add_argument("--messages", type=int, default=20)
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options["sizes"], options["messages"]))
+
+    async def run(self, sizes, messages):
+        self.stdout.write(f"{'hub size':>9} {'per-recipient':>15} {'serialize-once':>15} {'speedup':>8}")
+        for size in sizes:
+            consumers = [self.make_consumer() for _ in range(size)]
+            legacy = await self.time_fanout(consumers, messages, self.legacy_delivery)
+            once = await self.time_fanout(consumers, messages, self.frame_delivery)
+            for consumer in consumers:
+                consumer.outbound.stop()
+            self.stdout.write(
+                f"{size:>9} {legacy * 1e3:>12.3f} ms {once * 1e3:>12.3f} ms {legacy / once:>7.1f}x"
+            )
+        self.stdout.write("(CPU time per message across all recipients)")
+
+    def make_consumer(self):
+        # A connected HubChatConsumer minus the socket: frames are dropped
+        # once they leave its outbound queue
+        consumer = HubChatConsumer()
+
+        async def send(text):
+            pass
+
+        async def close(code, reason):
+            pass
+
+        consumer.outbound = outbound.OutboundQueue(send, close)
+        consumer.outbound.start()
+        return consumer
+
+    async def legacy_delivery(self, consumers, message):
+        # What every consumer did before frames were encoded by the sender
+        for consumer in consumers:
+            consumer.enqueue(encode_frame({"type": "chat_message", "message": message}))
+
+    async def frame_delivery(self, consumers, message):
+        event = frame_event({"type": "chat_message", "message": message})
+        for consumer in consumers:
+            await consumer.ws_frame(event)
+
+    async def time_fanout(self, consumers, messages, deliver):
+        started = time.process_time()
+        for n in range(messages):
+            await deliver(consumers, sample_message(n))
+            # Include the writers: let every queue drain before the next message
+            while any(consumer.outbound.frames for consumer in consumers):
+                await asyncio.sleep(0)
+        return (time.process_time() - started) / messages
@@ -0,0 +1,120 @@
+import datetime
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+from base import fastjson
+from base.fastjson import FastJSONRenderer
+
+
+def hub(n):
+    return ReturnDict({
+        "id": n,
+        "name": f"Volunteers {n}",
+        "description": "Weekend clean-ups, food drives and tutoring sessions. " * 4,
+        "admin": "jane.doe",
+        "image": None,
+        "members_count": 120 + n,
+        "image_url": f"http://127.0.0.1:8000/media/hub_images/hub{n}.png",
+        "membership_status": "approved",
+    }, serializer=None)
+
+
+def event(n):
+    return ReturnDict({
+        "id": n,
+        "hub": n % 40,
+        "title": f"Beach clean-up #{n}",
+        "hub_name": "Volunteers",
+        "description": "Bring gloves and water, bags are provided. " * 5,
+        "hub_admin_id": 7,
+        "location": "North pier",
+        "start_time": "2026-03-14T09:00:00Z",
+        "end_time": "2026-03-14T12:00:00Z",
+        "image": None,
+        "image_url": None,
+        "attendees_count": 42,
+        "user_attending": True,
+        "membership_status": "approved",
+        "attendees": [{"id": i, "name": f"user {i}"} for i in range(5)],
+        "created_by": 7,
+        "created_by_username": "jane.doe",
+    }, serializer=None)
+
+
+def message(n, depth=0):
+    return ReturnDict({
+        "id": n,
+        "sender": {"id": 7, "username": "jane.doe", "avatar_url": "http://127.0.0.1:8000/media/avatars/jane.png"},
+        "content": "Are we still on for the volunteering session on Saturday? ",
+        "media": None,
+        "media_url": None,
+        "parent_id": None,
+        "replies": [message(n * 10 + i, depth + 1) for i in range(2)] if depth < 1 else [],
+        "seq": n,
+        "timestamp": "2026-01-15T10:42:31.123456Z",
+        "is_deleted": False,
+        "is_edited": False,
+        "edited_at": None,
+    }, serializer=None)
+
+
+def mixed(n):
+    # Values serializers do not normally pre-format, to check they survive
+    return {
+        "id": n,
+        "at": datetime.datetime(2026, 1, 15, 10, 42, 31, 123456, tzinfo=datetime.timezone.utc),
+        "day": datetime.date(2026, 1, 15),
+        "amount": Decimal("12.50"),
+        "label": gettext_lazy("Hub"),
+    }
+
+
+PAYLOADS = {
+    "gallery_hubs (2,000 hubs)": lambda: ReturnList([hub(i) for i in range(2000)], serializer=None),
+    "events/upcoming (2,000 events)": lambda: ReturnList([event(i) for i in range(2000)], serializer=None),
+    "messages (200 + replies) x 10": lambda: [
+        {"previous": None, "next": None, "results": [message(i) for i in range(200)]} for _ in range(10)
+    ],
+    "datetime/Decimal/lazy (5,000)": lambda: [mixed(i) for i in range(5000)],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare DRF's JSONRenderer with base.fastjson.FastJSONRenderer on large "
+        "list payloads, and check both produce equivalent JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        backend = "orjson" if fastjson.orjson is not None else "stdlib json"
+        self.stdout.write(f"fast backend: {backend}")
+        self.stdout.write(f"{'payload':<32} {'size':>9} {'drf':>10} {'fast':>10} {'speedup':>8}")
+
+        drf, fast = JSONRenderer(), FastJSONRenderer()
+        for name, build in PAYLOADS.items():
+            data = build()
+            expected, drf_time = self.timed(drf.render, data, options["repeat"])
+            rendered, fast_time = self.timed(fast.render, data, options["repeat"])
+            if fastjson.loads(expected) != fastjson.loads(rendered):
+                self.stderr.write(f"{name}: output differs from JSONRenderer")
+            self.stdout.write(
+                f"{name:<32} {len(rendered) / 1024:>6.0f} KB {drf_time:>7.2f} ms"
+                f" {fast_time:>7.2f} ms {drf_time / fast_time:>7.1f}x"
+            )
+
+    def timed(self, render, data, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            output = render(data)
+            elapsed = (time.perf_counter() - started) * 1e3
+            best = elapsed if best is None else min(best, elapsed)
+        return output, best
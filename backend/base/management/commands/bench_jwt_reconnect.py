@@ -0,0 +1,74 @@
+import asyncio
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils.crypto import get_random_string
+from rest_framework_simplejwt.tokens import AccessToken
+
+from authentication.user_cache import user_cache
+from base.middleware import JWTAuthMiddleware
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark WebSocket authentication under a reconnect storm: every socket "
+        "reconnects at once with its existing access token and goes through "
+        "JWTAuthMiddleware, with and without the user cache. Creates throwaway "
+        "users in the configured database and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sockets", type=int, default=10000)
+        parser.add_argument("--users", type=int, default=2000, help="Sockets are spread over this many users (tabs, devices)")
+        parser.add_argument("--rounds", type=int, default=2, help="Storms per mode; the first one warms the cache")
+
+    def handle(self, *args, **options):
+        prefix = f"bench_{get_random_string(6)}_"
+        users = User.objects.bulk_create(
+            [User(username=f"{prefix}{i}") for i in range(options["users"])]
+        )
+        tokens = [str(AccessToken.for_user(user)) for user in users]
+        sockets = [tokens[i % len(tokens)] for i in range(options["sockets"])]
+        try:
+            self.stdout.write(
+                f"{'cache':>6} {'round':>6} {'total':>9} {'connect p50':>12} {'p95':>9} {'p99':>9}"
+            )
+            for size in (0, max(options["users"], 10000)):
+                user_cache.clear()
+                with override_settings(AUTH_USER_CACHE_SIZE=size):
+                    for round in range(1, options["rounds"] + 1):
+                        total, latencies = asyncio.run(self.storm(sockets))
+                        self.report("on" if size else "off", round, total, latencies)
+        finally:
+            User.objects.filter(username__startswith=prefix).delete()
+            user_cache.clear()
+
+    async def storm(self, sockets):
+        async def inner(scope, receive, send):
+            if scope["user"].is_anonymous:
+                raise RuntimeError("token did not authenticate")
+
+        middleware = JWTAuthMiddleware(inner)
+        latencies = []
+
+        async def connect(token):
+            scope = {"type": "websocket", "query_string": f"token={token}".encode()}
+            started = time.perf_counter()
+            await middleware(scope, None, None)
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(connect(token) for token in sockets))
+        return time.perf_counter() - started, sorted(latencies)
+
+    def report(self, mode, round, total, latencies):
+        def pct(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1e3
+
+        self.stdout.write(
+            f"{mode:>6} {round:>6} {total:>8.2f}s {statistics.median(latencies) * 1e3:>9.1f} ms"
+            f" {pct(0.95):>6.1f} ms {pct(0.99):>6.1f} ms"
+        )
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+import redis.asyncio as redis
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from base import redis_pool
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark WebSocket presence connect/disconnect throughput against Redis, "
+        "comparing one client per socket with the shared per-process pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sockets", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=500)
+        parser.add_argument("--hub", type=int, default=0)
+
+    def handle(self, *args, **options):
+        for mode in ("per-socket", "pooled"):
+            result = asyncio.run(self.run(mode, **options))
+            self.stdout.write(
+                f"{mode:>10}: {result['sockets']} sockets in {result['elapsed']:.2f}s "
+                f"({result['sockets'] / result['elapsed']:.0f} connect+disconnect/s), "
+                f"peak server connections {result['peak_clients']}"
+            )
+
+    async def run(self, mode, sockets, concurrency, hub, **options):
+        key = f"bench:hub:{hub}:online_users"
+        monitor = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        await monitor.delete(key)
+        peak = 0
+        gate = asyncio.Semaphore(concurrency)
+        held = []
+
+        async def socket(n):
+            async with gate:
+                # Same number of Redis round trips as a presence connect/disconnect
+                if mode == "per-socket":
+                    client = await redis.from_url(settings.REDIS_URL, decode_responses=True)
+                    held.append(client)  # the old consumer never closed it
+                else:
+                    client = redis_pool.get_redis()
+                await client.sadd(key, f"user{n}")
+                await client.smembers(key)
+                await client.srem(key, f"user{n}")
+
+        async def sample():
+            nonlocal peak
+            while True:
+                info = await monitor.info("clients")
+                peak = max(peak, info["connected_clients"])
+                await asyncio.sleep(0.05)
+
+        sampler = asyncio.create_task(sample())
+        started = time.perf_counter()
+        await asyncio.gather(*(socket(n) for n in range(sockets)))
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+
+        for client in held:
+            await client.aclose()
+        await redis_pool.close_pool()
+        await monitor.delete(key)
+        await monitor.aclose()
+        return {"sockets": sockets, "elapsed": elapsed, "peak_clients": peak}
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import statistics
+import time
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils.crypto import get_random_string
+
+from base import metrics, outbound, ratelimit, replay, typing_indicators
+from base.consumers import HubChatConsumer
+from base.models import Hub
+from base.redis_pool import close_pool, get_redis
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test for chat rate limiting: one client floods a hub with messages "
+        "while a well-behaved client in another hub sends a message every interval. "
+        "Reports the quiet hub's send latency with the limiter off and on. Uses the "
+        "configured database and Redis; throwaway hubs and users are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--flooders", type=int, default=50, help="Concurrent flooding sockets")
+        parser.add_argument("--rate", type=float, default=100, help="Messages per second each flooder tries to send")
+        parser.add_argument("--duration", type=float, default=5.0, help="Seconds per run")
+        parser.add_argument("--interval", type=float, default=0.5, help="Seconds between quiet-hub messages")
+
+    def handle(self, *args, **options):
+        tag = get_random_string(8)
+        flooder = User.objects.create_user(f"bench_flood_{tag}")
+        quiet = User.objects.create_user(f"bench_quiet_{tag}")
+        flooded_hub = Hub.objects.create(name="bench flooded hub", admin=flooder)
+        quiet_hub = Hub.objects.create(name="bench quiet hub", admin=quiet)
+        try:
+            self.stdout.write(
+                f"{'limiter':>8} {'flood sent':>11} {'throttled':>10} {'quiet p50':>10} {'quiet p95':>10} {'quiet max':>10}"
+            )
+            for enabled in (False, True):
+                with override_settings(HUB_RATE_LIMIT_ENABLED=enabled):
+                    sent, throttled, latencies = asyncio.run(self.run(
+                        flooder, flooded_hub, quiet, quiet_hub, options
+                    ))
+                latencies.sort()
+                self.stdout.write(
+                    f"{'on' if enabled else 'off':>8} {sent:>11} {throttled:>10}"
+                    f" {statistics.median(latencies) * 1e3:>7.1f} ms"
+                    f" {latencies[int(len(latencies) * 0.95) - 1] * 1e3:>7.1f} ms"
+                    f" {latencies[-1] * 1e3:>7.1f} ms"
+                )
+        finally:
+            flooded_hub.delete()
+            quiet_hub.delete()
+            flooder.delete()
+            quiet.delete()
+
+    def make_consumer(self, user, hub, frames):
+        # A connected HubChatConsumer minus the socket: frames it would send
+        # to the client are collected instead
+        consumer = HubChatConsumer()
+        consumer.scope = {"type": "websocket", "user": user}
+        consumer.user = user
+        consumer.hub_id = hub.id
+        consumer.room_group_name = f"hub_{hub.id}"
+        consumer.channel_layer = get_channel_layer()
+        consumer.typing = typing_indicators.TypingDebouncer()
+
+        async def send(text):
+            frames.append(text)
+
+        async def close(code, reason):
+            pass
+
+        consumer.outbound = outbound.OutboundQueue(send, close)
+        consumer.outbound.start()
+        return consumer
+
+    async def run(self, flooder, flooded_hub, quiet, quiet_hub, options):
+        deadline = time.perf_counter() + options["duration"]
+        flood_frames, quiet_frames = [], []
+        flood_sent = 0
+        latencies = []
+
+        async def flood():
+            nonlocal flood_sent
+            consumer = self.make_consumer(flooder, flooded_hub, flood_frames)
+            # Frames arrive one at a time per socket, at most --rate per second
+            next_send = time.perf_counter()
+            while next_send < deadline:
+                await asyncio.sleep(max(0, next_send - time.perf_counter()))
+                await consumer.receive(json.dumps({"content": "spam"}))
+                flood_sent += 1
+                next_send = max(time.perf_counter(), next_send + 1 / options["rate"])
+            consumer.outbound.stop()
+
+        async def probe():
+            consumer = self.make_consumer(quiet, quiet_hub, quiet_frames)
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                await consumer.receive(json.dumps({"content": "hello"}))
+                latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(options["interval"])
+            consumer.outbound.stop()
+
+        await asyncio.gather(probe(), *(flood() for _ in range(options["flooders"])))
+        await asyncio.sleep(0.1)
+
+        throttled = sum('"throttled"' in frame for frame in flood_frames)
+        await self.cleanup(flooder, flooded_hub, quiet, quiet_hub)
+        return flood_sent, throttled, latencies
+
+    async def cleanup(self, flooder, flooded_hub, quiet, quiet_hub):
+        client = get_redis()
+        keys = []
+        for user, hub in ((flooder, flooded_hub), (quiet, quiet_hub)):
+            keys += ratelimit.bucket_keys("message", user.id, hub.id)
+            keys += replay.replay_keys(hub.id)
+        await client.delete(*keys)
+        await metrics.stop_flusher()
+        await close_pool()
+
+        @database_sync_to_async
+        def delete_messages():
+            flooded_hub.messages.all().delete()
+            quiet_hub.messages.all().delete()
+
+        await delete_messages()
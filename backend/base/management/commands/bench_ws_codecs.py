@@ -0,0 +1,74 @@
+import json
+import time
+
+import msgpack
+from django.core.management.base import BaseCommand
+
+from base.broadcast import msgpack_frame
+
+
+def sample_frames(n):
+    sender = {"id": 7, "username": "jane.doe", "avatar_url": "http://127.0.0.1:8000/media/avatars/jane.png"}
+    message = {
+        "id": n,
+        "sender": sender,
+        "content": "Are we still on for the volunteering session on Saturday?",
+        "media": None,
+        "media_url": None,
+        "parent_id": None,
+        "replies": [],
+        "seq": n,
+        "timestamp": "2026-01-15T10:42:31.123456Z",
+        "is_deleted": False,
+        "is_edited": False,
+        "edited_at": None,
+    }
+    return {
+        "chat_message": {"type": "chat_message", "message": message, "eid": n},
+        "message_edit": {"type": "message_edit", "message": dict(message, is_edited=True), "eid": n},
+        "message_delete": {"type": "message_delete", "message_id": n, "seq": n, "eid": n},
+        "presence": {"type": "presence", "action": "online", "user": {"id": 7, "username": "jane.doe"}},
+        "typing_snapshot": {"type": "typing_snapshot", "users": ["jane.doe", "sam"]},
+        "event_update": {"type": "event_update", "event": {"event_id": n, "action": "attending"}},
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the JSON and MessagePack WebSocket encodings per event type: "
+        "bytes on the wire and encode/decode time per 1,000 messages."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        n = options["messages"]
+        frames = [sample_frames(i) for i in range(n)]
+
+        self.stdout.write(
+            f"{'event':<16} {'json bytes':>11} {'msgpack':>9} {'saved':>6}"
+            f" {'json enc':>9} {'mp enc':>9} {'json dec':>9} {'mp dec':>9} {'convert':>9}"
+        )
+        for kind in frames[0]:
+            payloads = [f[kind] for f in frames]
+            texts, json_enc = self.timed(json.dumps, payloads)
+            blobs, mp_enc = self.timed(msgpack.packb, payloads)
+            _, json_dec = self.timed(json.loads, texts)
+            _, mp_dec = self.timed(msgpack.unpackb, blobs)
+            # What a binary socket costs the server: JSON frame -> MessagePack
+            msgpack_frame.cache_clear()
+            _, convert = self.timed(msgpack_frame, texts)
+
+            json_bytes = sum(len(t.encode()) for t in texts)
+            mp_bytes = sum(len(b) for b in blobs)
+            self.stdout.write(
+                f"{kind:<16} {json_bytes:>11} {mp_bytes:>9} {1 - mp_bytes / json_bytes:>6.0%}"
+                f" {json_enc:>6.2f} ms {mp_enc:>6.2f} ms {json_dec:>6.2f} ms {mp_dec:>6.2f} ms {convert:>6.2f} ms"
+            )
+        self.stdout.write(f"(times are per {n} messages; convert is once per worker per broadcast)")
+
+    def timed(self, func, items):
+        started = time.perf_counter()
+        results = [func(item) for item in items]
+        return results, (time.perf_counter() - started) * 1e3
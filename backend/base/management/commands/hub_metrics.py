@@ -0,0 +1,69 @@
+import asyncio
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from base.outbound import STATS_KEY
+
+from base.redis_pool import close_pool, get_redis
+
+
+class Command(BaseCommand):
+    help = "Print the realtime counters collected by all workers (metrics:* hashes in Redis)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("groups", nargs="*", help="Only show these groups, e.g. typing")
+        parser.add_argument("--reset", action="store_true", help="Delete the counters after printing")
+        parser.add_argument(
+            "--connections", type=int, metavar="N", default=0,
+            help="Also list the N sockets with the deepest outbound queues",
+        )
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options["groups"], options["reset"], options["connections"]))
+
+    async def run(self, groups, reset, connections=0):
+        client = get_redis()
+        keys = [f"metrics:{g}" for g in groups] or sorted(
+            [key async for key in client.scan_iter(match="metrics:*")]
+        )
+        for key in keys:
+            counts = {name: int(value) for name, value in (await client.hgetall(key)).items()}
+            if not counts:
+                continue
+            self.stdout.write(key.split(":", 1)[1])
+            for name, value in sorted(counts.items()):
+                self.stdout.write(f"  {name:<28} {value}")
+            if key == "metrics:typing":
+                saved = counts.get("frames_received", 0) - counts.get("snapshots_sent", 0)
+                self.stdout.write(f"  {'hub broadcasts saved':<28} {saved}")
+            if key == "metrics:recent":
+                reads = counts.get("hits", 0) + counts.get("misses", 0)
+                self.stdout.write(f"  {'hit ratio':<28} {counts.get('hits', 0) / max(reads, 1):.1%}")
+            if reset:
+                await client.delete(key)
+        if connections:
+            await self.print_connections(client, connections)
+        await close_pool()
+
+    async def print_connections(self, client, limit):
+        # Entries not refreshed for a few heartbeats belong to dead workers
+        cutoff = time.time() - 3 * settings.HUB_PRESENCE_HEARTBEAT_INTERVAL
+        sockets = [
+            (channel, stats)
+            for channel, stats in (
+                (channel, json.loads(raw)) for channel, raw in (await client.hgetall(STATS_KEY)).items()
+            )
+            if stats["at"] >= cutoff
+        ]
+        sockets.sort(key=lambda item: (item[1]["depth"], item[1]["max_depth"]), reverse=True)
+
+        self.stdout.write(f"outbound queues ({len(sockets)} sockets)")
+        self.stdout.write(f"  {'channel':<40} {'hub':>6} {'user':>6} {'depth':>6} {'max':>6} {'dropped':>8} {'batched':>8}")
+        for channel, stats in sockets[:limit]:
+            self.stdout.write(
+                f"  {channel:<40} {str(stats['hub']):>6} {stats['user']:>6} {stats['depth']:>6}"
+                f" {stats['max_depth']:>6} {stats['dropped']:>8} {stats['batched']:>8}"
+            )
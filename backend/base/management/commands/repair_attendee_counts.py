@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from base import attendance
+from base.models import Event
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild Event.attendees_count from the attendance rows, for events "
+        "whose stored count has drifted (rows edited outside the API, "
+        "restored backups)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("events", nargs="*", type=int, help="Event ids (default: all events)")
+        parser.add_argument("--dry-run", action="store_true", help="Only list the stale events")
+
+    def handle(self, *args, **options):
+        events = Event.objects.all()
+        if options["events"]:
+            events = events.filter(pk__in=options["events"])
+
+        if options["dry_run"]:
+            stale = attendance.stale_events(events).values_list("pk", "attendees_count", "actual")
+            for event_id, stored, actual in stale:
+                self.stdout.write(f"event {event_id}: stored {stored}, actual {actual}")
+            self.stdout.write(f"{len(stale)} stale events")
+            return
+
+        self.stdout.write(f"fixed {attendance.repair(events)} events")
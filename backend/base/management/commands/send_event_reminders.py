@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from base import notifications
+from base.models import EventAttendance
+
+
+class Command(BaseCommand):
+    help = (
+        "Push an event_reminder notification to attendees of events starting "
+        "within the next --within minutes. Meant to run every few minutes "
+        "(cron); each attendee is reminded once per event."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--within", type=int, default=60, help="Minutes ahead to look")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        window = timedelta(minutes=options["within"])
+        attendances = (
+            EventAttendance.objects
+            .filter(attending=True, event__start_time__gt=now, event__start_time__lte=now + window)
+            .select_related("event", "event__hub")
+        )
+
+        sent = 0
+        for attendance in attendances.iterator():
+            event = attendance.event
+            # Outlives the window, so later runs skip it
+            if not cache.add(f"event_reminder:{event.id}:{attendance.user_id}", 1, window.total_seconds() * 2):
+                continue
+            async_to_sync(notifications.notify_async)(
+                attendance.user_id,
+                "event_reminder",
+                hub=event.hub_id,
+                hub_name=event.hub.name,
+                event={
+                    "id": event.id,
+                    "title": event.title,
+                    "location": event.location,
+                    "start_time": event.start_time.isoformat(),
+                },
+            )
+            sent += 1
+
+        self.stdout.write(f"sent {sent} reminders")
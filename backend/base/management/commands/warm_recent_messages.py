@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from base import recent
+from base.models import Hub
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the Redis recent-messages buffer of hubs from the database, e.g. "
+        "after a deploy or a Redis restart, so the first visitors of each hub "
+        "do not pay for the cold read."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("hubs", nargs="*", type=int, help="Hub ids (default: recently active hubs)")
+        parser.add_argument("--active-days", type=int, default=7, help="Hubs with a message in this many days")
+
+    def handle(self, *args, **options):
+        hubs = options["hubs"]
+        if not hubs:
+            since = timezone.now() - timedelta(days=options["active_days"])
+            hubs = Hub.objects.filter(messages__timestamp__gte=since).distinct().values_list("id", flat=True)
+
+        total = 0
+        for hub_id in hubs:
+            count = recent.warm(hub_id)
+            total += count
+            self.stdout.write(f"hub {hub_id}: {count} messages")
+        self.stdout.write(f"warmed {len(hubs)} hubs, {total} messages")
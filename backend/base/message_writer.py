@@ -0,0 +1,137 @@
+"""
+Write-behind persistence for WebSocket chat messages.
+
+Enabled with HUB_CHAT_WRITE_BEHIND. Instead of one thread hop and one INSERT
+per message, each worker buffers incoming messages and writes them with a
+single bulk_create per micro-batch (HUB_CHAT_BATCH_SIZE messages or
+HUB_CHAT_BATCH_DELAY seconds, whichever comes first). Sequence numbers for
+a whole batch are reserved with one counter update per hub.
+
+Durability: a message is only broadcast (and therefore only visible to
+anyone) after the transaction holding its batch has committed. If the
+worker dies, messages still waiting in the buffer are lost, but none of
+them has been acknowledged to any client, so nobody sees a message that
+later disappears. If a batch fails, every sender in it gets the error.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from .lifespan import on_shutdown
+from .models import Message, allocate_message_seqs
+
+logger = logging.getLogger(__name__)
+
+
+def persist_batch(items):
+    """
+    Insert a batch of pending messages. Returns, per item, the saved
+    Message or the exception that kept it out of the batch.
+    """
+    results = [None] * len(items)
+
+    parent_ids = {item["parent_id"] for item in items if item["parent_id"]}
+    valid_parents = set(
+        Message.objects.filter(id__in=parent_ids).values_list("hub_id", "id")
+    ) if parent_ids else set()
+
+    by_hub = defaultdict(list)
+    for index, item in enumerate(items):
+        if item["parent_id"] and (item["hub_id"], item["parent_id"]) not in valid_parents:
+            results[index] = ValueError("Invalid parent message")
+            continue
+        by_hub[item["hub_id"]].append(index)
+
+    with transaction.atomic():
+        for hub_id, indexes in by_hub.items():
+            first_seq = allocate_message_seqs(hub_id, len(indexes))
+            for offset, index in enumerate(indexes):
+                item = items[index]
+                results[index] = Message(
+                    hub_id=hub_id,
+                    sender=item["sender"],
+                    content=item["content"],
+                    parent_id=item["parent_id"],
+                    seq=first_seq + offset,
+                )
+        Message.objects.bulk_create([r for r in results if isinstance(r, Message)])
+
+    return results
+
+
+class MessageWriter:
+    def __init__(self):
+        self.pending = []
+        self.timer = None
+        self.inflight = set()
+
+    async def submit(self, hub_id, sender, content, parent_id=None):
+        """Queue a message and wait until its batch is committed."""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(({
+            "hub_id": int(hub_id),
+            "sender": sender,
+            "content": content,
+            "parent_id": int(parent_id) if parent_id else None,
+        }, future))
+
+        if len(self.pending) >= settings.HUB_CHAT_BATCH_SIZE:
+            self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(
+                settings.HUB_CHAT_BATCH_DELAY, self.flush
+            )
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        task = asyncio.get_running_loop().create_task(self._write(batch))
+        self.inflight.add(task)
+        task.add_done_callback(self.inflight.discard)
+
+    async def _write(self, batch):
+        try:
+            results = await database_sync_to_async(persist_batch)([item for item, _ in batch])
+        except Exception as e:
+            logger.exception("Chat batch of %d messages failed", len(batch))
+            results = [e] * len(batch)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def close(self):
+        self.flush()
+        if self.inflight:
+            await asyncio.gather(*self.inflight, return_exceptions=True)
+
+
+_writer = None
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        _writer = MessageWriter()
+    return _writer
+
+
+@on_shutdown
+async def close_writer():
+    global _writer
+    if _writer is not None:
+        writer, _writer = _writer, None
+        await writer.close()
@@ -0,0 +1,72 @@
+"""
+Lightweight counters for the realtime layer.
+
+Counters are incremented in process memory (no I/O on the hot path) and
+periodically added to Redis hashes ``metrics:<group>`` so that numbers from
+all workers can be read together with ``manage.py hub_metrics``.
+"""
+import asyncio
+import logging
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from .lifespan import on_shutdown
+from .redis_pool import get_redis
+
+logger = logging.getLogger(__name__)
+
+_pending = defaultdict(Counter)
+_flusher = None
+
+
+def incr(group, name, amount=1):
+    _pending[group][name] += amount
+    _ensure_flusher()
+
+
+def local_snapshot():
+    return {group: dict(counts) for group, counts in _pending.items()}
+
+
+async def flush():
+    global _pending
+    pending, _pending = _pending, defaultdict(Counter)
+    if not pending:
+        return
+    pipe = get_redis().pipeline(transaction=False)
+    for group, counts in pending.items():
+        for name, amount in counts.items():
+            if amount:
+                pipe.hincrby(f"metrics:{group}", name, amount)
+    await pipe.execute()
+
+
+async def _flush_forever():
+    while True:
+        await asyncio.sleep(settings.HUB_METRICS_FLUSH_INTERVAL)
+        try:
+            await flush()
+        except Exception:
+            logger.exception("Metrics flush failed")
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None and not _flusher.done():
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Sync callers (views) keep counting locally until an async flush runs
+        return
+    _flusher = loop.create_task(_flush_forever())
+
+
+@on_shutdown
+async def stop_flusher():
+    global _flusher
+    if _flusher is not None:
+        _flusher.cancel()
+        _flusher = None
+    await flush()
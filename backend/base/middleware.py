@@ -1,10 +1,14 @@
+import asyncio
 from urllib.parse import parse_qs
 from channels.middleware import BaseMiddleware
 from django.contrib.auth.models import AnonymousUser
 from rest_framework_simplejwt.tokens import AccessToken
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from channels.db import database_sync_to_async
 
+from authentication.user_cache import acurrent_version, user_cache
+
 User = get_user_model()
 
 
@@ -16,6 +20,32 @@ def get_user(user_id):
         return AnonymousUser()
 
 
+# (user_id, version) -> task loading that user, shared by concurrent connects
+_loading = {}
+
+
+async def get_token_user(access_token):
+    # Reconnect storms reuse the same tokens: serve them without a thread hop,
+    # and let the tabs of one user share a single query on a miss
+    if settings.AUTH_USER_CACHE_SIZE <= 0:
+        return await get_user(access_token["user_id"])
+
+    version = await acurrent_version(access_token)
+    user = user_cache.get(access_token, version)
+    if user is None:
+        # A load started under an older stamp may predate the change
+        key = (access_token["user_id"], version)
+        task = _loading.get(key)
+        if task is None:
+            task = _loading[key] = asyncio.ensure_future(get_user(key[0]))
+            task.add_done_callback(lambda _: _loading.pop(key, None))
+        user = await asyncio.shield(task)
+        if not user.is_active:
+            return AnonymousUser()
+        user_cache.set(access_token, user, version)
+    return user
+
+
 class JWTAuthMiddleware(BaseMiddleware):
     async def __call__(self, scope, receive, send):
         query_string = parse_qs(scope["query_string"].decode())
@@ -24,7 +54,7 @@ class JWTAuthMiddleware(BaseMiddleware):
         if token:
             try:
                 access_token = AccessToken(token[0])
-                scope["user"] = await get_user(access_token["user_id"])
+                scope["user"] = await get_token_user(access_token)
             except Exception:
                 scope["user"] = AnonymousUser()
         else:
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0006_remove_message_is_delete_message_edited_at_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['hub', 'timestamp', 'id'], name='message_hub_ts_id_idx'),
+        ),
+    ]
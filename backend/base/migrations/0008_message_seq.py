@@ -0,0 +1,57 @@
+from django.db import migrations, models
+
+
+def backfill_message_seq(apps, schema_editor):
+    Hub = apps.get_model("base", "Hub")
+    Message = apps.get_model("base", "Message")
+
+    for hub in Hub.objects.all().iterator():
+        batch = []
+        seq = 0
+        for message in Message.objects.filter(hub=hub).order_by("timestamp", "id").only("id").iterator():
+            seq += 1
+            message.seq = seq
+            batch.append(message)
+            if len(batch) >= 1000:
+                Message.objects.bulk_update(batch, ["seq"])
+                batch = []
+        if batch:
+            Message.objects.bulk_update(batch, ["seq"])
+        Hub.objects.filter(pk=hub.pk).update(message_seq=seq)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0007_message_hub_ts_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hub',
+            name='message_seq',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveBigIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_message_seq, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveBigIntegerField(editable=False),
+        ),
+        # History pages are keyed on (hub, seq) from here on (see
+        # base.pagination); the (hub, timestamp, id) index added in 0007 for
+        # the timestamp cursor has no reader left.
+        migrations.RemoveIndex(
+            model_name='message',
+            name='message_hub_ts_id_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('hub', 'seq'), name='message_hub_seq_uniq'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0009_broadcastoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='broadcastoutbox',
+            name='recent',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
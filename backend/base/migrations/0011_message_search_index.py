@@ -0,0 +1,82 @@
+from django.db import migrations
+
+# Kept in sync by the database itself (triggers / a generated column), so
+# bulk_create, queryset.update() and raw writes are indexed too. Deleted
+# messages (is_deleted, content cleared) are never in the index.
+SQLITE_FORWARDS = [
+    """
+    CREATE VIRTUAL TABLE base_message_fts USING fts5(
+        content,
+        content='base_message',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER base_message_fts_ai AFTER INSERT ON base_message BEGIN
+        INSERT INTO base_message_fts(rowid, content)
+        SELECT new.id, new.content WHERE new.content IS NOT NULL AND NOT new.is_deleted;
+    END
+    """,
+    """
+    CREATE TRIGGER base_message_fts_ad AFTER DELETE ON base_message BEGIN
+        INSERT INTO base_message_fts(base_message_fts, rowid, content)
+        SELECT 'delete', old.id, old.content WHERE old.content IS NOT NULL AND NOT old.is_deleted;
+    END
+    """,
+    """
+    CREATE TRIGGER base_message_fts_au AFTER UPDATE OF content, is_deleted ON base_message BEGIN
+        INSERT INTO base_message_fts(base_message_fts, rowid, content)
+        SELECT 'delete', old.id, old.content WHERE old.content IS NOT NULL AND NOT old.is_deleted;
+        INSERT INTO base_message_fts(rowid, content)
+        SELECT new.id, new.content WHERE new.content IS NOT NULL AND NOT new.is_deleted;
+    END
+    """,
+    """
+    INSERT INTO base_message_fts(rowid, content)
+    SELECT id, content FROM base_message WHERE content IS NOT NULL AND NOT is_deleted
+    """,
+]
+
+SQLITE_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS base_message_fts_au",
+    "DROP TRIGGER IF EXISTS base_message_fts_ad",
+    "DROP TRIGGER IF EXISTS base_message_fts_ai",
+    "DROP TABLE IF EXISTS base_message_fts",
+]
+
+POSTGRES_FORWARDS = [
+    """
+    ALTER TABLE base_message ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('simple'::regconfig, CASE WHEN is_deleted THEN '' ELSE coalesce(content, '') END)
+    ) STORED
+    """,
+    "CREATE INDEX base_message_search_idx ON base_message USING GIN (search_vector)",
+]
+
+POSTGRES_BACKWARDS = [
+    "DROP INDEX IF EXISTS base_message_search_idx",
+    "ALTER TABLE base_message DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0010_broadcastoutbox_recent'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({"sqlite": SQLITE_FORWARDS, "postgresql": POSTGRES_FORWARDS}),
+            run({"sqlite": SQLITE_BACKWARDS, "postgresql": POSTGRES_BACKWARDS}),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_attendees(apps, schema_editor):
+    Event = apps.get_model("base", "Event")
+    EventAttendance = apps.get_model("base", "EventAttendance")
+    rows = (
+        EventAttendance.objects.filter(event=OuterRef("pk"), attending=True)
+        .order_by()
+        .values("event")
+        .annotate(n=Count("pk"))
+        .values("n")
+    )
+    Event.objects.update(attendees_count=Coalesce(Subquery(rows, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0011_message_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='attendees_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_attendees, migrations.RunPython.noop),
+    ]
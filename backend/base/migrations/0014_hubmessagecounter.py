@@ -0,0 +1,43 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_counters(apps, schema_editor):
+    Hub = apps.get_model("base", "Hub")
+    HubMessageCounter = apps.get_model("base", "HubMessageCounter")
+    HubMessageCounter.objects.bulk_create(
+        [
+            HubMessageCounter(hub_id=hub_id, last_seq=message_seq)
+            for hub_id, message_seq in Hub.objects.values_list("id", "message_seq").iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+def restore_counters(apps, schema_editor):
+    Hub = apps.get_model("base", "Hub")
+    HubMessageCounter = apps.get_model("base", "HubMessageCounter")
+    for hub_id, last_seq in HubMessageCounter.objects.values_list("hub_id", "last_seq").iterator():
+        Hub.objects.filter(pk=hub_id).update(message_seq=last_seq)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0013_event_start_time_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HubMessageCounter',
+            fields=[
+                ('hub', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='message_counter', serialize=False, to='base.hub')),
+                ('last_seq', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(move_counters, restore_counters),
+        migrations.RemoveField(
+            model_name='hub',
+            name='message_seq',
+        ),
+    ]
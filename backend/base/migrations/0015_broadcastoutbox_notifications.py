@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0014_hubmessagecounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='broadcastoutbox',
+            name='revoke_hub',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='broadcastoutbox',
+            name='user_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='broadcastoutbox',
+            name='hub_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
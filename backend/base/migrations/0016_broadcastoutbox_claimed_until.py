@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0015_broadcastoutbox_notifications'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='broadcastoutbox',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
 
 class Hub(models.Model):
@@ -12,6 +13,31 @@ class Hub(models.Model):
     def __str__(self):
         return self.name
 
+
+class HubMessageCounter(models.Model):
+    """
+    Last Message.seq handed out in a hub. A row of its own, so that saving a
+    Hub instance loaded earlier cannot write an old value back; only ever
+    changed through allocate_message_seqs().
+    """
+    hub = models.OneToOneField(Hub, on_delete=models.CASCADE, primary_key=True, related_name="message_counter")
+    last_seq = models.PositiveBigIntegerField(default=0)
+
+
+def allocate_message_seqs(hub_id, count=1):
+    """
+    Reserve ``count`` consecutive message sequence numbers in a hub and
+    return the first one. Must run inside the transaction that inserts the
+    messages, so the counter row stays locked until they are written.
+    """
+    counter = HubMessageCounter.objects.filter(hub_id=hub_id)
+    if not counter.update(last_seq=F("last_seq") + count):
+        # The hub's first message: its counter is created on demand
+        HubMessageCounter.objects.get_or_create(hub_id=hub_id)
+        counter.update(last_seq=F("last_seq") + count)
+    last = counter.values_list("last_seq", flat=True).get()
+    return last - count + 1
+
 class HubMembership(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     hub = models.ForeignKey(Hub, on_delete=models.CASCADE)
@@ -41,6 +67,22 @@ class Message(models.Model):
     is_deleted = models.BooleanField(default=False)
     is_edited = models.BooleanField(default=False)
     edited_at = models.DateTimeField(null=True, blank=True)
+    # Per-hub insertion order (1, 2, 3, ...) assigned on insert; hard deletes leave gaps
+    seq = models.PositiveBigIntegerField(editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["hub", "seq"], name="message_hub_seq_uniq"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.seq is None:
+            with transaction.atomic():
+                self.seq = allocate_message_seqs(self.hub_id)
+                super().save(*args, **kwargs)
+            return
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.sender.username} @ {self.hub.name}"
 
@@ -62,6 +104,15 @@ class Event(models.Model):
         related_name="created_events"
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    # Attending rows, maintained by base.attendance
+    attendees_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        # Calendar and upcoming ranges, per hub and across hubs (base.event_calendar)
+        indexes = [
+            models.Index(fields=["hub", "start_time"], name="event_hub_start_idx"),
+            models.Index(fields=["start_time"], name="event_start_idx"),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.hub.name})"
@@ -96,4 +147,26 @@ class MessageHighlight(models.Model):
         unique_together = ("user", "message")
 
     def __str__(self):
-        return f"{self.user.username} highlighted message {self.message.id}"
\ No newline at end of file
+        return f"{self.user.username} highlighted message {self.message.id}"
+
+class BroadcastOutbox(models.Model):
+    """
+    Hub broadcasts and user notifications written by views in the same
+    transaction as the change they announce; base.outbox sends them once it
+    has committed.
+    """
+    # Set for hub broadcasts
+    hub_id = models.PositiveBigIntegerField(null=True, blank=True)
+    # Set for notifications to the user's sockets, instead of hub_id
+    user_id = models.PositiveBigIntegerField(null=True, blank=True)
+    # Notifications only: hub the user's sockets unsubscribe from
+    revoke_hub = models.PositiveBigIntegerField(null=True, blank=True)
+    # Pre-encoded JSON frame
+    frame = models.TextField()
+    # Stamped with an eid and kept in the hub's replay buffer when sent
+    replay = models.BooleanField(default=False)
+    # (seq, message json) entries for the hub's recent messages buffer
+    recent = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Leased by a dispatcher until then; deleted once sent
+    claimed_until = models.DateTimeField(null=True, blank=True)
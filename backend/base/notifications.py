@@ -0,0 +1,48 @@
+"""
+Per-user notifications (membership decisions, bans, join requests, event
+reminders) pushed over the multiplexed per-user socket.
+
+Every UserSocketConsumer joins ``user_<id>``; a notification is one
+pre-encoded ``notification`` frame sent to that group, so all of the user's
+open tabs and devices get it. Users without an open socket simply miss it.
+
+Views go through the broadcast outbox like hub broadcasts do: the request
+only writes a row, the outbox dispatcher sends it after commit.
+"""
+from channels.layers import get_channel_layer
+
+from .broadcast import encode_frame, frame_event
+
+
+def user_group(user_id):
+    return f"user_{user_id}"
+
+
+def notification_frame(kind, **data):
+    return encode_frame({"type": "notification", "kind": kind, **data})
+
+
+def notification_event(text, revoke_hub=None):
+    event = frame_event(text=text)
+    # Tells the user's sockets to drop their subscription to this hub
+    if revoke_hub is not None:
+        event["revoke_hub"] = int(revoke_hub)
+    return event
+
+
+async def send(user_id, text, revoke_hub=None, channel_layer=None):
+    """Send a pre-encoded notification frame to the user's sockets."""
+    channel_layer = channel_layer or get_channel_layer()
+    await channel_layer.group_send(user_group(user_id), notification_event(text, revoke_hub))
+
+
+async def notify_async(user_id, kind, channel_layer=None, revoke_hub=None, **data):
+    await send(user_id, notification_frame(kind, **data), revoke_hub, channel_layer)
+
+
+def notify(user_id, kind, revoke_hub=None, **data):
+    """For views: queued in the outbox, sent once the current transaction commits."""
+    # The outbox dispatcher sends through this module
+    from . import outbox
+
+    outbox.record_notification(user_id, notification_frame(kind, **data), revoke_hub)
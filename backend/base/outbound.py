@@ -0,0 +1,147 @@
+"""
+Bounded per-connection outbound queue with a slow-consumer policy.
+
+Channel-layer handlers only enqueue frames, so a socket that drains slowly
+never stalls its consumer and never lets its channel-layer inbox overflow
+(where channels_redis would drop messages at random). Instead:
+
+* once the queue holds HUB_WS_QUEUE_SIZE frames, ephemeral frames (typing,
+  presence) are dropped first, oldest first;
+* when more than HUB_WS_BATCH_THRESHOLD frames are waiting, the writer
+  merges them into a single ``batch`` frame;
+* a socket that stays over the limit for HUB_WS_SLOW_TIMEOUT seconds, or
+  reaches twice the limit, is closed with code 4008 and a resume hint
+  (the last event id it was sent) so it can reconnect with ``?since=``.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+
+from django.conf import settings
+
+from . import metrics
+from .redis_pool import get_redis
+
+logger = logging.getLogger(__name__)
+
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
+# Closed with when a frame cannot be written (the socket is gone or broken)
+SEND_FAILED_CLOSE_CODE = 1011
+
+# Hash of channel name -> latest queue stats of every open hub socket
+STATS_KEY = "ws:outbound"
+
+
+class OutboundQueue:
+    def __init__(self, send, close):
+        # send(text) writes one frame; close(code, reason) drops the socket
+        self._send = send
+        self._close = close
+        self.frames = deque()  # (text, ephemeral, eid)
+        self.ready = asyncio.Event()
+        self.task = None
+        self.closing = False
+        self.over_limit_since = None
+        self.last_eid = None
+        self.stats = {"depth": 0, "max_depth": 0, "sent": 0, "dropped": 0, "batched": 0}
+
+    def start(self):
+        self.task = asyncio.create_task(self._drain())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    def put(self, text, ephemeral=False, eid=None):
+        if self.closing:
+            return
+        limit = settings.HUB_WS_QUEUE_SIZE
+
+        if len(self.frames) >= limit:
+            if ephemeral:
+                self._dropped()
+                return
+            if not self._drop_oldest_ephemeral():
+                self._over_limit(limit)
+
+        self.frames.append((text, ephemeral, eid))
+        depth = len(self.frames)
+        self.stats["depth"] = depth
+        self.stats["max_depth"] = max(self.stats["max_depth"], depth)
+        if depth < limit:
+            self.over_limit_since = None
+        self.ready.set()
+
+    def _drop_oldest_ephemeral(self):
+        for index, (_, ephemeral, _) in enumerate(self.frames):
+            if ephemeral:
+                del self.frames[index]
+                self._dropped()
+                return True
+        return False
+
+    def _dropped(self):
+        self.stats["dropped"] += 1
+        metrics.incr("outbound", "ephemeral_dropped")
+
+    def _over_limit(self, limit):
+        now = time.monotonic()
+        if self.over_limit_since is None:
+            self.over_limit_since = now
+        if (
+            len(self.frames) >= limit * 2
+            or now - self.over_limit_since >= settings.HUB_WS_SLOW_TIMEOUT
+        ):
+            self.closing = True
+            metrics.incr("outbound", "slow_disconnects")
+            reason = json.dumps({"resume_since": self.last_eid})
+            asyncio.create_task(self._close(SLOW_CONSUMER_CLOSE_CODE, reason))
+
+    async def _drain(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            while self.frames:
+                if len(self.frames) > settings.HUB_WS_BATCH_THRESHOLD:
+                    pending, self.frames = list(self.frames), deque()
+                    text = '{"type": "batch", "events": [%s]}' % ", ".join(t for t, _, _ in pending)
+                    eids = [eid for _, _, eid in pending if eid]
+                    eid = eids[-1] if eids else None
+                    self.stats["batched"] += len(pending)
+                    metrics.incr("outbound", "frames_batched", len(pending))
+                else:
+                    text, _, eid = self.frames.popleft()
+                self.stats["depth"] = len(self.frames)
+                try:
+                    await self._send(text)
+                except Exception:
+                    # Nothing would write to this socket again: drop it so the
+                    # client reconnects and resumes from the last frame it got
+                    logger.exception("Writing to a socket failed, closing it")
+                    self.closing = True
+                    self.frames.clear()
+                    metrics.incr("outbound", "send_failures")
+                    reason = json.dumps({"resume_since": self.last_eid})
+                    await self._close(SEND_FAILED_CLOSE_CODE, reason)
+                    return
+                self.stats["sent"] += 1
+                if eid:
+                    self.last_eid = eid
+
+
+async def report(channel_name, hub_id, user_id, stats):
+    """Publish a socket's queue stats for ``hub_metrics --connections``."""
+    await get_redis().hset(STATS_KEY, channel_name, json.dumps({
+        # No hub for multiplexed per-user sockets
+        "hub": "user" if hub_id is None else int(hub_id),
+        "user": user_id,
+        "at": int(time.time()),
+        **stats,
+    }))
+
+
+async def forget(channel_name):
+    await get_redis().hdel(STATS_KEY, channel_name)
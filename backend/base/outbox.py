@@ -0,0 +1,191 @@
+"""
+Transactional outbox for hub broadcasts and user notifications made by
+HTTP views.
+
+Views call ``record()`` inside the transaction that makes the change, which
+only adds a BroadcastOutbox row. Nothing is sent if the transaction rolls
+back, and the request never waits on Redis: on commit the worker's
+dispatcher is woken, and sends what is pending from the server's event
+loop, HUB_OUTBOX_BATCH_SIZE rows at a time.
+
+Several pending events of the same hub go out as one ``batch`` frame (the
+format slow sockets already get, see base.outbound), so a burst of edits
+costs one group_send per hub. Replayable events are still stamped and
+buffered one by one, in a single Redis round trip per hub. Notifications
+(rows with a user_id, see base.notifications) go out one by one.
+
+Rows are leased for HUB_OUTBOX_LEASE seconds (SKIP LOCKED where the
+database has it), so concurrent workers never send the same row, and
+deleted only once sent. Rows of a batch that failed, was cancelled by a
+shutdown or died with its worker are sent again when the lease runs out:
+each worker's dispatcher also wakes every HUB_OUTBOX_RETRY_INTERVAL
+seconds, and drains once at startup. Delivery is at least once. Outside
+an ASGI server (shell, management commands, tests) there is no loop to
+hand off to and pending rows are sent inline on commit.
+"""
+import asyncio
+import contextvars
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from asgiref.sync import SyncToAsync, async_to_sync
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import metrics, notifications, recent, replay
+from .broadcast import encode_frame, group_send_frame
+from .lifespan import on_shutdown, on_startup
+from .models import BroadcastOutbox
+
+logger = logging.getLogger(__name__)
+
+_dispatcher = None
+_wake = None
+
+
+def record(hub_id, data, replay=False, recent=()):
+    """
+    Queue a broadcast to a hub for after the current transaction commits.
+    ``recent`` are (seq, message json) entries for the hub's recent messages
+    buffer, written just before the frame goes out.
+    """
+    BroadcastOutbox.objects.create(
+        hub_id=hub_id, frame=encode_frame(data), replay=replay, recent=list(recent)
+    )
+    transaction.on_commit(wake)
+
+
+def record_notification(user_id, frame, revoke_hub=None):
+    """Queue a pre-encoded notification frame to a user's sockets."""
+    BroadcastOutbox.objects.create(user_id=user_id, frame=frame, revoke_hub=revoke_hub)
+    transaction.on_commit(wake)
+
+
+def wake():
+    # The ASGI server's loop, when called from a view running in sync_to_async
+    loop = getattr(SyncToAsync.threadlocal, "main_event_loop", None)
+    if loop is not None and loop.is_running():
+        # Fresh context: the view's would tie the dispatcher to its thread
+        loop.call_soon_threadsafe(_ensure_dispatcher, context=contextvars.Context())
+    else:
+        async_to_sync(drain)()
+
+
+def _ensure_dispatcher():
+    global _dispatcher, _wake
+    if _dispatcher is None or _dispatcher.done():
+        _wake = asyncio.Event()
+        _dispatcher = asyncio.get_running_loop().create_task(_run())
+    _wake.set()
+
+
+async def _run():
+    while True:
+        # Also wake now and then for rows whose lease ran out
+        try:
+            await asyncio.wait_for(_wake.wait(), settings.HUB_OUTBOX_RETRY_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+        # Let the rest of a burst of requests commit first
+        await asyncio.sleep(settings.HUB_OUTBOX_BATCH_DELAY)
+        try:
+            await drain()
+        except Exception:
+            logger.exception("Outbox dispatch failed")
+
+
+async def drain():
+    """Send everything pending, one batch at a time."""
+    while await dispatch_batch():
+        pass
+
+
+def claim_batch(size):
+    """Lease up to ``size`` rows that are unclaimed or whose lease ran out."""
+    now = timezone.now()
+    with transaction.atomic():
+        rows = BroadcastOutbox.objects.filter(
+            Q(claimed_until__isnull=True) | Q(claimed_until__lt=now)
+        ).order_by("id")
+        if connection.features.has_select_for_update_skip_locked:
+            rows = rows.select_for_update(skip_locked=True)
+        rows = list(rows[:size])
+        if rows:
+            BroadcastOutbox.objects.filter(id__in=[row.id for row in rows]).update(
+                claimed_until=now + timedelta(seconds=settings.HUB_OUTBOX_LEASE)
+            )
+    return rows
+
+
+def delete_rows(rows):
+    BroadcastOutbox.objects.filter(id__in=[row.id for row in rows]).delete()
+
+
+async def dispatch_batch():
+    """Send one batch of pending broadcasts. Returns True if more may be waiting."""
+    size = settings.HUB_OUTBOX_BATCH_SIZE
+    rows = await database_sync_to_async(claim_batch)(size)
+    if not rows:
+        return False
+
+    by_hub = defaultdict(list)
+    sends = []
+    for row in rows:
+        if row.user_id is not None:
+            sends.append(notifications.send(row.user_id, row.frame, row.revoke_hub))
+        else:
+            by_hub[row.hub_id].append(row)
+    sends.extend(send_hub(hub_id, hub_rows) for hub_id, hub_rows in by_hub.items())
+    # If this fails or is cancelled, the rows stay leased and go out again
+    # once the lease runs out; a hub that did get through may see a repeat
+    await asyncio.gather(*sends)
+    await database_sync_to_async(delete_rows)(rows)
+
+    metrics.incr("outbox", "events", len(rows))
+    metrics.incr("outbox", "frames", len(sends))
+    return len(rows) == size
+
+
+async def send_hub(hub_id, rows):
+    entries = [entry for row in rows for entry in row.recent]
+    if entries:
+        await recent.apply(hub_id, entries)
+
+    frames = [row.frame for row in rows]
+    replayable = [i for i, row in enumerate(rows) if row.replay]
+    eid = None
+    if replayable:
+        stamped = await replay.record_many(hub_id, [frames[i] for i in replayable])
+        for i, (_, frame) in zip(replayable, stamped):
+            frames[i] = frame
+        # Sockets track the newest eid they were sent, as for base.outbound batches
+        eid = stamped[-1][0]
+
+    if len(frames) == 1:
+        text = frames[0]
+    else:
+        # Already encoded: spliced, not decoded. The batch frame has no eid
+        # of its own, clients take it from each event.
+        text = '{"type":"batch","events":[%s]}' % ",".join(frames)
+    await group_send_frame(f"hub_{hub_id}", text=text, eid=eid)
+
+
+@on_startup
+async def start_dispatcher():
+    # Sends what earlier runs left behind, then keeps retrying expired leases
+    _ensure_dispatcher()
+
+
+@on_shutdown
+async def stop_dispatcher():
+    global _dispatcher
+    if _dispatcher is not None:
+        _dispatcher.cancel()
+        _dispatcher = None
+    # Whatever is left, claimed or not, stays in the table: it goes out again
+    # once its lease runs out
@@ -0,0 +1,120 @@
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def decode_cursor(cursor):
+    try:
+        seq = int(cursor)
+    except (TypeError, ValueError):
+        raise NotFound("Invalid cursor")
+    if seq < 0:
+        raise NotFound("Invalid cursor")
+    return seq
+
+
+class MessageCursorPagination(BasePagination):
+    """
+    Keyset pagination over the per-hub message ``seq`` for hub chat history.
+
+    Without a cursor the newest page is returned. ``?before=<seq>`` walks
+    back in time and ``?after=<seq>`` walks forward, so a client that spots
+    a gap in the sequence can fetch exactly the missing range. Every page is
+    a range scan on the unique (hub, seq) index, never an OFFSET.
+    Results are always returned oldest first.
+    """
+
+    page_size = getattr(settings, "HUB_MESSAGE_PAGE_SIZE", 50)
+    max_page_size = getattr(settings, "HUB_MESSAGE_MAX_PAGE_SIZE", 200)
+    page_size_query_param = "page_size"
+    before_query_param = "before"
+    after_query_param = "after"
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def is_latest_page(self, request):
+        """True for the default, newest page (no cursor)."""
+        return not (
+            request.query_params.get(self.before_query_param)
+            or request.query_params.get(self.after_query_param)
+        )
+
+    def paginate_latest(self, messages, has_older, request):
+        """Paginate an already serialized newest page (see base.recent)."""
+        self.request = request
+        self.has_older = has_older
+        self.has_newer = False
+        self.page = messages
+        self.seqs = [m["seq"] for m in messages[:1] + messages[-1:]]
+        return messages
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_page_size(request)
+
+        before = request.query_params.get(self.before_query_param)
+        after = request.query_params.get(self.after_query_param)
+
+        if after:
+            queryset = queryset.filter(seq__gt=decode_cursor(after)).order_by("seq")
+            rows = list(queryset[:self.limit + 1])
+            self.has_newer = len(rows) > self.limit
+            self.has_older = True
+            page = rows[:self.limit]
+        else:
+            if before:
+                queryset = queryset.filter(seq__lt=decode_cursor(before))
+            rows = list(queryset.order_by("-seq")[:self.limit + 1])
+            self.has_older = len(rows) > self.limit
+            self.has_newer = bool(before)
+            page = rows[:self.limit]
+            page.reverse()
+
+        self.page = page
+        self.seqs = [m.seq for m in page[:1] + page[-1:]]
+        return page
+
+    def _link(self, param, seq):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.before_query_param)
+        url = remove_query_param(url, self.after_query_param)
+        return replace_query_param(url, param, seq)
+
+    def get_previous_link(self):
+        if not self.page or not self.has_older:
+            return None
+        return self._link(self.before_query_param, self.seqs[0])
+
+    def get_next_link(self):
+        if not self.page or not self.has_newer:
+            return None
+        return self._link(self.after_query_param, self.seqs[-1])
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("previous", self.get_previous_link()),
+            ("next", self.get_next_link()),
+            ("results", data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
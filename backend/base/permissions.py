@@ -1,15 +1,11 @@
-from base.models import HubMembership
+from base import access
 
 
 def is_approved_member(user, hub):
-    return HubMembership.objects.filter(
-        hub=hub,
-        user=user,
-        is_approved=True
-    ).exists()
+    return access.is_member(user, hub)
 
 def is_hub_admin(user, hub):
     return (
         user.is_superuser
-        or hub.admins.filter(id=user.id).exists()
+        or access.is_admin(user, hub)
     )
\ No newline at end of file
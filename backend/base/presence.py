@@ -0,0 +1,171 @@
+"""
+Heartbeat based hub presence.
+
+Every open socket is a member ``"<user_id>:<channel_name>"`` of the sorted
+set ``hub:<id>:presence`` scored by its last heartbeat. A per-hub hash counts
+live connections per user, so a user only goes offline when their last tab
+closes or their last heartbeat expires. All transitions happen inside Lua
+scripts, which makes them atomic across workers: only the worker that
+actually flips a user online/offline broadcasts it.
+"""
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+
+from .broadcast import group_send_frame
+from .lifespan import on_shutdown
+from .redis_pool import get_redis
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_HUBS_KEY = "presence:hubs"
+
+# KEYS: zset, counts, names, hubs | ARGV: member, user_id, username, now, hub_id
+# Returns 1 when the user just came online.
+JOIN_LUA = """
+local added = redis.call('ZADD', KEYS[1], ARGV[4], ARGV[1])
+redis.call('SADD', KEYS[4], ARGV[5])
+if added == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[3], ARGV[2], ARGV[3])
+if redis.call('HINCRBY', KEYS[2], ARGV[2], 1) == 1 then
+    return 1
+end
+return 0
+"""
+
+# KEYS: zset, counts, names | ARGV: member, user_id
+# Returns 1 when the user just went offline.
+LEAVE_LUA = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+if redis.call('HINCRBY', KEYS[2], ARGV[2], -1) <= 0 then
+    redis.call('HDEL', KEYS[2], ARGV[2])
+    redis.call('HDEL', KEYS[3], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# KEYS: zset, counts, names | ARGV: cutoff
+# Returns a flat list of user_id, username pairs that went offline.
+SWEEP_LUA = """
+local offline = {}
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, member in ipairs(expired) do
+    redis.call('ZREM', KEYS[1], member)
+    local user_id = string.match(member, '^([^:]+):')
+    if redis.call('HINCRBY', KEYS[2], user_id, -1) <= 0 then
+        local username = redis.call('HGET', KEYS[3], user_id)
+        redis.call('HDEL', KEYS[2], user_id)
+        redis.call('HDEL', KEYS[3], user_id)
+        table.insert(offline, user_id)
+        table.insert(offline, username or '')
+    end
+end
+return offline
+"""
+
+
+def presence_keys(hub_id):
+    return (
+        f"hub:{hub_id}:presence",
+        f"hub:{hub_id}:presence:counts",
+        f"hub:{hub_id}:presence:names",
+    )
+
+
+def connection_member(user_id, channel_name):
+    return f"{user_id}:{channel_name}"
+
+
+async def join(hub_id, user, channel_name):
+    """Register (or refresh) a connection. Returns True if the user came online."""
+    client = get_redis()
+    script = client.register_script(JOIN_LUA)
+    went_online = await script(
+        keys=[*presence_keys(hub_id), PRESENCE_HUBS_KEY],
+        args=[connection_member(user.id, channel_name), user.id, user.username, time.time(), hub_id],
+    )
+    return bool(went_online)
+
+
+async def heartbeat(hub_id, user, channel_name):
+    """
+    Refresh a connection. Uses the same idempotent script as join(): an
+    entry that still exists is only re-scored, one a sweep expired in the
+    meantime is registered again. Returns True if that brought the user
+    back online, which the caller must announce like a connect.
+    """
+    return await join(hub_id, user, channel_name)
+
+
+async def leave(hub_id, user, channel_name):
+    """Drop a connection. Returns True if it was the user's last one."""
+    client = get_redis()
+    script = client.register_script(LEAVE_LUA)
+    went_offline = await script(
+        keys=list(presence_keys(hub_id)),
+        args=[connection_member(user.id, channel_name), user.id],
+    )
+    return bool(went_offline)
+
+
+async def online_users(hub_id):
+    names = await get_redis().hgetall(presence_keys(hub_id)[2])
+    return [{"id": int(user_id), "username": username} for user_id, username in names.items()]
+
+
+async def sweep(channel_layer):
+    """Expire stale connections in every hub and broadcast real offline transitions."""
+    client = get_redis()
+    script = client.register_script(SWEEP_LUA)
+    cutoff = time.time() - settings.HUB_PRESENCE_TTL
+
+    for hub_id in await client.smembers(PRESENCE_HUBS_KEY):
+        zset_key = presence_keys(hub_id)[0]
+        offline = await script(keys=list(presence_keys(hub_id)), args=[cutoff])
+        for user_id, username in zip(offline[::2], offline[1::2]):
+            await group_send_frame(
+                f"hub_{hub_id}",
+                {
+                    "type": "presence",
+                    "action": "offline",
+                    "user": {"id": int(user_id), "username": username},
+                },
+                channel_layer,
+                ephemeral=True,
+            )
+        if not await client.exists(zset_key):
+            await client.srem(PRESENCE_HUBS_KEY, hub_id)
+
+
+_sweeper = None
+
+
+async def _sweep_forever(channel_layer):
+    while True:
+        await asyncio.sleep(settings.HUB_PRESENCE_SWEEP_INTERVAL)
+        try:
+            await sweep(channel_layer)
+        except Exception:
+            logger.exception("Presence sweep failed")
+
+
+def ensure_sweeper(channel_layer):
+    """Start this worker's periodic sweeper if it is not already running."""
+    global _sweeper
+    if _sweeper is None or _sweeper.done():
+        _sweeper = asyncio.get_running_loop().create_task(_sweep_forever(channel_layer))
+
+
+@on_shutdown
+async def stop_sweeper():
+    global _sweeper
+    if _sweeper is not None:
+        _sweeper.cancel()
+        _sweeper = None
@@ -0,0 +1,142 @@
+"""
+Token-bucket rate limiting for frames clients send over hub sockets.
+
+Each kind of frame (``message``, ``typing``) is checked against two buckets
+from HUB_RATE_LIMITS: one per user, spanning all their sockets and hubs, and
+one per hub, so a flood in one room cannot eat the worker's database threads
+at the expense of the others. Buckets live in Redis and are taken atomically
+in one Lua script, which makes the limits hold across workers. If Redis is
+unreachable each worker falls back to its own in-process buckets.
+"""
+import logging
+import time
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from . import metrics
+from .redis_pool import get_redis
+
+logger = logging.getLogger(__name__)
+
+# KEYS: bucket hashes | ARGV: now (ms), then rate (tokens/s) and burst per key
+# Takes one token from every bucket, or from none. Returns {1, 0, 0} when
+# allowed, else {0, retry after (ms), index of the blocking bucket}.
+TAKE_LUA = """
+local now = tonumber(ARGV[1])
+local levels = {}
+local wait, blocked = 0, 0
+for i, key in ipairs(KEYS) do
+    local rate, burst = tonumber(ARGV[i * 2]), tonumber(ARGV[i * 2 + 1])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or burst
+    local elapsed = math.max(0, now - (tonumber(bucket[2]) or now))
+    tokens = math.min(burst, tokens + elapsed * rate / 1000)
+    levels[i] = tokens
+    if tokens < 1 then
+        local retry = math.ceil((1 - tokens) * 1000 / rate)
+        if retry > wait then
+            wait, blocked = retry, i
+        end
+    end
+end
+if blocked > 0 then
+    return {0, wait, blocked}
+end
+for i, key in ipairs(KEYS) do
+    local rate, burst = tonumber(ARGV[i * 2]), tonumber(ARGV[i * 2 + 1])
+    redis.call('HSET', key, 'tokens', tostring(levels[i] - 1), 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(burst * 1000 / rate) + 1000)
+end
+return {1, 0, 0}
+"""
+
+SCOPES = ("user", "hub")
+
+# Fallback buckets when Redis is down: key -> (tokens, last refill (ms),
+# when it is full again (ms)). A full bucket is the same as no bucket, so
+# those are swept out every LOCAL_SWEEP_INTERVAL ms, like the PEXPIRE of
+# the Redis ones.
+_local_buckets = {}
+_next_sweep = 0
+_redis_down = False
+
+LOCAL_SWEEP_INTERVAL = 60_000
+
+
+def bucket_keys(kind, user_id, hub_id):
+    return (
+        f"ratelimit:{kind}:user:{user_id}",
+        f"ratelimit:{kind}:hub:{hub_id}",
+    )
+
+
+def _limits(kind):
+    limits = settings.HUB_RATE_LIMITS[kind]
+    return [limits[scope] for scope in SCOPES]
+
+
+def _sweep_local(now):
+    global _next_sweep
+    if now < _next_sweep:
+        return
+    _next_sweep = now + LOCAL_SWEEP_INTERVAL
+    for key in [key for key, (_, _, full_at) in _local_buckets.items() if full_at <= now]:
+        del _local_buckets[key]
+
+
+def _take_local(keys, limits, now):
+    _sweep_local(now)
+    levels = []
+    wait, blocked = 0, 0
+    for index, (key, (rate, burst)) in enumerate(zip(keys, limits), 1):
+        tokens, last, _ = _local_buckets.get(key, (burst, now, now))
+        tokens = min(burst, tokens + max(0, now - last) * rate / 1000)
+        levels.append(tokens)
+        if tokens < 1:
+            retry = -(-(1 - tokens) * 1000 // rate)
+            if retry > wait:
+                wait, blocked = retry, index
+    if blocked:
+        return 0, wait, blocked
+    for key, tokens, (rate, burst) in zip(keys, levels, limits):
+        tokens -= 1
+        _local_buckets[key] = (tokens, now, now + (burst - tokens) * 1000 / rate)
+    return 1, 0, 0
+
+
+async def hit(kind, user_id, hub_id):
+    """
+    Take one ``kind`` token for ``user_id`` in ``hub_id``.
+
+    Returns None when the frame is allowed, otherwise ``(scope, retry_after)``
+    with the bucket that ran dry and the seconds until it has a token again.
+    """
+    global _redis_down
+    if not settings.HUB_RATE_LIMIT_ENABLED:
+        return None
+
+    keys = bucket_keys(kind, user_id, hub_id)
+    limits = _limits(kind)
+    now = int(time.time() * 1000)
+
+    try:
+        script = get_redis().register_script(TAKE_LUA)
+        args = [now] + [value for limit in limits for value in limit]
+        allowed, wait, blocked = await script(keys=list(keys), args=args)
+        if _redis_down:
+            logger.info("Rate limiter is back on Redis")
+            _redis_down = False
+            _local_buckets.clear()
+    except (RedisError, OSError):
+        if not _redis_down:
+            logger.warning("Redis unavailable, rate limiting per worker", exc_info=True)
+            _redis_down = True
+        metrics.incr("ratelimit", "local_fallback")
+        allowed, wait, blocked = _take_local(keys, limits, now)
+
+    if allowed:
+        return None
+    scope = SCOPES[int(blocked) - 1]
+    metrics.incr("ratelimit", f"{kind}_throttled_{scope}")
+    return scope, int(wait) / 1000
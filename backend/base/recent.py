@@ -0,0 +1,294 @@
+"""
+Redis buffer of each hub's newest serialized messages.
+
+``hub:<id>:recent`` is a sorted set of the last HUB_RECENT_MESSAGES messages
+of a hub, scored by seq, exactly as MessageSerializer renders them (nested
+replies included). Entries are found by their seq, so edits and soft
+deletes replace them in place and hard deletes leave harmless gaps.
+
+``hub:<id>:recent:last`` holds the hub's newest seq: new messages are
+appended only if they follow it, anything else (out-of-order writers)
+empties the buffer. ``hub:<id>:recent:from`` is the seq from which the
+buffer holds every message of the hub (0: all of them), so a short page
+can be told apart from a trimmed one.
+
+Opening a hub (the first /messages/ page) is served from the set without
+touching the database. A cold buffer is filled from the database by the
+first reader; writes to a cold buffer are dropped and the next read
+rebuilds it. ``hub:<id>:recent:gen`` counts writes, so a rebuild that raced
+with a write does not store stale data. Hard deletes (views, cascades, the
+admin) evict the message, or empty the buffer when ancestors embed it.
+
+Media and avatar URLs are stored relative to the host and made absolute
+for the reader's request, so entries do not depend on who wrote them.
+"""
+import copy
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from redis.exceptions import RedisError
+
+from . import fastjson, metrics
+from .models import HubMessageCounter, Message
+from .redis_pool import get_redis, get_sync_redis
+from .threads import attach_thread_replies
+
+logger = logging.getLogger(__name__)
+
+# KEYS: entries, last, from, gen | ARGV: seq, message json, size, ttl
+# Returns 1 if applied, 0 if the buffer is cold, -1 if it was reset.
+APPLY_LUA = """
+redis.call('INCR', KEYS[4])
+redis.call('EXPIRE', KEYS[4], ARGV[4])
+local last = tonumber(redis.call('GET', KEYS[2]))
+if not last then
+    return 0
+end
+local seq = tonumber(ARGV[1])
+if seq == last + 1 then
+    redis.call('ZADD', KEYS[1], seq, ARGV[2])
+    redis.call('SET', KEYS[2], seq)
+    if redis.call('ZCARD', KEYS[1]) > tonumber(ARGV[3]) then
+        redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -(tonumber(ARGV[3]) + 1))
+        local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+        redis.call('SET', KEYS[3], oldest[2])
+    end
+elseif seq <= last then
+    -- Only messages still in the window; others were trimmed or deleted
+    if redis.call('ZCOUNT', KEYS[1], seq, seq) > 0 then
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], seq, seq)
+        redis.call('ZADD', KEYS[1], seq, ARGV[2])
+    end
+else
+    redis.call('DEL', KEYS[1], KEYS[2], KEYS[3])
+    return -1
+end
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+redis.call('EXPIRE', KEYS[3], ARGV[4])
+return 1
+"""
+
+# KEYS: entries, last, from, gen | ARGV: seq to remove, or "" to empty the buffer
+EVICT_LUA = """
+redis.call('INCR', KEYS[4])
+if ARGV[1] == '' then
+    redis.call('DEL', KEYS[1], KEYS[2], KEYS[3])
+else
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], ARGV[1], ARGV[1])
+end
+"""
+
+# KEYS: entries, last, from, gen | ARGV: gen seen before loading, last seq, from seq, ttl, seq, json, ...
+# Returns 1 if stored, 0 if a write happened meanwhile.
+FILL_LUA = """
+if (redis.call('GET', KEYS[4]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+if #ARGV > 4 then
+    redis.call('ZADD', KEYS[1], unpack(ARGV, 5))
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+end
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[4])
+redis.call('SET', KEYS[3], ARGV[3], 'EX', ARGV[4])
+return 1
+"""
+
+
+def recent_keys(hub_id):
+    return (
+        f"hub:{hub_id}:recent",
+        f"hub:{hub_id}:recent:last",
+        f"hub:{hub_id}:recent:from",
+        f"hub:{hub_id}:recent:gen",
+    )
+
+
+class RelativeURLs:
+    """
+    Stands in for the request when serializing entries: media and avatar
+    URLs stay relative to the host (see absolute_urls).
+    """
+
+    @staticmethod
+    def build_absolute_uri(location):
+        return location
+
+
+def map_urls(message, convert):
+    """Apply ``convert`` to the URLs of a serialized message and its nested replies."""
+    for field in ("media", "media_url"):
+        if message.get(field):
+            message[field] = convert(message[field])
+    sender = message.get("sender")
+    if isinstance(sender, dict) and sender.get("avatar_url"):
+        sender["avatar_url"] = convert(sender["avatar_url"])
+    for reply in message.get("replies") or ():
+        map_urls(reply, convert)
+    return message
+
+
+def relative_urls(data, request):
+    """``data`` rendered for ``request``, with the URLs on its host made relative."""
+    origin = request.build_absolute_uri("/")[:-1]
+
+    def convert(url):
+        return url[len(origin):] if url.startswith(origin + "/") else url
+
+    return map_urls(data, convert)
+
+
+def absolute_urls(messages, request):
+    """Make the stored relative URLs of ``messages`` absolute for ``request``."""
+    for message in messages:
+        map_urls(message, request.build_absolute_uri)
+    return messages
+
+
+def serialize(messages):
+    from .serializers import MessageSerializer
+
+    # New messages come with their (empty) thread already attached
+    if not all(hasattr(m, "thread_replies") for m in messages):
+        attach_thread_replies(messages)
+    return [
+        fastjson.dumps(data)
+        for data in MessageSerializer(messages, many=True, context={"request": RelativeURLs}).data
+    ]
+
+
+def entries_for(message, data=None, request=None):
+    """
+    Buffer entries to write after ``message`` was created, edited or
+    deleted: the message itself, and every ancestor whose nested replies
+    include it. ``data`` is its serialized form for ``request``, when the
+    caller has it.
+    """
+    if data is None:
+        entries = [(message.seq, serialize([message])[0])]
+    else:
+        entries = [(message.seq, fastjson.dumps(relative_urls(copy.deepcopy(data), request)))]
+
+    ancestors = []
+    parent_id = message.parent_id
+    while parent_id:
+        parent = Message.objects.select_related("sender", "sender__profile").get(id=parent_id)
+        ancestors.append(parent)
+        parent_id = parent.parent_id
+    if ancestors:
+        entries += zip((a.seq for a in ancestors), serialize(ancestors))
+    return entries
+
+
+async def apply(hub_id, entries):
+    """Write (seq, message json) entries to a hub's buffer in one round trip."""
+    client = get_redis()
+    script = client.register_script(APPLY_LUA)
+    pipe = client.pipeline(transaction=False)
+    for seq, text in entries:
+        await script(
+            keys=list(recent_keys(hub_id)),
+            args=[seq, text, settings.HUB_RECENT_MESSAGES, settings.HUB_RECENT_TTL],
+            client=pipe,
+        )
+    results = await pipe.execute()
+    if -1 in results:
+        metrics.incr("recent", "resets")
+
+
+def evict(message):
+    """
+    Take a hard-deleted message out of its hub's buffer once the current
+    transaction commits. A reply is also embedded in its ancestors, which
+    may be going away too: the buffer is emptied and rebuilt on next read.
+    """
+    hub_id, seq = message.hub_id, "" if message.parent_id else message.seq
+
+    def run():
+        try:
+            client = get_sync_redis()
+            client.register_script(EVICT_LUA)(keys=list(recent_keys(hub_id)), args=[seq])
+        except (RedisError, OSError):
+            logger.exception("Could not evict a deleted message from hub %s's buffer", hub_id)
+
+    transaction.on_commit(run)
+
+
+def latest_page(hub_id, limit, request):
+    """
+    The newest ``limit`` messages of a hub, oldest first, as (messages,
+    has_older). Served from the buffer when it is warm, else from the
+    database, refilling the buffer on the way.
+    """
+    entries_key, last_key, from_key, gen_key = recent_keys(hub_id)
+    client = get_sync_redis()
+    pipe = client.pipeline(transaction=False)
+    pipe.get(last_key)
+    pipe.get(from_key)
+    pipe.zrange(entries_key, -limit, -1)
+    pipe.zcard(entries_key)
+    pipe.get(gen_key)
+    try:
+        last, complete_from, cached, size, gen = pipe.execute()
+    except (RedisError, OSError):
+        logger.exception("Recent messages buffer unavailable, reading from the database")
+        client = last = gen = None
+
+    # A short page is only whole if the buffer holds the hub's entire history
+    if last is not None and complete_from is not None and (
+        len(cached) == limit or int(complete_from) == 0
+    ):
+        metrics.incr("recent", "hits")
+        messages = absolute_urls(fastjson.loads("[%s]" % ",".join(cached)), request)
+        return messages, size > len(cached) or int(complete_from) > 0
+
+    metrics.incr("recent", "misses")
+    size = max(limit, settings.HUB_RECENT_MESSAGES)
+    rows, has_more, last = load(hub_id, size)
+    texts = serialize(rows)
+    if client is not None:
+        keep = settings.HUB_RECENT_MESSAGES
+        fill(hub_id, gen, last, rows[-keep:], texts[-keep:], has_more or len(rows) > keep, client)
+
+    page = texts[-limit:]
+    messages = absolute_urls(fastjson.loads("[%s]" % ",".join(page)), request)
+    return messages, has_more or len(texts) > len(page)
+
+
+def load(hub_id, size):
+    """
+    The newest ``size`` messages of a hub, oldest first, whether there are
+    older ones, and the hub's newest seq.
+    """
+    # Read first: messages added while loading must come after it. The
+    # newest message may have been hard deleted, new ones follow the counter.
+    last = HubMessageCounter.objects.filter(hub_id=hub_id).values_list("last_seq", flat=True).first()
+    rows = list(
+        Message.objects.filter(hub_id=hub_id)
+        .select_related("sender", "sender__profile", "parent")
+        .order_by("-seq")[:size + 1]
+    )
+    has_more = len(rows) > size
+    rows = rows[:size]
+    rows.reverse()
+    return rows, has_more, max(last or 0, rows[-1].seq if rows else 0)
+
+
+def fill(hub_id, gen, last, rows, texts, has_older, client=None):
+    """Store ``rows`` (serialized as ``texts``) as the buffer, unless written since ``gen``."""
+    client = client or get_sync_redis()
+    complete_from = rows[0].seq if has_older and rows else 0
+    args = [gen or "0", last, complete_from, settings.HUB_RECENT_TTL]
+    for row, text in zip(rows, texts):
+        args += [row.seq, text]
+    client.register_script(FILL_LUA)(keys=list(recent_keys(hub_id)), args=args)
+
+
+def warm(hub_id):
+    """Rebuild a hub's buffer from the database. Returns the number of messages stored."""
+    gen = get_sync_redis().get(recent_keys(hub_id)[3])
+    rows, has_more, last = load(hub_id, settings.HUB_RECENT_MESSAGES)
+    fill(hub_id, gen, last, rows, serialize(rows), has_more)
+    return len(rows)
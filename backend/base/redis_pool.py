@@ -0,0 +1,89 @@
+import asyncio
+import contextlib
+import socket
+
+import redis as sync_redis
+import redis.asyncio as redis
+from django.conf import settings
+
+from .lifespan import on_shutdown
+
+# One pool per event loop of the worker process, created on first use:
+# asyncio connections are bound to the loop that opened them
+_pools = {}
+_sync_pool = None
+
+
+def _create_pool():
+    return redis.BlockingConnectionPool.from_url(
+        settings.REDIS_URL,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        decode_responses=True,
+    )
+
+
+def get_pool():
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        _discard_closed_loops()
+        pool = _pools[loop] = _create_pool()
+    return pool
+
+
+def _discard_closed_loops():
+    """
+    Drop the pools of event loops that have been closed (e.g. the ones
+    async_to_sync runs management commands on) and hang up their sockets.
+
+    Nothing can be awaited on a closed loop, so ``pool.aclose()`` is out;
+    shutting the sockets down ends the connections now instead of whenever
+    the pool happens to be garbage collected. Pools of loops still running
+    in other threads are left alone.
+    """
+    for loop in [loop for loop in _pools if loop.is_closed()]:
+        pool = _pools.pop(loop)
+        for connection in (*pool._available_connections, *pool._in_use_connections):
+            transport = getattr(connection._writer, "transport", None)
+            if transport is None:
+                continue
+            with contextlib.suppress(OSError):
+                transport.get_extra_info("socket").shutdown(socket.SHUT_RDWR)
+
+
+def get_redis():
+    """
+    Return a Redis client backed by the shared per-process pool.
+
+    Clients are cheap and need no closing; connections are borrowed from
+    the pool per command and returned immediately. When the pool is
+    exhausted callers wait up to REDIS_POOL_TIMEOUT seconds instead of
+    opening more sockets.
+    """
+    return redis.Redis(connection_pool=get_pool())
+
+
+def get_sync_redis():
+    """
+    Blocking client for Django views and management commands.
+
+    Views are called through async_to_sync from fresh event loops outside
+    ASGI, so they use a thread-safe blocking pool instead of the async one.
+    """
+    global _sync_pool
+    if _sync_pool is None:
+        _sync_pool = sync_redis.BlockingConnectionPool.from_url(
+            settings.REDIS_URL,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+            decode_responses=True,
+        )
+    return sync_redis.Redis(connection_pool=_sync_pool)
+
+
+@on_shutdown
+async def close_pool():
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.aclose()
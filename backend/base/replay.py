@@ -0,0 +1,105 @@
+"""
+Per-hub recent-events buffer for resumable WebSocket sessions.
+
+Chat, edit and delete broadcasts are stamped with a per-hub event id
+(``eid``) and kept in the sorted set ``hub:<id>:events`` (bounded to
+HUB_REPLAY_BUFFER_SIZE entries). A client reconnecting with
+``?since=<last eid>`` gets everything it missed in one ``replay`` frame; if
+the gap is older than the buffer it is told to reload from the database.
+"""
+import json
+
+from django.conf import settings
+
+from .broadcast import encode_frame, group_send_frame, group_send_frame_sync
+from .redis_pool import get_redis, get_sync_redis
+
+# KEYS: seq, buffer | ARGV: frame json, buffer size, ttl
+# Stamps the frame with the next eid inside the JSON object and stores it.
+RECORD_LUA = """
+local eid = redis.call('INCR', KEYS[1])
+local frame = string.sub(ARGV[1], 1, -2) .. ',"eid":' .. eid .. '}'
+redis.call('ZADD', KEYS[2], eid, frame)
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -(tonumber(ARGV[2]) + 1))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return {eid, frame}
+"""
+
+
+def replay_keys(hub_id):
+    return (
+        f"hub:{hub_id}:events:seq",
+        f"hub:{hub_id}:events",
+    )
+
+
+def _record_args(hub_id, data):
+    return {
+        "keys": list(replay_keys(hub_id)),
+        "args": [encode_frame(data), settings.HUB_REPLAY_BUFFER_SIZE, settings.HUB_REPLAY_TTL],
+    }
+
+
+async def publish(hub_id, data, channel_layer=None):
+    """Record a replayable hub event and broadcast it. Returns its eid."""
+    script = get_redis().register_script(RECORD_LUA)
+    eid, frame = await script(**_record_args(hub_id, data))
+    await group_send_frame(f"hub_{hub_id}", channel_layer=channel_layer, text=frame, eid=eid)
+    return eid
+
+
+async def record_many(hub_id, frames):
+    """
+    Stamp and store several encoded frames of one hub in a single round
+    trip. Returns the (eid, stamped frame) pairs in order.
+    """
+    script = get_redis().register_script(RECORD_LUA)
+    pipe = get_redis().pipeline(transaction=False)
+    for frame in frames:
+        await script(
+            keys=list(replay_keys(hub_id)),
+            args=[frame, settings.HUB_REPLAY_BUFFER_SIZE, settings.HUB_REPLAY_TTL],
+            client=pipe,
+        )
+    return [(int(eid), stamped) for eid, stamped in await pipe.execute()]
+
+
+def publish_sync(hub_id, data):
+    """Blocking variant of publish() for Django/DRF views."""
+    script = get_sync_redis().register_script(RECORD_LUA)
+    eid, frame = script(**_record_args(hub_id, data))
+    group_send_frame_sync(f"hub_{hub_id}", text=frame, eid=eid)
+    return eid
+
+
+async def last_eid(hub_id):
+    return int(await get_redis().get(replay_keys(hub_id)[0]) or 0)
+
+
+async def replay_frame(hub_id, since):
+    """
+    Build the ``replay`` frame text for a client that last saw ``since``.
+
+    Stored frames are already encoded, so they are spliced into the batch
+    without decoding. ``reset`` tells the client its gap is no longer
+    covered by the buffer and it must reload history over REST.
+    """
+    seq_key, buffer_key = replay_keys(hub_id)
+    pipe = get_redis().pipeline(transaction=True)
+    pipe.get(seq_key)
+    pipe.zrange(buffer_key, 0, 0, withscores=True)
+    pipe.zrangebyscore(buffer_key, f"({since}", "+inf")
+    current, oldest, frames = await pipe.execute()
+    current = int(current or 0)
+
+    reset = since > current or (
+        since < current and (not oldest or int(oldest[0][1]) > since + 1)
+    )
+    if reset:
+        frames = []
+
+    return (
+        '{"type": "replay", "reset": %s, "last_eid": %d, "events": [%s]}'
+        % (json.dumps(reset), current, ", ".join(frames))
+    )
@@ -1,7 +1,8 @@
 # routing.py
 from django.urls import path
-from .consumers import HubChatConsumer
+from .consumers import HubChatConsumer, UserSocketConsumer
 
 websocket_urlpatterns = [
     path("ws/hub/<int:hub_id>/", HubChatConsumer.as_asgi()),
+    path("ws/user/", UserSocketConsumer.as_asgi()),
 ]
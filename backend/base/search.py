@@ -0,0 +1,258 @@
+"""
+Full-text search over hub messages.
+
+Backed by the database's own inverted index (migration 0011): an FTS5
+table on SQLite, a generated tsvector column with a GIN index on
+PostgreSQL. Both are maintained by the database on every insert, edit and
+soft delete. Other databases fall back to a substring scan.
+
+Note for SQLite: a migration that rebuilds base_message (SQLite's way of
+altering a column) drops the FTS triggers. restore_sqlite_triggers() runs
+after every migrate (see signals.py) and puts back any that are missing.
+
+Queries are reduced to words, all of which must match. The last word is a
+prefix, so results follow the user as they type. Results are ranked (bm25 /
+ts_rank_cd) among the newest HUB_SEARCH_CANDIDATES matches and come with a
+highlighted snippet. The snippet is
+HTML-escaped, with matches wrapped in <mark>.
+"""
+import html
+import logging
+import re
+
+from django.conf import settings
+from django.db import connection, connections
+
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+MAX_WORDS = 8
+
+# Private-use markers, turned into <mark> after the snippet is escaped
+MARK_START, MARK_END = "\ue000", "\ue001"
+SNIPPET_WORDS = 24
+
+# Ranking every match of a common word does not scale, so only the newest
+# HUB_SEARCH_CANDIDATES matches (a cheap index walk in id order) are ranked;
+# an older, better match can be missed. The candidate count tells the caller
+# when that happened (see search()).
+# bm25 is lower for better matches; negated so both backends rank high = good.
+SQLITE_SQL = """
+    SELECT id, rank, COUNT(*) OVER () FROM (
+        SELECT m.id, -bm25(base_message_fts) AS rank
+        FROM base_message_fts
+        JOIN base_message m ON m.id = base_message_fts.rowid
+        WHERE base_message_fts MATCH %s {hubs}
+        ORDER BY base_message_fts.rowid DESC
+        LIMIT %s
+    )
+    ORDER BY rank DESC, id DESC
+    LIMIT %s OFFSET %s
+"""
+
+# Headlines are only built for the page that is returned
+POSTGRES_SQL = f"""
+    SELECT hit.id, hit.rank,
+           ts_headline('simple', m.content, hit.query,
+                       'StartSel={MARK_START}, StopSel={MARK_END}, MaxWords=35, MinWords=15, MaxFragments=2'),
+           hit.candidates
+    FROM (
+        SELECT id, ts_rank_cd(search_vector, query) AS rank, query, COUNT(*) OVER () AS candidates
+        FROM (
+            SELECT m.id, m.search_vector, q.query
+            FROM base_message m, to_tsquery('simple', %s) AS q(query)
+            WHERE m.search_vector @@ q.query {{hubs}}
+            ORDER BY m.id DESC
+            LIMIT %s
+        ) candidate
+        ORDER BY rank DESC, id DESC
+        LIMIT %s OFFSET %s
+    ) hit
+    JOIN base_message m ON m.id = hit.id
+    ORDER BY hit.rank DESC, hit.id DESC
+"""
+
+
+# As created by migration 0011
+SQLITE_TRIGGERS = {
+    "base_message_fts_ai": """
+        CREATE TRIGGER base_message_fts_ai AFTER INSERT ON base_message BEGIN
+            INSERT INTO base_message_fts(rowid, content)
+            SELECT new.id, new.content WHERE new.content IS NOT NULL AND NOT new.is_deleted;
+        END
+    """,
+    "base_message_fts_ad": """
+        CREATE TRIGGER base_message_fts_ad AFTER DELETE ON base_message BEGIN
+            INSERT INTO base_message_fts(base_message_fts, rowid, content)
+            SELECT 'delete', old.id, old.content WHERE old.content IS NOT NULL AND NOT old.is_deleted;
+        END
+    """,
+    "base_message_fts_au": """
+        CREATE TRIGGER base_message_fts_au AFTER UPDATE OF content, is_deleted ON base_message BEGIN
+            INSERT INTO base_message_fts(base_message_fts, rowid, content)
+            SELECT 'delete', old.id, old.content WHERE old.content IS NOT NULL AND NOT old.is_deleted;
+            INSERT INTO base_message_fts(rowid, content)
+            SELECT new.id, new.content WHERE new.content IS NOT NULL AND NOT new.is_deleted;
+        END
+    """,
+}
+
+# Writes made while a trigger was missing are not indexed: start over
+SQLITE_REINDEX = [
+    "INSERT INTO base_message_fts(base_message_fts) VALUES ('delete-all')",
+    """
+    INSERT INTO base_message_fts(rowid, content)
+    SELECT id, content FROM base_message WHERE content IS NOT NULL AND NOT is_deleted
+    """,
+]
+
+
+def query_words(text):
+    return WORD_RE.findall(text or "")[:MAX_WORDS]
+
+
+def fts5_query(words):
+    terms = ['"%s"' % w for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def tsquery(words):
+    return " & ".join(words[:-1] + [words[-1] + ":*"])
+
+
+def highlight(snippet):
+    return (
+        html.escape(snippet or "")
+        .replace(MARK_START, "<mark>")
+        .replace(MARK_END, "</mark>")
+    )
+
+
+def snippet(content, words, size=SNIPPET_WORDS):
+    """
+    Up to ``size`` words of ``content`` around the first match, with the
+    matched words marked, the way the index matched them (last one as prefix).
+    """
+    words = [w.casefold() for w in words]
+    *whole, prefix = words
+
+    def matches(token):
+        token = token.casefold()
+        return token in whole or token.startswith(prefix)
+
+    tokens = list(WORD_RE.finditer(content or ""))
+    first = next((i for i, t in enumerate(tokens) if matches(t.group())), 0)
+    start_token = max(0, min(first - size // 4, len(tokens) - size))
+    window = tokens[start_token:start_token + size]
+    if not window:
+        return content or ""
+
+    start = 0 if start_token == 0 else window[0].start()
+    end = len(content) if start_token + size >= len(tokens) else window[-1].end()
+    parts, position = [], start
+    for token in window:
+        if matches(token.group()):
+            parts += [content[position:token.start()], MARK_START, token.group(), MARK_END]
+            position = token.end()
+    parts.append(content[position:end])
+    return ("…" if start else "") + "".join(parts) + ("…" if end < len(content) else "")
+
+
+def search(text, hub_ids=None, limit=20, offset=0):
+    """
+    Messages matching ``text``, best first. ``hub_ids`` limits the search to
+    those hubs (None: all).
+
+    Returns ``(hits, ranked_newest)``: a list of (Message, rank, snippet
+    html), and the number of newest matches ranked when there were too many
+    to rank them all (older ones may match better), else None.
+    """
+    words = query_words(text)
+    if hub_ids is not None:
+        hub_ids = [int(h) for h in hub_ids]
+        if not hub_ids:
+            return [], None
+    if not words:
+        return [], None
+
+    vendor = connection.vendor
+    candidates = max(settings.HUB_SEARCH_CANDIDATES, offset + limit)
+    with connection.cursor() as cursor:
+        if vendor == "sqlite":
+            if hub_ids is None:
+                sql, params = SQLITE_SQL.format(hubs=""), []
+            else:
+                placeholders = ", ".join(["%s"] * len(hub_ids))
+                sql, params = SQLITE_SQL.format(hubs=f"AND m.hub_id IN ({placeholders})"), hub_ids
+            cursor.execute(sql, [fts5_query(words), *params, candidates, limit, offset])
+            # FTS5's snippet() would run the (prefix) match again per row
+            hits = [(message_id, rank, None, found) for message_id, rank, found in cursor.fetchall()]
+        elif vendor == "postgresql":
+            if hub_ids is None:
+                sql, params = POSTGRES_SQL.format(hubs=""), []
+            else:
+                sql, params = POSTGRES_SQL.format(hubs="AND m.hub_id = ANY(%s)"), [hub_ids]
+            cursor.execute(sql, [tsquery(words), *params, candidates, limit, offset])
+            hits = cursor.fetchall()
+        else:
+            hits = None
+
+    if hits is None:
+        messages = Message.objects.filter(is_deleted=False)
+        if hub_ids is not None:
+            messages = messages.filter(hub_id__in=hub_ids)
+        for word in words:
+            messages = messages.filter(content__icontains=word)
+        messages = messages.select_related("sender").order_by("-seq")[offset:offset + limit]
+        # Newest first, nothing ranked
+        return [(m, None, highlight(snippet(m.content, words))) for m in messages], None
+
+    # Every row carries the candidate count; a full window may have left some out
+    ranked_newest = candidates if hits and hits[0][3] >= candidates else None
+    messages = Message.objects.select_related("sender").in_bulk([hit[0] for hit in hits])
+    results = []
+    for message_id, rank, text, _ in hits:
+        if message_id in messages:
+            message = messages[message_id]
+            if text is None:
+                text = snippet(message.content, words)
+            results.append((message, rank, highlight(text)))
+    return results, ranked_newest
+
+
+def matching_ids(text, hub_ids=None, limit=1000):
+    """Ids of the best matches, for filtering querysets (e.g. the Django admin)."""
+    hits, _ = search(text, hub_ids, limit=limit)
+    return [m.id for m, _, _ in hits]
+
+
+def missing_sqlite_triggers(using="default"):
+    """
+    Names of the FTS triggers missing from a SQLite database that has the
+    index. Empty on other databases, or before migration 0011.
+    """
+    db = connections[using]
+    if db.vendor != "sqlite":
+        return []
+    with db.cursor() as cursor:
+        cursor.execute("SELECT type, name FROM sqlite_master WHERE name LIKE 'base_message_fts%'")
+        found = set(cursor.fetchall())
+    if ("table", "base_message_fts") not in found:
+        return []
+    return [name for name in SQLITE_TRIGGERS if ("trigger", name) not in found]
+
+
+def restore_sqlite_triggers(using="default"):
+    """Recreate missing FTS triggers and reindex. Returns the names restored."""
+    missing = missing_sqlite_triggers(using)
+    if missing:
+        logger.warning("Restoring dropped search index triggers: %s", ", ".join(missing))
+        with connections[using].cursor() as cursor:
+            for name in missing:
+                cursor.execute(SQLITE_TRIGGERS[name])
+            for sql in SQLITE_REINDEX:
+                cursor.execute(sql)
+    return missing
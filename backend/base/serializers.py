@@ -1,7 +1,21 @@
 from rest_framework import serializers
+from . import access
 from .models import Hub, HubMembership, Message, Event
 
-class HubSerializer(serializers.ModelSerializer):
+
+class HubRoleMixin:
+    """Resolves the request user's hub roles once per serialization (list or single)."""
+
+    def hub_role(self, hub_id):
+        request = self.context.get("request")
+        if not request or request.user.is_anonymous:
+            return None
+        if "hub_roles" not in self.context:
+            self.context["hub_roles"] = access.user_roles(request.user)
+        return self.context["hub_roles"].get(hub_id, access.NONE)
+
+
+class HubSerializer(HubRoleMixin, serializers.ModelSerializer):
     admin = serializers.StringRelatedField(read_only=True)
     membership_status = serializers.SerializerMethodField()
     members_count = serializers.IntegerField(read_only=True)
@@ -12,22 +26,7 @@ class HubSerializer(serializers.ModelSerializer):
         fields = ["id", "name", "description", "admin", "image", "members_count", "image_url", "membership_status"]
 
     def get_membership_status(self, obj):
-        request = self.context.get("request")
-        if not request or request.user.is_anonymous:
-            return None
-
-        if obj.admin == request.user:
-            return "approved"
-
-        membership = HubMembership.objects.filter(
-            hub=obj,
-            user=request.user
-        ).first()
-
-        if not membership:
-            return None
-
-        return "approved" if membership.is_approved else "pending"
+        return access.membership_status(self.hub_role(obj.id))
 
 
     
@@ -93,6 +92,7 @@ class MessageSerializer(serializers.ModelSerializer):
             "media_url",
             "parent_id",
             "replies",  
+            "seq",
             "timestamp",
             "is_deleted",
             "is_edited",
@@ -106,8 +106,13 @@ class MessageSerializer(serializers.ModelSerializer):
         return None
 
     def get_replies(self, obj):
+        # Threads assembled by base.threads.attach_thread_replies carry their
+        # replies in memory; fall back to a query for one-off instances.
+        replies = getattr(obj, "thread_replies", None)
+        if replies is None:
+            replies = obj.replies.select_related("sender").order_by("seq")
         return MessageSerializer(
-            obj.replies.select_related("sender").order_by("timestamp"),
+            replies,
             many=True,
             context=self.context,
         ).data
@@ -135,12 +140,11 @@ class MessageSerializer(serializers.ModelSerializer):
         return data
 
 
-class EventSerializer(serializers.ModelSerializer):
-    attendees_count = serializers.SerializerMethodField()
+class EventSerializer(HubRoleMixin, serializers.ModelSerializer):
     user_attending = serializers.SerializerMethodField()
     attendees = serializers.SerializerMethodField()
     hub_name = serializers.CharField(source="hub.name", read_only=True)
-    hub_admin_id = serializers.IntegerField(source="hub.admin.id", read_only=True)
+    hub_admin_id = serializers.IntegerField(source="hub.admin_id", read_only=True)
     membership_status = serializers.SerializerMethodField()
     image = serializers.ImageField(required=False, allow_null=True)
     created_by_username = serializers.CharField(
@@ -183,10 +187,11 @@ class EventSerializer(serializers.ModelSerializer):
         allow_blank=True
     )
 
-    def get_attendees_count(self, obj):
-        return obj.attendances.filter(attending=True).count()
+    # Listings annotate these (base.event_listing); one-off instances query
 
     def get_user_attending(self, obj):
+        if hasattr(obj, "user_attending"):
+            return obj.user_attending
         request = self.context.get("request")
         if not request or request.user.is_anonymous:
             return False
@@ -197,28 +202,21 @@ class EventSerializer(serializers.ModelSerializer):
     
     
     def get_membership_status(self, obj):
-        request = self.context.get("request")
-        if not request or request.user.is_anonymous:
-            return None
-
-        # Check if user is member of the hub for this event
-        membership = HubMembership.objects.filter(
-            hub=obj.hub,
-            user=request.user
-        ).first()
-
-        if not membership:
-            return None
-
-        return "approved" if membership.is_approved else "pending"
+        return access.membership_status(self.hub_role(obj.hub_id))
     
     def get_attendees(self, obj):
+        users = getattr(obj, "top_attendees", None)
+        if users is None:
+            users = [
+                a.user
+                for a in obj.attendances.filter(attending=True).select_related("user").order_by("id")[:5]
+            ]
         return [
             {
-                "id": a.user.id,
-                "name": a.user.get_full_name() or a.user.username,
+                "id": user.id,
+                "name": user.get_full_name() or user.username,
             }
-            for a in obj.attendances.filter(attending=True)[:5]
+            for user in users
         ]
     def get_image_url(self, obj):
         request = self.context.get("request")
@@ -239,6 +237,6 @@ class EventDetailSerializer(EventSerializer):
     def get_attendees(self, obj):
         return [
             att.user.username
-            for att in obj.attendances.filter(attending=True)
+            for att in obj.attendances.filter(attending=True).select_related("user")
         ]
 
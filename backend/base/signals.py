@@ -0,0 +1,67 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from . import access, attendance, dashboard, recent, search
+from .models import BanHistory, Event, EventAttendance, Hub, HubMembership, Message
+
+
+# Join requests, approvals, denials, leaving and bans all end up here
+@receiver(post_save, sender=HubMembership)
+@receiver(post_delete, sender=HubMembership)
+@receiver(post_save, sender=BanHistory)
+@receiver(post_delete, sender=BanHistory)
+def membership_changed(sender, instance, **kwargs):
+    access.invalidate(instance.user_id)
+    # Member counts and the caller's membership statuses
+    dashboard.invalidate()
+
+
+@receiver(pre_save, sender=Hub)
+def remember_hub_admin(sender, instance, **kwargs):
+    if instance.pk:
+        instance._previous_admin_id = (
+            Hub.objects.filter(pk=instance.pk).values_list("admin_id", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Hub)
+@receiver(post_delete, sender=Hub)
+def hub_changed(sender, instance, **kwargs):
+    access.invalidate(instance.admin_id, getattr(instance, "_previous_admin_id", None))
+
+
+# Attendance rows removed by a cascade (user or event deleted) or the admin
+@receiver(post_delete, sender=EventAttendance)
+def attendance_deleted(sender, instance, **kwargs):
+    if instance.attending:
+        attendance.adjust(instance.event_id, -1)
+
+
+@receiver(post_save, sender=Hub)
+@receiver(post_delete, sender=Hub)
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def dashboard_data_changed(sender, instance, **kwargs):
+    dashboard.invalidate()
+
+
+# The user total; logins save users too, but do not change it
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_count_changed(sender, instance, created=True, **kwargs):
+    if created:
+        dashboard.invalidate()
+
+
+# Hard deletes: the view's destroy, cascades from users and hubs, the admin
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, **kwargs):
+    recent.evict(instance)
+
+
+# A later migration rebuilding base_message on SQLite drops the search triggers
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    if sender.name == "base":
+        search.restore_sqlite_triggers(using)
@@ -1,3 +1,1396 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+from datetime import date, datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import fakeredis
+import fakeredis.aioredis
+import msgpack
+import redis
+import redis.asyncio
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from channels_redis.core import RedisChannelLayer
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import (
+    access, attendance, dashboard, event_calendar, fastjson, metrics, notifications, outbound, outbox,
+    presence, ratelimit, redis_pool, replay, search, typing_indicators,
+)
+from .broadcast import MSGPACK_SUBPROTOCOL
+from .channel_layer import HybridChannelLayer
+from .message_writer import persist_batch
+from .models import BroadcastOutbox, Event, EventAttendance, Hub, HubMembership, Message
+from .routing import websocket_urlpatterns
+from .signals import restore_search_triggers
+
+# No Redis server in tests: the Django cache and channel layer stay in process,
+# base.redis_pool is pointed at a fakeredis server per test (FakeRedisMixin).
+TEST_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+TEST_CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+def fake_redis_host(server):
+    """channels_redis host config for a fakeredis server."""
+    return {"connection_class": fakeredis.aioredis.FakeConnection, "server": server}
+
+
+class FakeRedisMixin:
+    def setUp(self):
+        super().setUp()
+        self.redis_server = fakeredis.FakeServer()
+        self.patch_pools(self.redis_server)
+
+    def tearDown(self):
+        redis_pool._create_pool = self._create_pool
+        redis_pool._pools.clear()
+        redis_pool._sync_pool = None
+        super().tearDown()
+
+    def patch_pools(self, server):
+        self._create_pool = redis_pool._create_pool
+        redis_pool._create_pool = lambda: redis.asyncio.ConnectionPool(
+            connection_class=fakeredis.aioredis.FakeConnection,
+            server=server,
+            decode_responses=True,
+        )
+        redis_pool._pools.clear()
+        redis_pool._sync_pool = redis.ConnectionPool(
+            connection_class=fakeredis.FakeConnection,
+            server=server,
+            decode_responses=True,
+        )
+
+
+async def open_socket(user, path, subprotocols=None):
+    communicator = WebsocketCommunicator(
+        URLRouter(websocket_urlpatterns), path, subprotocols=subprotocols
+    )
+    communicator.scope["user"] = user
+    connected, communicator.subprotocol = await communicator.connect()
+    assert connected, path
+    return communicator
+
+
+async def wait_for_frame(communicator, match, timeout=2):
+    """Read frames until one satisfies ``match``; fail after ``timeout`` seconds."""
+    async def read():
+        while True:
+            frame = fastjson.loads(await communicator.receive_from(timeout))
+            if match(frame):
+                return frame
+
+    return await asyncio.wait_for(read(), timeout)
+
+
+@override_settings(CACHES=TEST_CACHES, CHANNEL_LAYERS=TEST_CHANNEL_LAYERS)
+class PresenceTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("alice")
+        self.hub = Hub.objects.create(name="hub", admin=self.user)
+
+    def test_heartbeat_after_sweep_reports_back_online(self):
+        join = async_to_sync(presence.join)
+        heartbeat = async_to_sync(presence.heartbeat)
+
+        self.assertTrue(join(self.hub.id, self.user, "chan.1"))
+        self.assertFalse(heartbeat(self.hub.id, self.user, "chan.1"))
+
+        # A sweep that sees the socket as stale takes the user offline...
+        with override_settings(HUB_PRESENCE_TTL=-60):
+            async_to_sync(presence.sweep)(None)
+        self.assertEqual(async_to_sync(presence.online_users)(self.hub.id), [])
+
+        # ...and the next heartbeat of the still open socket brings them back
+        self.assertTrue(heartbeat(self.hub.id, self.user, "chan.1"))
+        self.assertFalse(heartbeat(self.hub.id, self.user, "chan.1"))
+        self.assertEqual(
+            async_to_sync(presence.online_users)(self.hub.id),
+            [{"id": self.user.id, "username": "alice"}],
+        )
+
+    def test_heartbeat_of_second_tab_is_not_a_transition(self):
+        join = async_to_sync(presence.join)
+        self.assertTrue(join(self.hub.id, self.user, "chan.1"))
+        self.assertFalse(join(self.hub.id, self.user, "chan.2"))
+        self.assertFalse(async_to_sync(presence.heartbeat)(self.hub.id, self.user, "chan.2"))
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    CHANNEL_LAYERS=TEST_CHANNEL_LAYERS,
+    HUB_PRESENCE_HEARTBEAT_INTERVAL=0.05,
+)
+class PresenceSocketTests(FakeRedisMixin, TransactionTestCase):
+    def test_heartbeat_re_announces_a_swept_socket(self):
+        alice = User.objects.create_user("alice")
+        bob = User.objects.create_user("bob")
+        hub = Hub.objects.create(name="hub", admin=alice)
+        HubMembership.objects.create(hub=hub, user=bob, is_approved=True)
+
+        async def scenario():
+            watcher = await open_socket(bob, f"/ws/hub/{hub.id}/")
+            socket = await open_socket(alice, f"/ws/hub/{hub.id}/")
+            try:
+                def alice_went(action):
+                    return lambda f: f.get("type") == "presence" and f["action"] == action \
+                        and f["user"]["username"] == "alice"
+
+                await wait_for_frame(watcher, alice_went("online"))
+                # Everyone looks stale to this sweep, e.g. after a stalled loop
+                with override_settings(HUB_PRESENCE_TTL=-60):
+                    await presence.sweep(None)
+                await wait_for_frame(watcher, alice_went("offline"))
+                # alice's socket is still open: its next heartbeat says so
+                await wait_for_frame(watcher, alice_went("online"))
+            finally:
+                await socket.disconnect()
+                await watcher.disconnect()
+
+        async_to_sync(scenario)()
+
+
+@override_settings(CACHES=TEST_CACHES, CHANNEL_LAYERS=TEST_CHANNEL_LAYERS)
+class MessageSeqTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("alice")
+        self.hub = Hub.objects.create(name="hub", admin=self.user)
+
+    def post(self, content):
+        return Message.objects.create(hub=self.hub, sender=self.user, content=content)
+
+    def test_saving_a_stale_hub_does_not_rewind_the_counter(self):
+        stale = Hub.objects.get(pk=self.hub.pk)
+        self.assertEqual(self.post("one").seq, 1)
+        stale.description = "edited elsewhere"
+        stale.save()
+        self.assertEqual(self.post("two").seq, 2)
+        self.assertEqual(self.post("three").seq, 3)
+
+    def test_batches_reserve_consecutive_seqs(self):
+        self.post("one")
+        items = [
+            {"hub_id": self.hub.id, "sender": self.user, "content": str(i), "parent_id": None}
+            for i in range(3)
+        ]
+        self.assertEqual([m.seq for m in persist_batch(items)], [2, 3, 4])
+        self.assertEqual(self.post("five").seq, 5)
+
+
+@override_settings(CACHES=TEST_CACHES, CHANNEL_LAYERS=TEST_CHANNEL_LAYERS)
+class SuperuserScopeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user("owner")
+        self.member = User.objects.create_user("member")
+        self.root = User.objects.create_superuser("root", password="x")
+        self.hub = Hub.objects.create(name="hub", admin=self.owner)
+        self.other = Hub.objects.create(name="other", admin=self.owner)
+        HubMembership.objects.create(hub=self.hub, user=self.member, is_approved=True)
+        for hub in (self.hub, self.other):
+            Message.objects.create(hub=hub, sender=self.owner, content=f"picnic in {hub.name}")
+            Event.objects.create(
+                hub=hub, title=hub.name, created_by=self.owner,
+                start_time=timezone.now() + timedelta(days=1),
+            )
+
+    def get(self, user, url, **params):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(url, params)
+
+    def test_member_hub_ids(self):
+        self.assertEqual(access.member_hub_ids(self.member), [self.hub.id])
+        self.assertIsNone(access.member_hub_ids(self.root))
+
+    def test_search_covers_every_hub_for_superusers(self):
+        hits = self.get(self.root, "/api/messages/search/", q="picnic").json()["results"]
+        self.assertEqual({hit["hub"] for hit in hits}, {self.hub.id, self.other.id})
+        response = self.get(self.root, "/api/messages/search/", q="picnic", hub=self.other.id)
+        self.assertEqual([hit["hub"] for hit in response.json()["results"]], [self.other.id])
+
+    def test_search_stays_scoped_for_members(self):
+        hits = self.get(self.member, "/api/messages/search/", q="picnic").json()["results"]
+        self.assertEqual([hit["hub"] for hit in hits], [self.hub.id])
+        response = self.get(self.member, "/api/messages/search/", q="picnic", hub=self.other.id)
+        self.assertEqual(response.status_code, 403)
+
+    def test_event_listings_cover_every_hub_for_superusers(self):
+        day = (timezone.now() + timedelta(days=1)).date().isoformat()
+        for url in ("/api/events/upcoming/", "/api/events/calendar/"):
+            member_view = self.get(self.member, url, view="week", date=day).json()
+            root_view = self.get(self.root, url, view="week", date=day).json()
+            if url.endswith("calendar/"):
+                member_view = [e for day in member_view["days"] for e in day["events"]]
+                root_view = [e for day in root_view["days"] for e in day["events"]]
+            self.assertEqual(len(member_view), 1, url)
+            self.assertEqual(len(root_view), 2, url)
+
+
+@override_settings(CACHES=TEST_CACHES, CHANNEL_LAYERS=TEST_CHANNEL_LAYERS)
+class NotificationOutboxTests(TestCase):
+    def test_views_hand_notifications_to_the_outbox(self):
+        admin = User.objects.create_user("admin")
+        member = User.objects.create_user("member")
+        hub = Hub.objects.create(name="hub", admin=admin)
+        HubMembership.objects.create(hub=hub, user=member, is_approved=True)
+
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(notifications.user_group(member.id), channel)
+
+        client = APIClient()
+        client.force_authenticate(admin)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = client.post(f"/api/hubs/{hub.id}/ban_member/", {"user_id": member.id})
+        self.assertEqual(response.status_code, 200)
+        # The request only wrote a row
+        row = BroadcastOutbox.objects.get()
+        self.assertEqual((row.hub_id, row.user_id, row.revoke_hub), (None, member.id, hub.id))
+
+        # Outside a server loop the commit drains the outbox inline
+        for callback in callbacks:
+            callback()
+        event = async_to_sync(layer.receive)(channel)
+        self.assertEqual(event["revoke_hub"], hub.id)
+        frame = fastjson.loads(event["text"])
+        self.assertEqual((frame["type"], frame["kind"], frame["hub"]), ("notification", "banned", hub.id))
+        self.assertFalse(BroadcastOutbox.objects.exists())
+
+
+class HybridChannelLayerTests(SimpleTestCase):
+    def setUp(self):
+        self.redis_server = fakeredis.FakeServer()
+
+    def layer(self, layer_class=HybridChannelLayer):
+        return layer_class(hosts=[fake_redis_host(self.redis_server)])
+
+    def queued_in_redis(self, layer):
+        """Whether anything waits in Redis for ``layer``'s channels."""
+        client = fakeredis.FakeRedis(server=self.redis_server)
+        return bool(client.keys(f"*{layer.client_prefix}!*"))
+
+    def test_group_send_reaches_local_and_remote_members(self):
+        async def scenario():
+            worker, other, stock = self.layer(), self.layer(), self.layer(RedisChannelLayer)
+            members = []
+            for layer in (worker, worker, other, stock):
+                channel = await layer.new_channel()
+                await layer.group_add("hub_1", channel)
+                members.append((layer, channel))
+            try:
+                async def receive_all():
+                    return [await asyncio.wait_for(layer.receive(channel), 2) for layer, channel in members]
+
+                await worker.group_send("hub_1", {"type": "ws.frame", "text": "from hybrid"})
+                # Only the other workers' members went through Redis
+                self.assertFalse(self.queued_in_redis(worker))
+                self.assertTrue(self.queued_in_redis(other))
+                received = await receive_all()
+                self.assertEqual([event["text"] for event in received], ["from hybrid"] * 4)
+                # Delivered locally: members never share an event dict
+                self.assertIsNot(received[0], received[1])
+
+                # Workers still on the stock layer reach everyone too
+                await stock.group_send("hub_1", {"type": "ws.frame", "text": "from stock"})
+                self.assertEqual([event["text"] for event in await receive_all()], ["from stock"] * 4)
+            finally:
+                for layer in (worker, other, stock):
+                    await layer.close_pools()
+
+        async_to_sync(scenario)()
+
+    def test_local_channels_receive_direct_sends_from_other_workers(self):
+        async def scenario():
+            worker, other = self.layer(), self.layer()
+            channel = await worker.new_channel()
+            try:
+                await other.send(channel, {"type": "ws.frame", "text": "via redis"})
+                await worker.send(channel, {"type": "ws.frame", "text": "local"})
+                texts = {(await asyncio.wait_for(worker.receive(channel), 2))["text"] for _ in range(2)}
+                self.assertEqual(texts, {"via redis", "local"})
+            finally:
+                await worker.close_pools()
+                await other.close_pools()
+
+        async_to_sync(scenario)()
+
+    def test_group_discard_stops_local_delivery(self):
+        async def scenario():
+            worker = self.layer()
+            kept, dropped = await worker.new_channel(), await worker.new_channel()
+            try:
+                for channel in (kept, dropped):
+                    await worker.group_add("hub_1", channel)
+                await worker.group_discard("hub_1", dropped)
+                await worker.group_send("hub_1", {"type": "ws.frame", "text": "after"})
+
+                self.assertEqual((await asyncio.wait_for(worker.receive(kept), 2))["text"], "after")
+                self.assertNotIn(dropped, worker.receive_buffer)
+                self.assertEqual(await fakeredis.aioredis.FakeRedis(server=self.redis_server).zcard(
+                    worker._group_key("hub_1")
+                ), 1)
+            finally:
+                await worker.close_pools()
+
+        async_to_sync(scenario)()
+
+
+class RedisPoolTests(SimpleTestCase):
+    def setUp(self):
+        # A real socket to hang up: fakeredis served over TCP
+        self.server = fakeredis.TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host, port = self.server.server_address
+        self.settings = override_settings(REDIS_URL=f"redis://{host}:{port}/0")
+        self.settings.enable()
+        self.admin = redis.Redis(host, port)
+        redis_pool._pools.clear()
+
+    def tearDown(self):
+        redis_pool._pools.clear()
+        self.admin.close()
+        self.settings.disable()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def clients(self):
+        return len(self.admin.client_list())
+
+    def test_each_loop_gets_its_own_pool_and_closed_loops_are_hung_up(self):
+        async def ping():
+            await redis_pool.get_redis().ping()
+            return redis_pool.get_pool()
+
+        async def two_pings():
+            return await ping(), await ping()
+
+        first, again = async_to_sync(two_pings)()
+        self.assertIs(first, again)
+        # The first loop is closed, its connection still open
+        self.assertEqual(self.clients(), 2)
+
+        second = async_to_sync(ping)()
+        self.assertIsNot(second, first)
+        self.assertEqual(list(redis_pool._pools.values()), [second])
+        deadline = time.monotonic() + 2
+        while self.clients() > 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # Only the second loop's connection is left, besides ours
+        self.assertEqual(self.clients(), 2)
+
+
+class FastJSONTests(SimpleTestCase):
+    def assertRendersLikeDRF(self, data):
+        expected = JSONRenderer().render(data)
+        rendered = fastjson.FastJSONRenderer().render(data)
+        self.assertEqual(fastjson.loads(rendered), fastjson.loads(expected))
+        return rendered
+
+    def test_values_serializers_leave_to_the_renderer(self):
+        rendered = self.assertRendersLikeDRF({
+            "at": datetime(2026, 1, 15, 10, 42, 31, 123456, tzinfo=dt_timezone.utc),
+            "naive": datetime(2026, 1, 15, 10, 42, 31),
+            "day": date(2026, 1, 15),
+            "amount": Decimal("12.50"),
+            "label": gettext_lazy("Hub"),
+            "ids": (1, 2),
+        })
+        self.assertIn(b'"at":"2026-01-15T10:42:31.123456Z"', rendered)
+        self.assertIn(b'"amount":12.5', rendered)
+
+    def test_integers_beyond_64_bits(self):
+        for value in (2 ** 64, -(2 ** 63) - 1, 10 ** 30):
+            self.assertEqual(self.assertRendersLikeDRF({"n": value}), b'{"n":%d}' % value)
+            self.assertEqual(fastjson.dumps(value), "%d" % value)
+
+    def test_non_finite_floats_are_refused_like_drf(self):
+        for value in (float("nan"), float("inf"), float("-inf"), Decimal("NaN"), Decimal("-Infinity")):
+            data = {"ok": None, "values": [1.5, {"x": value}]}
+            with self.assertRaises(ValueError):
+                JSONRenderer().render(data)
+            with self.assertRaises(ValueError):
+                fastjson.FastJSONRenderer().render(data)
+            with self.assertRaises(ValueError):
+                fastjson.dumps(value)
+        self.assertRendersLikeDRF({"ok": None, "values": [1.5, -0.0]})
+
+    def test_unencodable_values_still_raise(self):
+        with self.assertRaises(TypeError):
+            fastjson.dumps({"x": object()})
+
+
+class OutboundQueueTests(SimpleTestCase):
+    def test_a_failed_write_closes_the_socket_with_a_resume_hint(self):
+        sent, closed = [], []
+
+        async def send(text):
+            if text == "broken":
+                raise ConnectionResetError
+            sent.append(text)
+
+        async def close(code, reason):
+            closed.append((code, fastjson.loads(reason)))
+
+        async def scenario():
+            queue = outbound.OutboundQueue(send, close)
+            queue.start()
+            queue.put("first", eid=4)
+            await asyncio.sleep(0)
+            with self.assertLogs("base.outbound", "ERROR"):
+                queue.put("broken", eid=5)
+                await asyncio.wait_for(queue.task, 2)
+            # Nothing is queued for a socket that is going away
+            queue.put("after", eid=6)
+            self.assertFalse(queue.frames)
+
+        async_to_sync(scenario)()
+        self.assertEqual(sent, ["first"])
+        self.assertEqual(closed, [(outbound.SEND_FAILED_CLOSE_CODE, {"resume_since": 4})])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class OutboxDrainTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(CHANNEL_LAYERS={
+            "default": {
+                "BACKEND": "base.channel_layer.HybridChannelLayer",
+                "CONFIG": {"hosts": [fake_redis_host(self.redis_server)]},
+            }
+        }))
+
+    def record(self):
+        # Commit callbacks would drain inline: the tests drain by hand
+        with self.captureOnCommitCallbacks():
+            outbox.record(1, {"type": "message_edit", "n": 1}, replay=True)
+            outbox.record(1, {"type": "event_update", "n": 2})
+            outbox.record(2, {"type": "message_edit", "n": 3}, replay=True)
+            outbox.record_notification(7, notifications.notification_frame("banned", hub=1), revoke_hub=1)
+
+    def drain(self, groups):
+        """Drain the outbox; returns the event each of ``groups`` received."""
+        async def scenario():
+            layer = get_channel_layer()
+            channels = {}
+            for group in groups:
+                channels[group] = await layer.new_channel()
+                await layer.group_add(group, channels[group])
+            try:
+                await outbox.drain()
+                return {
+                    group: await asyncio.wait_for(layer.receive(channel), 2)
+                    for group, channel in channels.items()
+                }
+            finally:
+                await layer.close_pools()
+
+        return async_to_sync(scenario)()
+
+    def test_drain_sends_one_frame_per_hub(self):
+        self.record()
+        events = self.drain(["hub_1", "hub_2", "user_7"])
+
+        batch = fastjson.loads(events["hub_1"]["text"])
+        self.assertEqual(batch["type"], "batch")
+        self.assertEqual([e["n"] for e in batch["events"]], [1, 2])
+        # Replayable events are stamped one by one, inside the batch
+        self.assertEqual(batch["events"][0]["eid"], 1)
+        self.assertNotIn("eid", batch["events"][1])
+        self.assertEqual(events["hub_1"]["hub"], 1)
+        # The channel-layer event carries the newest eid, for resume tracking
+        self.assertEqual(events["hub_1"]["eid"], 1)
+
+        self.assertEqual(events["hub_2"]["eid"], 1)
+        self.assertEqual(fastjson.loads(events["hub_2"]["text"])["n"], 3)
+        self.assertEqual(events["user_7"]["revoke_hub"], 1)
+        self.assertNotIn("hub", events["user_7"])
+
+        self.assertFalse(BroadcastOutbox.objects.exists())
+        self.assertEqual(async_to_sync(replay.last_eid)(1), 1)
+
+    @override_settings(HUB_OUTBOX_BATCH_SIZE=2)
+    def test_drain_goes_through_every_batch(self):
+        self.record()
+        events = self.drain(["hub_2", "user_7"])
+        self.assertEqual(fastjson.loads(events["hub_2"]["text"])["n"], 3)
+        self.assertEqual(events["user_7"]["revoke_hub"], 1)
+        self.assertFalse(BroadcastOutbox.objects.exists())
+
+    def expire_leases(self):
+        BroadcastOutbox.objects.update(claimed_until=timezone.now() - timedelta(seconds=1))
+
+    def test_failed_sends_are_retried_once_the_lease_runs_out(self):
+        self.record()
+        with mock.patch.object(HybridChannelLayer, "group_send", side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                self.drain([])
+        self.assertEqual(BroadcastOutbox.objects.filter(claimed_until__isnull=False).count(), 4)
+
+        # Still leased: nobody else sends them meanwhile
+        async_to_sync(outbox.drain)()
+        self.assertEqual(BroadcastOutbox.objects.count(), 4)
+
+        self.expire_leases()
+        events = self.drain(["hub_1", "user_7"])
+        self.assertEqual(len(fastjson.loads(events["hub_1"]["text"])["events"]), 2)
+        self.assertFalse(BroadcastOutbox.objects.exists())
+
+    def test_cancelled_sends_stay_in_the_outbox(self):
+        # What stop_dispatcher does to a dispatch in flight at shutdown
+        self.record()
+        with mock.patch.object(HybridChannelLayer, "group_send", side_effect=asyncio.CancelledError):
+            with self.assertRaises(asyncio.CancelledError):
+                self.drain([])
+        self.assertEqual(BroadcastOutbox.objects.count(), 4)
+
+        self.expire_leases()
+        self.assertEqual(self.drain(["user_7"])["user_7"]["revoke_hub"], 1)
+        self.assertFalse(BroadcastOutbox.objects.exists())
+
+    @override_settings(HUB_OUTBOX_LEASE=0, HUB_OUTBOX_RETRY_INTERVAL=0.05)
+    def test_dispatcher_starts_with_a_drain_and_retries_on_its_own(self):
+        self.record()
+        attempts = []
+        group_send = HybridChannelLayer.group_send
+
+        async def flaky(layer, group, message):
+            attempts.append(group)
+            if len(attempts) == 1:
+                raise ConnectionError
+            await group_send(layer, group, message)
+
+        async def sent_everything():
+            while await database_sync_to_async(BroadcastOutbox.objects.exists)():
+                await asyncio.sleep(0.01)
+
+        async def scenario():
+            layer = get_channel_layer()
+            channel = await layer.new_channel()
+            await layer.group_add("user_7", channel)
+            # As at server startup: nothing woke the dispatcher
+            await outbox.start_dispatcher()
+            try:
+                with self.assertLogs("base.outbox", "ERROR"):
+                    event = await asyncio.wait_for(layer.receive(channel), 2)
+                await asyncio.wait_for(sent_everything(), 2)
+            finally:
+                await outbox.stop_dispatcher()
+                await layer.close_pools()
+            return event
+
+        with mock.patch.object(HybridChannelLayer, "group_send", flaky):
+            self.assertEqual(async_to_sync(scenario)()["revoke_hub"], 1)
+        self.assertEqual(attempts.count("user_7"), 2)
+        self.assertFalse(BroadcastOutbox.objects.exists())
+
+
+@skipUnless(connection.vendor == "sqlite", "FTS5 triggers are SQLite only")
+@override_settings(CACHES=TEST_CACHES, CHANNEL_LAYERS=TEST_CHANNEL_LAYERS)
+class SearchTriggerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("alice")
+        self.hub = Hub.objects.create(name="hub", admin=self.user)
+
+    def found(self, text):
+        return [message.content for message, _, _ in search.search(text)[0]]
+
+    def test_migrations_leave_every_trigger_in_place(self):
+        self.assertEqual(search.missing_sqlite_triggers(), [])
+        self.assertEqual(search.restore_sqlite_triggers(), [])
+
+    def test_post_migrate_restores_dropped_triggers(self):
+        # What a table rebuild in a later migration does
+        with connection.cursor() as cursor:
+            for name in search.SQLITE_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER {name}")
+        message = Message.objects.create(hub=self.hub, sender=self.user, content="picnic on sunday")
+        self.assertEqual(self.found("picnic"), [])
+
+        with self.assertLogs("base.search", "WARNING"):
+            restore_search_triggers(sender=apps.get_app_config("base"), using="default")
+        self.assertEqual(search.missing_sqlite_triggers(), [])
+        # Reindexed, and kept up to date again
+        self.assertEqual(self.found("picnic"), ["picnic on sunday"])
+        message.content = "barbecue on sunday"
+        message.save()
+        self.assertEqual(self.found("picnic"), [])
+        self.assertEqual(self.found("barbecue"), ["barbecue on sunday"])
+
+
+@skipUnless(connection.vendor == "sqlite", "FTS5 triggers are SQLite only")
+@override_settings(CACHES=TEST_CACHES, CHANNEL_LAYERS=TEST_CHANNEL_LAYERS)
+class SearchRankingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("alice")
+        self.hub = Hub.objects.create(name="hub", admin=self.user)
+        # The best match is the oldest one
+        for content in ["picnic picnic picnic"] + [
+            f"about the picnic, see the long thread from week {n} for details" for n in range(6)
+        ]:
+            Message.objects.create(hub=self.hub, sender=self.user, content=content)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def results(self, **params):
+        response = self.client.get("/api/messages/search/", {"q": "picnic", **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_every_match_ranked_within_the_window(self):
+        with override_settings(HUB_SEARCH_CANDIDATES=10):
+            page = self.results()
+        self.assertEqual(page["results"][0]["snippet"], "<mark>picnic</mark> " * 2 + "<mark>picnic</mark>")
+        self.assertEqual(len(page["results"]), 7)
+        self.assertIsNone(page["ranked_newest"])
+
+    def test_an_older_best_match_outside_the_window_is_reported(self):
+        with override_settings(HUB_SEARCH_CANDIDATES=5):
+            page = self.results(limit=3)
+        self.assertNotIn("picnic picnic", " ".join(hit["snippet"] for hit in page["results"]))
+        self.assertEqual(page["ranked_newest"], 5)
+
+
+@override_settings(CACHES=TEST_CACHES, CHANNEL_LAYERS=TEST_CHANNEL_LAYERS)
+class EventListingQueryTests(TestCase):
+    """Listings cost a fixed number of queries, whatever the page size."""
+
+    def setUp(self):
+        # Roles cached by earlier tests are only invalidated on commit
+        cache.clear()
+        self.owner = User.objects.create_user("owner")
+        self.member = User.objects.create_user("member")
+        self.guests = [User.objects.create_user(f"guest{i}") for i in range(3)]
+        self.hubs = [Hub.objects.create(name=f"hub{i}", admin=self.owner) for i in range(3)]
+        for hub in self.hubs:
+            HubMembership.objects.create(hub=hub, user=self.member, is_approved=True)
+        self.add_events(2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.member)
+
+    def add_events(self, per_hub):
+        for hub in self.hubs:
+            for i in range(per_hub):
+                event = Event.objects.create(
+                    hub=hub, title=f"{hub.name} {i}", created_by=self.owner,
+                    start_time=timezone.now() + timedelta(days=1, hours=i),
+                )
+                for user in self.guests + [self.member]:
+                    EventAttendance.objects.create(event=event, user=user)
+
+    def assertQueries(self, num, url, **params):
+        # Membership lookups are cached per user: warm them first
+        self.client.get(url, params)
+        with self.assertNumQueries(num):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_list(self):
+        page = self.assertQueries(3, "/api/events/", limit=2)
+        self.assertEqual(len(page["results"]), 2)
+        page = self.assertQueries(3, "/api/events/", limit=6)
+        self.assertEqual(len(page["results"]), 6)
+        self.assertEqual(len(page["results"][0]["attendees"]), 4)
+
+    def test_upcoming(self):
+        self.assertEqual(len(self.assertQueries(2, "/api/events/upcoming/")), 6)
+        self.add_events(4)
+        events = self.assertQueries(2, "/api/events/upcoming/")
+        self.assertEqual(len(events), 18)
+        self.assertTrue(all(event["user_attending"] for event in events))
+
+    def test_my_events(self):
+        hubs = self.assertQueries(4, "/api/hubs/my_events/", limit=1, limit_per_hub=1)["results"]
+        self.assertEqual([len(hub["events"]) for hub in hubs], [1])
+        self.add_events(3)
+        hubs = self.assertQueries(4, "/api/hubs/my_events/", limit=3, limit_per_hub=5)["results"]
+        self.assertEqual([len(hub["events"]) for hub in hubs], [5, 5, 5])
+
+
+@override_settings(CACHES=TEST_CACHES, CHANNEL_LAYERS=TEST_CHANNEL_LAYERS)
+class EventDateRangeTests(TestCase):
+    tz = event_calendar.get_timezone("Europe/Paris")
+    # Clocks go forward: a 23 hour day
+    day = date(2026, 3, 29)
+
+    def setUp(self):
+        cache.clear()
+        self.root = User.objects.create_superuser("root", password="x")
+        self.member = User.objects.create_user("member")
+        self.hub = Hub.objects.create(name="hub", admin=self.root)
+        HubMembership.objects.create(hub=self.hub, user=self.member, is_approved=True)
+
+    def event(self, title, start_time):
+        return Event.objects.create(hub=self.hub, title=title, created_by=self.root, start_time=start_time)
+
+    def get(self, user, url, **params):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(url, {"tz": self.tz.key, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_day_range_is_half_open_in_local_time(self):
+        start, end = event_calendar.day_range(self.day, self.day, self.tz)
+        self.assertEqual(start, datetime(2026, 3, 29, tzinfo=self.tz))
+        self.assertEqual(end, datetime(2026, 3, 30, tzinfo=self.tz))
+        # Same tzinfo: subtracting would compare wall clocks
+        self.assertEqual(end.astimezone(dt_timezone.utc) - start, timedelta(hours=23))
+        self.assertEqual(event_calendar.day_range(None, self.day, self.tz), (None, end))
+        self.assertEqual(event_calendar.day_range(self.day, None, self.tz), (start, None))
+
+    def test_date_filters_keep_start_and_drop_end(self):
+        start, end = event_calendar.day_range(self.day, self.day, self.tz)
+        self.event("day before", start - timedelta(microseconds=1))
+        self.event("midnight", start)
+        self.event("last instant", end - timedelta(microseconds=1))
+        self.event("next midnight", end)
+
+        day = self.day.isoformat()
+        events = self.get(self.member, "/api/events/", start_date=day, end_date=day)
+        self.assertEqual([e["title"] for e in events], ["midnight", "last instant"])
+        events = self.get(self.member, "/api/events/", start_date=day)
+        self.assertEqual([e["title"] for e in events], ["midnight", "last instant", "next midnight"])
+        events = self.get(self.member, "/api/events/", end_date=day)
+        self.assertEqual([e["title"] for e in events], ["day before", "midnight", "last instant"])
+
+    def query_plans(self, user, url, **params):
+        """Plans of the queries on base_event filtered by start_time made by a request."""
+        with CaptureQueriesContext(connection) as queries:
+            self.get(user, url, **params)
+        explain = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+        plans = []
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                # A handful of rows would be read sequentially otherwise
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            for query in queries.captured_queries:
+                sql = query["sql"]
+                if sql.startswith("SELECT") and '"base_event"."start_time" <' in sql:
+                    cursor.execute(explain + sql)
+                    plans.append("\n".join(str(row) for row in cursor.fetchall()))
+        self.assertTrue(plans, "no event range query")
+        return plans
+
+    def assertUsesIndex(self, plans, *indexes):
+        for plan in plans:
+            self.assertTrue(any(index in plan for index in indexes), plan)
+
+    def test_range_queries_use_the_start_time_indexes(self):
+        for _ in range(3):
+            self.event("event", datetime(2026, 3, 29, 12, tzinfo=self.tz))
+        day = self.day.isoformat()
+
+        plans = self.query_plans(self.root, "/api/events/", start_date=day, end_date=day, limit=10)
+        self.assertUsesIndex(plans, "event_start_idx")
+        plans = self.query_plans(self.root, "/api/events/calendar/", view="week", date=day)
+        self.assertUsesIndex(plans, "event_start_idx")
+        plans = self.query_plans(self.member, "/api/events/calendar/", view="week", date=day, hub=self.hub.id)
+        self.assertUsesIndex(plans, "event_hub_start_idx", "event_start_idx")
+        plans = self.query_plans(self.member, "/api/events/", hub=self.hub.id, start_date=day, end_date=day)
+        self.assertUsesIndex(plans, "event_hub_start_idx", "event_start_idx")
+
+
+@override_settings(CACHES=TEST_CACHES, CHANNEL_LAYERS=TEST_CHANNEL_LAYERS, HUB_RECENT_MESSAGES=40)
+class RecentBufferTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("alice")
+        self.hub = Hub.objects.create(name="hub", admin=self.user)
+        self.messages = {
+            seq: Message.objects.create(hub=self.hub, sender=self.user, content=f"m{seq}")
+            for seq in range(1, 61)
+        }
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def page(self, host="testserver", **params):
+        response = self.client.get("/api/messages/", {"hub": self.hub.id, **params}, HTTP_HOST=host)
+        self.assertEqual(response.status_code, 200)
+        return response.json()["results"]
+
+    def cached_page(self, page_size=10, **params):
+        # A warm buffer answers without a query
+        params["page_size"] = page_size
+        self.page(**params)
+        with self.assertNumQueries(0):
+            return self.page(**params)
+
+    def database_page(self, **params):
+        redis.Redis(connection_pool=redis_pool._sync_pool).flushall()
+        return self.page(**params)
+
+    def delete(self, seq):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f"/api/messages/{self.messages[seq].id}/?hub={self.hub.id}")
+        self.assertEqual(response.status_code, 204)
+
+    def test_pages_with_gaps_are_served_from_the_buffer(self):
+        self.delete(55)
+        self.delete(3)
+        page = self.cached_page(page_size=10)
+        self.assertEqual([m["seq"] for m in page], [50, 51, 52, 53, 54, 56, 57, 58, 59, 60])
+        self.assertEqual(page, self.database_page(page_size=10))
+
+        # A hub shorter than a page: whole, gaps and all
+        self.hub, self.messages = Hub.objects.create(name="small", admin=self.user), {}
+        for seq in range(1, 6):
+            self.messages[seq] = Message.objects.create(hub=self.hub, sender=self.user, content=f"m{seq}")
+        self.delete(2)
+        self.assertEqual([m["seq"] for m in self.cached_page()], [1, 3, 4, 5])
+
+    def test_edit_after_a_delete_replaces_its_own_entry(self):
+        self.page(page_size=10)
+        self.delete(55)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"/api/messages/{self.messages[50].id}/edit/?hub={self.hub.id}",
+                {"content": "EDITED50"},
+                format="multipart",
+            )
+        self.assertEqual(response.status_code, 200)
+
+        page = self.cached_page(page_size=15)
+        contents = {m["seq"]: m["content"] for m in page}
+        self.assertEqual(len(contents), len(page))
+        self.assertEqual((contents[49], contents[50], contents[51]), ("m49", "EDITED50", "m51"))
+        self.assertNotIn(55, contents)
+        self.assertEqual(page, self.database_page(page_size=15))
+
+    def test_destroy_evicts_the_message(self):
+        self.assertIn(60, [m["seq"] for m in self.page(page_size=10)])
+        self.delete(60)
+        self.assertNotIn(60, [m["seq"] for m in self.cached_page()])
+
+        # The next message still follows the hub's counter
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/messages/", {"hub": self.hub.id, "content": "new"})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([m["seq"] for m in self.cached_page()][-2:], [59, 61])
+
+    def test_deleting_a_reply_empties_the_buffer(self):
+        reply = Message.objects.create(hub=self.hub, sender=self.user, content="reply", parent=self.messages[60])
+        self.assertEqual(self.page(page_size=10)[-2]["replies"][0]["content"], "reply")
+        with self.captureOnCommitCallbacks(execute=True):
+            reply.delete()
+        self.assertEqual(self.cached_page()[-1]["replies"], [])
+
+    def test_pages_beyond_the_buffer_come_from_the_database(self):
+        page = self.cached_page(page_size=40)
+        self.assertEqual(page[0]["seq"], 21)
+        # Larger than the buffer: a miss every time, still complete
+        self.assertEqual([m["seq"] for m in self.page(page_size=45)], list(range(16, 61)))
+
+    @override_settings(ALLOWED_HOSTS=["writer.example", "reader.example", "testserver"])
+    def test_urls_are_built_for_the_reader(self):
+        self.user.profile.avatar = "avatars/alice.png"
+        self.user.profile.save()
+        redis.Redis(connection_pool=redis_pool._sync_pool).flushall()
+
+        self.page(host="writer.example", page_size=10)
+        with self.assertNumQueries(0):
+            page = self.page(host="reader.example", page_size=10)
+        self.assertEqual(page[-1]["sender"]["avatar_url"], "http://reader.example/media/avatars/alice.png")
+
+
+@override_settings(CACHES=TEST_CACHES, CHANNEL_LAYERS=TEST_CHANNEL_LAYERS)
+class MessagePaginationQueryTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("alice")
+        self.hub = Hub.objects.create(name="hub", admin=self.user)
+        self.messages = [
+            Message.objects.create(hub=self.hub, sender=self.user, content=f"m{n}")
+            for n in range(1, 31)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, params=None, status=200):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status)
+        return response.json()
+
+    def reply_chain(self, parent, depth):
+        for n in range(depth):
+            parent = Message.objects.create(hub=self.hub, sender=self.user, content=f"re{n}", parent=parent)
+        return parent
+
+    def test_first_page_from_a_cold_buffer(self):
+        # Counter, page, thread replies
+        with self.assertNumQueries(3):
+            page = self.get("/api/messages/", {"hub": self.hub.id, "page_size": 10})
+        self.assertEqual([m["seq"] for m in page["results"]], list(range(21, 31)))
+        self.assertIsNone(page["next"])
+        self.assertIn("before=21", page["previous"])
+
+    def test_cursors_cost_one_range_scan_and_one_thread_query(self):
+        page = self.get("/api/messages/", {"hub": self.hub.id, "page_size": 10})
+        with self.assertNumQueries(2):
+            older = self.get(page["previous"])
+        self.assertEqual([m["seq"] for m in older["results"]], list(range(11, 21)))
+
+        with self.assertNumQueries(2):
+            newer = self.get(older["next"])
+        self.assertEqual(newer["results"], page["results"])
+        self.assertIsNone(newer["next"])
+
+    def test_invalid_cursors_are_rejected_before_any_query(self):
+        for cursor in ("abc", "-1"):
+            with self.assertNumQueries(0):
+                self.get("/api/messages/", {"hub": self.hub.id, "before": cursor}, status=404)
+            with self.assertNumQueries(0):
+                self.get("/api/messages/", {"hub": self.hub.id, "after": cursor}, status=404)
+
+    def test_nested_threads_load_in_one_query_at_any_depth(self):
+        self.reply_chain(self.messages[4], 2)
+        params = {"hub": self.hub.id, "before": 11}
+        with self.assertNumQueries(2):
+            shallow = self.get("/api/messages/", params)["results"]
+
+        self.reply_chain(self.messages[5], 6)
+        with self.assertNumQueries(2):
+            deep = self.get("/api/messages/", params)["results"]
+
+        self.assertEqual(shallow[4]["replies"][0]["replies"][0]["content"], "re1")
+        reply = deep[5]
+        for n in range(6):
+            self.assertEqual(len(reply["replies"]), 1)
+            reply = reply["replies"][0]
+            self.assertEqual(reply["content"], f"re{n}")
+        self.assertEqual(reply["replies"], [])
+
+
+@override_settings(CACHES=TEST_CACHES, CHANNEL_LAYERS=TEST_CHANNEL_LAYERS)
+class AttendanceCountTests(TestCase):
+    def setUp(self):
+        # Roles cached by earlier tests are only invalidated on commit
+        cache.clear()
+        self.owner = User.objects.create_user("owner")
+        self.members = [User.objects.create_user(f"member{i}") for i in range(3)]
+        self.hub = Hub.objects.create(name="hub", admin=self.owner)
+        for user in self.members:
+            HubMembership.objects.create(hub=self.hub, user=user, is_approved=True)
+        self.event = Event.objects.create(
+            hub=self.hub, title="clean-up", created_by=self.owner,
+            start_time=timezone.now() + timedelta(days=1),
+        )
+        self.client = APIClient()
+
+    def rsvp(self, user, action):
+        self.client.force_authenticate(user)
+        response = self.client.post(f"/api/events/{self.event.id}/{action}/")
+        self.assertEqual(response.status_code, 200)
+        return response.json()["attendees_count"]
+
+    def stored_count(self):
+        self.event.refresh_from_db()
+        return self.event.attendees_count
+
+    def test_a_second_rsvp_does_not_count_twice(self):
+        alice, bob, _ = self.members
+        self.assertEqual(self.rsvp(alice, "attend"), 1)
+        self.assertEqual(self.rsvp(alice, "attend"), 1)
+        self.assertEqual(self.rsvp(bob, "attend"), 2)
+        self.assertEqual(self.stored_count(), 2)
+        self.assertEqual(EventAttendance.objects.filter(event=self.event, attending=True).count(), 2)
+
+    def test_rsvp_then_un_rsvp(self):
+        alice, bob, _ = self.members
+        self.rsvp(alice, "attend")
+        self.rsvp(bob, "attend")
+        self.assertEqual(self.rsvp(alice, "unattend"), 1)
+        self.assertEqual(self.rsvp(alice, "unattend"), 1)
+        # And back: the existing row flips again
+        self.assertEqual(self.rsvp(alice, "attend"), 2)
+        self.assertEqual(EventAttendance.objects.filter(event=self.event, user=alice).count(), 1)
+
+    def test_the_count_never_goes_negative(self):
+        alice = self.members[0]
+        self.assertEqual(self.rsvp(alice, "unattend"), 0)
+        self.rsvp(alice, "attend")
+        # The count drifted low (a restored backup), then the RSVP is withdrawn
+        Event.objects.filter(pk=self.event.pk).update(attendees_count=0)
+        self.assertEqual(self.rsvp(alice, "unattend"), 0)
+        attendance.adjust(self.event.pk, -3)
+        self.assertEqual(self.stored_count(), 0)
+
+    def test_deleting_an_attending_user_takes_them_off_the_count(self):
+        alice, bob, _ = self.members
+        self.rsvp(alice, "attend")
+        self.rsvp(bob, "attend")
+        self.rsvp(bob, "unattend")
+        alice.delete()
+        bob.delete()
+        self.assertEqual(self.stored_count(), 0)
+
+    def test_repair_fixes_a_drifted_count(self):
+        for user in self.members[:2]:
+            self.rsvp(user, "attend")
+        untouched = Event.objects.create(
+            hub=self.hub, title="quiz", created_by=self.owner, start_time=timezone.now(),
+        )
+        # Rows edited outside base.attendance, e.g. a restored backup
+        EventAttendance.objects.create(event=self.event, user=self.members[2], attending=True)
+        Event.objects.filter(pk=untouched.pk).update(attendees_count=7)
+
+        out = StringIO()
+        call_command("repair_attendee_counts", "--dry-run", stdout=out)
+        self.assertIn(f"event {self.event.id}: stored 2, actual 3", out.getvalue())
+        self.assertIn(f"event {untouched.id}: stored 7, actual 0", out.getvalue())
+        self.assertEqual(self.stored_count(), 2)
+
+        out = StringIO()
+        call_command("repair_attendee_counts", str(self.event.id), stdout=out)
+        self.assertEqual(out.getvalue().strip(), "fixed 1 events")
+        self.assertEqual(self.stored_count(), 3)
+        self.assertEqual(Event.objects.get(pk=untouched.pk).attendees_count, 7)
+
+        self.assertEqual(attendance.repair(), 1)
+        self.assertFalse(attendance.stale_events().exists())
+        self.assertEqual(attendance.repair(), 0)
+
+
+@override_settings(CACHES=TEST_CACHES, CHANNEL_LAYERS=TEST_CHANNEL_LAYERS)
+class DashboardInvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser("root")
+        self.owner = User.objects.create_user("owner")
+        self.hub = Hub.objects.create(name="hub", admin=self.owner)
+        self.event = Event.objects.create(
+            hub=self.hub, title="clean-up", created_by=self.owner,
+            start_time=timezone.now() + timedelta(days=1),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def summary(self):
+        response = self.client.get("/api/dashboard/summary/")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def assertBumps(self, write, bumps=True):
+        self.summary()
+        version = cache.get(dashboard.VERSION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        if bumps:
+            self.assertNotEqual(cache.get(dashboard.VERSION_KEY), version)
+        else:
+            self.assertEqual(cache.get(dashboard.VERSION_KEY), version)
+
+    def test_event_writes(self):
+        self.event.title = "beach clean-up"
+        self.assertBumps(self.event.save)
+        self.assertEqual(self.summary()["events"][0]["events"][0]["title"], "beach clean-up")
+
+        self.assertBumps(lambda: attendance.attend(self.event, self.admin))
+        self.assertTrue(self.summary()["events"][0]["events"][0]["user_attending"])
+
+        self.assertBumps(self.event.delete)
+        self.assertEqual(self.summary()["totals"]["upcoming_events"], 0)
+
+    def test_membership_writes(self):
+        member = User.objects.create_user("member")
+        membership = HubMembership.objects.create(hub=self.hub, user=member, is_approved=False)
+        self.assertEqual(self.summary()["hubs"][0]["members_count"], 0)
+
+        membership.is_approved = True
+        self.assertBumps(membership.save)
+        self.assertEqual(self.summary()["hubs"][0]["members_count"], 1)
+
+        self.assertBumps(membership.delete)
+        self.assertEqual(self.summary()["hubs"][0]["members_count"], 0)
+
+    def test_user_count(self):
+        self.assertBumps(lambda: User.objects.create_user("newcomer"))
+        self.assertEqual(self.summary()["totals"]["users"], 3)
+        # Logins save the user without changing the total
+        self.assertBumps(lambda: self.owner.save(update_fields=["last_login"]), bumps=False)
+
+    def test_messages_are_not_part_of_the_summary(self):
+        self.assertBumps(
+            lambda: Message.objects.create(hub=self.hub, sender=self.owner, content="hi"),
+            bumps=False,
+        )
+
+
+@override_settings(HUB_RATE_LIMITS={
+    "message": {"user": (2, 3), "hub": (10, 5)},
+    "typing": {"user": (2, 5), "hub": (30, 60)},
+})
+class RateLimitTests(FakeRedisMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        ratelimit._local_buckets.clear()
+        ratelimit._next_sweep = 0
+        ratelimit._redis_down = False
+
+    def tearDown(self):
+        ratelimit._local_buckets.clear()
+        ratelimit._redis_down = False
+        super().tearDown()
+
+    def hits(self, *senders):
+        async def scenario():
+            return [await ratelimit.hit("message", user_id, hub_id) for user_id, hub_id in senders]
+
+        return async_to_sync(scenario)()
+
+    def check_limits(self):
+        # A user's burst spans their hubs...
+        results = self.hits((1, 1), (1, 1), (1, 2), (1, 2))
+        self.assertEqual(results[:3], [None] * 3)
+        scope, retry_after = results[3]
+        self.assertEqual(scope, "user")
+        self.assertAlmostEqual(retry_after, 0.5, delta=0.01)
+        # ...and a hub's spans its users
+        results = self.hits(*[(user_id, 3) for user_id in range(10, 16)])
+        self.assertEqual(results[:5], [None] * 5)
+        self.assertEqual(results[5][0], "hub")
+
+    def test_limits_on_redis(self):
+        self.check_limits()
+        self.assertFalse(ratelimit._local_buckets)
+
+    def test_limits_per_worker_while_redis_is_down(self):
+        def unreachable():
+            raise redis.exceptions.ConnectionError
+
+        with mock.patch.object(ratelimit, "get_redis", unreachable), \
+                self.assertLogs("base.ratelimit", "WARNING"):
+            self.check_limits()
+        self.assertTrue(ratelimit._local_buckets)
+
+        # Back on Redis, the per-worker buckets are dropped
+        with self.assertLogs("base.ratelimit", "INFO"):
+            self.hits((1, 1))
+        self.assertFalse(ratelimit._local_buckets)
+
+    def test_idle_local_buckets_are_swept(self):
+        limits = [(2, 3), (10, 10000)]
+        for user_id in range(1000):
+            ratelimit._take_local(ratelimit.bucket_keys("message", user_id, 1), limits, 0)
+        for _ in range(3):
+            ratelimit._take_local(ratelimit.bucket_keys("message", "flooder", 2), limits, 0)
+        self.assertEqual(len(ratelimit._local_buckets), 1003)
+
+        # Nothing goes before the next sweep, however idle
+        ratelimit._take_local(ratelimit.bucket_keys("message", "late", 2), limits, 1000)
+        self.assertEqual(len(ratelimit._local_buckets), 1004)
+
+        # Full buckets go, the flooder's drained one too (1.5 s to refill);
+        # hub 1 has 100 s of refilling left and stays
+        now = ratelimit.LOCAL_SWEEP_INTERVAL
+        self.assertEqual(ratelimit._take_local(ratelimit.bucket_keys("message", "new", 3), limits, now)[0], 1)
+        self.assertEqual(set(ratelimit._local_buckets), {
+            "ratelimit:message:hub:1", *ratelimit.bucket_keys("message", "new", 3),
+        })
+
+
+class HubSocketMixin(FakeRedisMixin):
+    """alice and bob, members of one hub, talking over the in-memory layer."""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        self.hub = Hub.objects.create(name="hub", admin=self.alice)
+        HubMembership.objects.create(hub=self.hub, user=self.bob, is_approved=True)
+        self.path = f"/ws/hub/{self.hub.id}/"
+
+    def run_sockets(self, scenario, *sockets):
+        """Run ``scenario`` with a socket per (user, path suffix, subprotocols)."""
+        async def run():
+            opened = []
+            try:
+                for user, suffix, subprotocols in sockets:
+                    opened.append(await open_socket(user, self.path + suffix, subprotocols))
+                return await scenario(*opened)
+            finally:
+                for communicator in opened:
+                    await communicator.disconnect()
+
+        return async_to_sync(run)()
+
+
+async def receive_binary(communicator, match, timeout=2):
+    """Like wait_for_frame, for MessagePack binary frames."""
+    async def read():
+        while True:
+            output = await communicator.receive_output(timeout)
+            assert "bytes" in output, output
+            frame = msgpack.unpackb(output["bytes"])
+            if match(frame):
+                return frame
+
+    return await asyncio.wait_for(read(), timeout)
+
+
+def of_type(kind):
+    return lambda frame: frame.get("type") == kind
+
+
+@override_settings(CACHES=TEST_CACHES, CHANNEL_LAYERS=TEST_CHANNEL_LAYERS)
+class MessagePackSocketTests(HubSocketMixin, TransactionTestCase):
+    def test_binary_and_text_sockets_get_the_same_frames(self):
+        async def scenario(binary, text):
+            self.assertEqual(binary.subprotocol, MSGPACK_SUBPROTOCOL)
+            self.assertIsNone(text.subprotocol)
+            online = await receive_binary(binary, of_type("online_users"))
+            self.assertIn("alice", [user["username"] for user in online["users"]])
+
+            # Binary clients send MessagePack too
+            await binary.send_to(bytes_data=msgpack.packb({"content": "hi from msgpack"}))
+            from_binary = await receive_binary(binary, of_type("chat_message"))
+            from_text = await wait_for_frame(text, of_type("chat_message"))
+            self.assertEqual(from_binary, from_text)
+            self.assertEqual(from_binary["message"]["content"], "hi from msgpack")
+            self.assertEqual(from_binary["message"]["sender"], "alice")
+
+            await text.send_json_to({"content": "hi from json"})
+            from_text = await wait_for_frame(text, of_type("chat_message"))
+            self.assertEqual(await receive_binary(binary, of_type("chat_message")), from_text)
+
+        self.run_sockets(
+            scenario,
+            (self.alice, "", [MSGPACK_SUBPROTOCOL]),
+            (self.bob, "", None),
+        )
+
+    def test_other_subprotocols_get_json(self):
+        async def scenario(socket):
+            self.assertIsNone(socket.subprotocol)
+            await wait_for_frame(socket, of_type("online_users"))
+
+        self.run_sockets(scenario, (self.alice, "", ["hub.cbor"]))
+
+
+@override_settings(CACHES=TEST_CACHES, CHANNEL_LAYERS=TEST_CHANNEL_LAYERS)
+class ReplaySocketTests(HubSocketMixin, TransactionTestCase):
+    def publish(self, content):
+        return async_to_sync(replay.publish)(
+            self.hub.id, {"type": "chat_message", "message": {"content": content}}
+        )
+
+    def replay_on_connect(self, since):
+        async def scenario(socket):
+            return await wait_for_frame(socket, of_type("replay"))
+
+        return self.run_sockets(scenario, (self.bob, f"?since={since}", None))
+
+    def test_fresh_clients_learn_where_the_stream_is(self):
+        self.publish("one")
+        self.publish("two")
+
+        async def scenario(socket):
+            return await wait_for_frame(socket, of_type("session"))
+
+        self.assertEqual(self.run_sockets(scenario, (self.bob, "", None))["last_eid"], 2)
+
+    def test_reconnecting_replays_what_was_missed(self):
+        async def chat(sender, watcher):
+            await sender.send_json_to({"content": "while bob is here"})
+            seen = await wait_for_frame(watcher, of_type("chat_message"))
+            return seen["eid"]
+
+        last_seen = self.run_sockets(chat, (self.alice, "", None), (self.bob, "", None))
+        missed = [self.publish(f"missed {n}") for n in range(3)]
+        self.assertEqual(missed, [last_seen + 1, last_seen + 2, last_seen + 3])
+
+        frame = self.replay_on_connect(last_seen)
+        self.assertFalse(frame["reset"])
+        self.assertEqual(frame["last_eid"], missed[-1])
+        self.assertEqual([e["eid"] for e in frame["events"]], missed)
+        self.assertEqual([e["message"]["content"] for e in frame["events"]], ["missed 0", "missed 1", "missed 2"])
+
+        # Up to date: nothing to replay
+        frame = self.replay_on_connect(missed[-1])
+        self.assertEqual((frame["reset"], frame["events"]), (False, []))
+
+    @override_settings(HUB_REPLAY_BUFFER_SIZE=3)
+    def test_a_gap_older_than_the_buffer_asks_for_a_resync(self):
+        for n in range(6):
+            self.publish(f"m{n}")
+
+        # eids 4-6 are buffered: from 3 on it still replays
+        frame = self.replay_on_connect(3)
+        self.assertFalse(frame["reset"])
+        self.assertEqual([e["eid"] for e in frame["events"]], [4, 5, 6])
+
+        # 3 fell out of the buffer: reload history over REST
+        frame = self.replay_on_connect(2)
+        self.assertEqual((frame["reset"], frame["last_eid"], frame["events"]), (True, 6, []))
+
+        # An eid from the future (e.g. the buffer expired) resets too
+        frame = self.replay_on_connect(10)
+        self.assertEqual((frame["reset"], frame["events"]), (True, []))
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    CHANNEL_LAYERS=TEST_CHANNEL_LAYERS,
+    HUB_TYPING_SNAPSHOT_INTERVAL=0.05,
+    HUB_TYPING_DEBOUNCE=60,
+)
+class TypingSocketTests(HubSocketMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        # Flushers of earlier tests ran on loops that are gone
+        typing_indicators._flushers.clear()
+        typing_indicators._dirty.clear()
+
+    def typing_count(self, name):
+        return metrics.local_snapshot().get("typing", {}).get(name, 0)
+
+    def test_keystrokes_are_debounced_into_snapshots(self):
+        def typers(*names):
+            return lambda f: f.get("type") == "typing_snapshot" and f["users"] == list(names)
+
+        async def scenario(alice, bob):
+            for _ in range(5):
+                await alice.send_json_to({"type": "typing", "is_typing": True})
+            await wait_for_frame(bob, typers("alice"))
+
+            await bob.send_json_to({"type": "typing", "is_typing": True})
+            await wait_for_frame(alice, typers("alice", "bob"))
+
+            await alice.send_json_to({"type": "typing", "is_typing": False})
+            await alice.send_json_to({"type": "typing", "is_typing": False})
+            await wait_for_frame(bob, typers("bob"))
+
+            # Leaving while typing stops it too
+            await bob.disconnect()
+            await wait_for_frame(alice, typers())
+            # No snapshot repeats an unchanged set of typers
+            self.assertTrue(await alice.receive_nothing(0.2))
+
+        received = self.typing_count("frames_received")
+        debounced = self.typing_count("frames_debounced")
+        self.run_sockets(scenario, (self.alice, "", None), (self.bob, "", None))
+        self.assertEqual(self.typing_count("frames_received") - received, 8)
+        # Four "still typing" repeats and one repeated stop
+        self.assertEqual(self.typing_count("frames_debounced") - debounced, 5)
+        self.assertFalse(typing_indicators._flushers)
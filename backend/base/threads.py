@@ -0,0 +1,54 @@
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Message
+
+
+def descendants_sql(root_ids):
+    """
+    Recursive CTE selecting the ids of every reply below ``root_ids``.
+
+    Works unchanged on SQLite and PostgreSQL.
+    """
+    table = connection.ops.quote_name(Message._meta.db_table)
+    placeholders = ", ".join(["%s"] * len(root_ids))
+    sql = (
+        f"WITH RECURSIVE thread(id) AS ("
+        f" SELECT id FROM {table} WHERE parent_id IN ({placeholders})"
+        f" UNION"
+        f" SELECT m.id FROM {table} m INNER JOIN thread t ON m.parent_id = t.id"
+        f") SELECT id FROM thread"
+    )
+    return sql, list(root_ids)
+
+
+def attach_thread_replies(messages):
+    """
+    Load every descendant of ``messages`` in one query and hang the tree off
+    each instance as ``thread_replies`` (ordered oldest first), so that
+    MessageSerializer can render nested replies without touching the DB.
+    """
+    messages = list(messages)
+    if not messages:
+        return messages
+
+    nodes = {m.id: m for m in messages}
+    sql, params = descendants_sql(list(nodes))
+    descendants = Message.objects.filter(
+        id__in=RawSQL(sql, params)
+    ).select_related("sender", "sender__profile")
+
+    for m in descendants:
+        nodes.setdefault(m.id, m)
+
+    children = defaultdict(list)
+    for m in nodes.values():
+        if m.parent_id in nodes:
+            children[m.parent_id].append(m)
+
+    for node_id, node in nodes.items():
+        node.thread_replies = sorted(children.get(node_id, []), key=lambda m: m.seq)
+
+    return messages
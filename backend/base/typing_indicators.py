@@ -0,0 +1,129 @@
+"""
+Coalesced typing indicators.
+
+Instead of relaying every keystroke frame to the whole hub, typing state is
+kept in the sorted set ``hub:<id>:typing`` (score = expiry time) and the hub
+receives a "who is typing" snapshot at most once per
+HUB_TYPING_SNAPSHOT_INTERVAL, and only when the set of typers changed. The
+per-hub throttle is a Redis lock, so it holds across workers.
+"""
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+
+from . import metrics
+from .broadcast import group_send_frame
+from .redis_pool import get_redis
+
+logger = logging.getLogger(__name__)
+
+# KEYS: zset, last snapshot, throttle lock | ARGV: now, interval_ms
+# Returns -1 when throttled, else {changed, typer, ...}.
+SNAPSHOT_LUA = """
+if not redis.call('SET', KEYS[3], '1', 'NX', 'PX', ARGV[2]) then
+    return -1
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local typers = redis.call('ZRANGE', KEYS[1], 0, -1)
+local joined = table.concat(typers, '\\n')
+local result = {0}
+if (redis.call('GET', KEYS[2]) or '') ~= joined then
+    redis.call('SET', KEYS[2], joined, 'EX', 3600)
+    result[1] = 1
+end
+for _, typer in ipairs(typers) do
+    table.insert(result, typer)
+end
+return result
+"""
+
+
+def typing_keys(hub_id):
+    return (
+        f"hub:{hub_id}:typing",
+        f"hub:{hub_id}:typing:last",
+        f"hub:{hub_id}:typing:lock",
+    )
+
+
+class TypingDebouncer:
+    """Per-connection filter that drops repeated "still typing" frames."""
+
+    def __init__(self):
+        self.is_typing = False
+        self.refreshed_at = 0.0
+
+    def accept(self, is_typing):
+        now = time.monotonic()
+        if is_typing and self.is_typing and now - self.refreshed_at < settings.HUB_TYPING_DEBOUNCE:
+            return False
+        if not is_typing and not self.is_typing:
+            return False
+        self.is_typing = is_typing
+        self.refreshed_at = now
+        return True
+
+
+# hub_id -> running flush task on this worker
+_flushers = {}
+# hubs with typing changes the running flusher has not picked up yet
+_dirty = set()
+
+
+async def update(hub_id, username, is_typing, channel_layer):
+    """Record a (debounced) typing frame and make sure a snapshot follows."""
+    key = typing_keys(hub_id)[0]
+    client = get_redis()
+    if is_typing:
+        await client.zadd(key, {username: time.time() + settings.HUB_TYPING_TIMEOUT})
+    else:
+        await client.zrem(key, username)
+    await client.expire(key, settings.HUB_TYPING_TIMEOUT * 2)
+
+    _dirty.add(hub_id)
+    flusher = _flushers.get(hub_id)
+    if flusher is None or flusher.done():
+        _flushers[hub_id] = asyncio.create_task(_flush_hub(hub_id, channel_layer))
+
+
+async def _flush_hub(hub_id, channel_layer):
+    """
+    Emit snapshots for one hub until nobody is typing any more, so entries
+    that simply time out are also cleared on the clients.
+    """
+    client = get_redis()
+    script = client.register_script(SNAPSHOT_LUA)
+    interval = settings.HUB_TYPING_SNAPSHOT_INTERVAL
+    keys = list(typing_keys(hub_id))
+
+    try:
+        while True:
+            _dirty.discard(hub_id)
+            result = await script(keys=keys, args=[time.time(), int(interval * 1000)])
+            if result == -1:
+                # Another worker published within this interval; retry after it
+                metrics.incr("typing", "snapshots_throttled")
+            else:
+                changed, typers = result[0], result[1:]
+                if changed:
+                    metrics.incr("typing", "snapshots_sent")
+                    await group_send_frame(
+                        f"hub_{hub_id}",
+                        {
+                            "type": "typing_snapshot",
+                            "users": typers,
+                        },
+                        channel_layer,
+                        ephemeral=True,
+                    )
+                else:
+                    metrics.incr("typing", "snapshots_unchanged")
+                if not typers and hub_id not in _dirty:
+                    return
+            await asyncio.sleep(interval)
+    except Exception:
+        logger.exception("Typing flush failed for hub %s", hub_id)
+    finally:
+        _flushers.pop(hub_id, None)
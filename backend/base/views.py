@@ -8,15 +8,17 @@ from django.core.exceptions import PermissionDenied
 
 from rest_framework.decorators import action, api_view, permission_classes
 
-from .models import Hub, HubMembership, Message, Event, EventAttendance, MessageHighlight, BanHistory
+from .models import Hub, HubMembership, Message, Event, MessageHighlight, BanHistory
 from .serializers import EventDetailSerializer, EventSerializer, HubDetailSerializer, HubSerializer, HubMembershipSerializer, MessageSerializer
+from django.db import transaction
 from django.utils import timezone
 
 from rest_framework.parsers import MultiPartParser, FormParser
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from . import access, attendance, dashboard, event_calendar, event_listing, notifications, outbox, recent, search
 
 from .permissions import is_approved_member
+from .pagination import MessageCursorPagination
+from .threads import attach_thread_replies
 
 from rest_framework import serializers
 
@@ -28,6 +30,13 @@ class DashboardViewSet(ViewSet):
             return Response({"role": "superuser"})
         return Response({"role": "user"})
 
+    @action(detail=False, methods=["get"])
+    def summary(self, request):
+        """Hubs, their next events and totals for the superuser dashboard, in one call."""
+        if not request.user.is_superuser:
+            raise PermissionDenied("Superusers only")
+        return Response(dashboard.summary(request.user, request))
+
 from rest_framework import viewsets, filters
 from rest_framework.pagination import LimitOffsetPagination
 
@@ -60,41 +69,53 @@ class HubViewSet(viewsets.ModelViewSet):
     def upcoming_events(self, request, pk=None):
         hub = self.get_object()
         now = timezone.now()
-        events = hub.events.filter(start_time__gte=now).order_by("start_time")[:5]
-        serializer = EventSerializer(events, many=True, context={"request": request})
+        events = event_listing.annotate(
+            hub.events.filter(start_time__gte=now).order_by("start_time"), request.user
+        )[:5]
+        serializer = EventSerializer(
+            event_listing.attach_attendees(events), many=True, context={"request": request}
+        )
         return Response(serializer.data)
     
     @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
     def my_events(self, request):
+        """
+        The next ``limit_per_hub`` (default 5) events of every hub of the
+        caller that has any, grouped by hub. With ``?limit=`` the hubs are
+        paginated (``offset``).
+        """
         user = request.user
-
-        if user.is_superuser:
-            hubs = Hub.objects.all()
-        else:
-            hubs = Hub.objects.filter(
-            Q(admin=user) |
-            Q(
-                hubmembership__user=user,
-                hubmembership__is_approved=True
+        try:
+            per_hub = min(
+                max(int(request.query_params.get("limit_per_hub", 5)), 1),
+                event_listing.MAX_EVENTS_PER_HUB,
             )
-        ).distinct()
+        except ValueError:
+            raise serializers.ValidationError("limit_per_hub must be a number")
 
-        data = []
-        now = timezone.now()
+        events = Event.objects.filter(start_time__gte=timezone.now())
+        events = events.filter(event_listing.member_hub_filter(user))
 
-        for hub in hubs:
-            events = hub.events.filter(start_time__gte=now).order_by("start_time")[:5]
-            if events.exists():
-                data.append({
-                    "hub_id": hub.id,
-                    "hub_name": hub.name,
-                    "events": EventSerializer(
-                        events,
-                        many=True,
-                        context={"request": request}
-                    ).data
-                })
+        hub_ids = events.order_by("hub_id").values_list("hub_id", flat=True).distinct()
+        page = self.paginate_queryset(hub_ids)
+        if page is not None:
+            events = events.filter(hub_id__in=page)
 
+        by_hub = event_listing.top_per_hub(event_listing.annotate(events, user), per_hub)
+        # Attendees of every listed event in one query
+        event_listing.attach_attendees([event for _, events in by_hub for event in events])
+
+        context = {"request": request}
+        data = [
+            {
+                "hub_id": hub.id,
+                "hub_name": hub.name,
+                "events": EventSerializer(events, many=True, context=context).data,
+            }
+            for hub, events in by_hub
+        ]
+        if page is not None:
+            return self.get_paginated_response(data)
         return Response(data)
     
     @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
@@ -133,7 +154,7 @@ class HubViewSet(viewsets.ModelViewSet):
     def members(self, request, pk=None):
         hub = self.get_object()
 
-        if hub.admin != request.user:
+        if not access.is_admin(request.user, hub):
             return Response({"error": "Not allowed"}, status=403)
 
         memberships = HubMembership.objects.filter(hub=hub).select_related("user")
@@ -155,7 +176,7 @@ class HubViewSet(viewsets.ModelViewSet):
     def ban_member(self, request, pk=None):
         hub = self.get_object()
 
-        if hub.admin != request.user:
+        if not access.is_admin(request.user, hub):
             return Response({"error": "Not allowed"}, status=403)
 
         user_id = request.data.get("user_id")
@@ -175,6 +196,8 @@ class HubViewSet(viewsets.ModelViewSet):
                 "unbanned_at": None
             }
         )
+        # Also ends the user's live subscription to the hub
+        notifications.notify(user_id, "banned", revoke_hub=hub.id, hub=hub.id, hub_name=hub.name)
 
         return Response({"message": "Member banned"})
     
@@ -182,7 +205,7 @@ class HubViewSet(viewsets.ModelViewSet):
     def reapprove_member(self, request, pk=None):
         hub = self.get_object()
 
-        if hub.admin != request.user:
+        if not access.is_admin(request.user, hub):
             return Response({"error": "Not allowed"}, status=403)
 
         user_id = request.data.get("user_id")
@@ -198,6 +221,7 @@ class HubViewSet(viewsets.ModelViewSet):
                 "approved_at": timezone.now(),
             }
         )
+        notifications.notify(user_id, "membership_approved", hub=hub.id, hub_name=hub.name)
 
         return Response({"message": "User re-approved"})
 
@@ -207,7 +231,7 @@ class HubViewSet(viewsets.ModelViewSet):
     def ban_history(self, request, pk=None):
         hub = self.get_object()
 
-        if hub.admin != request.user:
+        if not access.is_admin(request.user, hub):
             return Response({"error": "Not allowed"}, status=403)
 
         # Assuming you create a model BanHistory(user, hub, banned_by, banned_at)
@@ -236,13 +260,14 @@ class HubViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["post"], permission_classes=[IsAuthenticated])
     def deny_member(self, request, pk=None):
         hub = self.get_object()
-        if hub.admin != request.user:
+        if not access.is_admin(request.user, hub):
             return Response({"error": "Only admin can deny requests"}, status=403)
 
         user_id = request.data.get("user_id")
         try:
             membership = HubMembership.objects.get(hub=hub, user_id=user_id, is_approved=False)
             membership.delete()
+            notifications.notify(user_id, "membership_denied", hub=hub.id, hub_name=hub.name)
             return Response({"message": "Request denied"}, status=200)
         except HubMembership.DoesNotExist:
             return Response({"error": "Pending request not found"}, status=404)
@@ -251,7 +276,7 @@ class HubViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["post"], permission_classes=[IsAuthenticated])
     def leave_hub(self, request, pk=None):
         hub = self.get_object()
-        if hub.admin == request.user:
+        if access.is_admin(request.user, hub):
             return Response({"error": "Admin cannot leave the hub"}, status=400)
 
         membership = HubMembership.objects.filter(hub=hub, user=request.user, is_approved=True).first()
@@ -265,7 +290,7 @@ class HubViewSet(viewsets.ModelViewSet):
     def delete_hub(self, request, pk=None):
         hub = self.get_object()
 
-        if hub.admin != request.user:
+        if not access.is_admin(request.user, hub):
             return Response({"error": "Only admin can delete hub"}, status=403)
 
         hub.delete()
@@ -282,13 +307,18 @@ class HubViewSet(viewsets.ModelViewSet):
         )
         if not created:
             return Response({"message": "Already requested or member"}, status=400)
+        notifications.notify(
+            hub.admin_id, "join_request",
+            hub=hub.id, hub_name=hub.name,
+            user={"id": request.user.id, "username": request.user.username},
+        )
         return Response({"message": "Join request sent"}, status=201)
     
     @action(detail=True, methods=["get"], permission_classes=[IsAuthenticated])
     def pending_requests(self, request, pk=None):
         hub = self.get_object()
 
-        if hub.admin != request.user:
+        if not access.is_admin(request.user, hub):
             return Response({"error": "Not allowed"}, status=403)
 
         memberships = HubMembership.objects.filter(hub=hub, is_approved=False).select_related("user")
@@ -308,7 +338,7 @@ class HubViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["post"])
     def approve_member(self, request, pk=None):
         hub = self.get_object()
-        if hub.admin != request.user:
+        if not access.is_admin(request.user, hub):
             return Response({"error": "Only admin can approve"}, status=403)
 
         user_id = request.data.get("user_id")
@@ -320,13 +350,14 @@ class HubViewSet(viewsets.ModelViewSet):
         membership.is_approved = True
         membership.approved_at = timezone.now()
         membership.save()
+        notifications.notify(membership.user_id, "membership_approved", hub=hub.id, hub_name=hub.name)
         return Response({"message": "User approved"}, status=200)
     
     @action(detail=True, methods=["patch"], permission_classes=[IsAuthenticated])
     def update_hub(self, request, pk=None):
         hub = self.get_object()
 
-        if hub.admin != request.user:
+        if not access.is_admin(request.user, hub):
             return Response({"error": "Not allowed"}, status=403)
 
         serializer = HubDetailSerializer(hub, data=request.data, partial=True, context={"request": request})
@@ -361,7 +392,7 @@ class HubViewSet(viewsets.ModelViewSet):
     def create_event(self, request, pk=None):
         hub = self.get_object()
 
-        if hub.admin != request.user:
+        if not access.is_admin(request.user, hub):
             return Response({"error": "Only hub admin can create events"}, status=403)
 
         serializer = EventSerializer(data=request.data, context={"request": request})
@@ -376,12 +407,27 @@ class MessageViewSet(viewsets.ModelViewSet):
     parser_classes = [MultiPartParser, FormParser]
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = MessageCursorPagination
 
     def get_queryset(self):
         hub_id = self.request.query_params.get("hub")
         return Message.objects.filter(
             hub_id=hub_id
-        ).select_related("sender", "parent").order_by("timestamp")
+        ).select_related("sender", "sender__profile", "parent").order_by("seq")
+
+    def list(self, request, *args, **kwargs):
+        # Opening a hub: the newest page comes from the Redis buffer
+        hub_id = request.query_params.get("hub", "")
+        if hub_id.isdigit() and self.paginator.is_latest_page(request):
+            limit = self.paginator.get_page_size(request)
+            messages, has_older = recent.latest_page(int(hub_id), limit, request)
+            self.paginator.paginate_latest(messages, has_older, request)
+            return self.get_paginated_response(messages)
+
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        attach_thread_replies(page)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def perform_create(self, serializer):
         hub_id = self.request.data.get("hub")
@@ -389,15 +435,8 @@ class MessageViewSet(viewsets.ModelViewSet):
         user = self.request.user
 
         # ✅ ADMIN IS ALWAYS ALLOWED
-        if hub.admin != user:
-            is_member = HubMembership.objects.filter(
-                hub=hub,
-                user=user,
-                is_approved=True
-            ).exists()
-
-            if not is_member:
-                raise PermissionDenied("Not a hub member")
+        if not access.is_member(user, hub):
+            raise PermissionDenied("Not a hub member")
 
         parent_id = self.request.data.get("parent")
         parent = None
@@ -415,23 +454,25 @@ class MessageViewSet(viewsets.ModelViewSet):
             except ValueError:
                 raise serializers.ValidationError("Parent must be a number")
 
-        message = serializer.save(
-            sender=user,
-            hub=hub,
-            parent=parent,
-        )
-
-        # 🔥 broadcast
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"hub_{hub_id}",
-            {
-                "type": "chat_message",
-                "message": MessageSerializer(
-                    message, context={"request": self.request}
-                ).data,
-            },
-        )
+        with transaction.atomic():
+            message = serializer.save(
+                sender=user,
+                hub=hub,
+                parent=parent,
+            )
+            # A brand new message has no replies yet
+            message.thread_replies = []
+
+            # 🔥 broadcast after commit (serializer.data is cached and reused for the response)
+            outbox.record(
+                hub.id,
+                {
+                    "type": "chat_message",
+                    "message": serializer.data,
+                },
+                replay=True,
+                recent=recent.entries_for(message, serializer.data, self.request),
+            )
 
     @action(detail=True, methods=["patch"], parser_classes=[MultiPartParser, FormParser])
     def edit(self, request, pk=None):
@@ -446,40 +487,95 @@ class MessageViewSet(viewsets.ModelViewSet):
 
         message.is_edited = True
         message.edited_at = timezone.now()
-        message.save()
 
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"hub_{message.hub_id}",
-            {
-                "type": "message_edit",
-                "message": MessageSerializer(message, context={"request": request}).data,
-            },
-        )
-        return Response(MessageSerializer(message, context={"request": request}).data)
+        with transaction.atomic():
+            message.save()
+
+            attach_thread_replies([message])
+            data = MessageSerializer(message, context={"request": request}).data
+
+            outbox.record(
+                message.hub_id,
+                {
+                    "type": "message_edit",
+                    "message": data,
+                },
+                replay=True,
+                recent=recent.entries_for(message, data, request),
+            )
+        return Response(data)
         
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        """
+        Full-text search in the caller's hubs (or ``?hub=``), best match first.
+
+        Only the newest HUB_SEARCH_CANDIDATES matches are ranked. When a
+        query matched more, ``ranked_newest`` says how many were, as a hint
+        to narrow the query; it is null when every match was ranked.
+        """
+        text = request.query_params.get("q", "").strip()
+        try:
+            limit = min(max(int(request.query_params.get("limit", 20)), 1), 50)
+            offset = max(int(request.query_params.get("offset", 0)), 0)
+        except ValueError:
+            raise serializers.ValidationError("limit and offset must be numbers")
+
+        hub_id = request.query_params.get("hub")
+        if hub_id:
+            if not hub_id.isdigit() or not access.can_read(request.user, hub_id):
+                raise PermissionDenied("Not a hub member")
+            hub_ids = [int(hub_id)]
+        else:
+            # None for superusers: every hub
+            hub_ids = access.member_hub_ids(request.user)
+
+        # One extra row tells whether there is a next page
+        hits, ranked_newest = search.search(text, hub_ids, limit + 1, offset)
+        return Response({
+            "next_offset": offset + limit if len(hits) > limit else None,
+            "ranked_newest": ranked_newest,
+            "results": [
+                {
+                    "id": message.id,
+                    "hub": message.hub_id,
+                    "seq": message.seq,
+                    "parent_id": message.parent_id,
+                    "sender": {"id": message.sender_id, "username": message.sender.username},
+                    "timestamp": message.timestamp,
+                    "snippet": snippet,
+                    "rank": rank,
+                }
+                for message, rank, snippet in hits[:limit]
+            ],
+        })
+
     @action(detail=True, methods=["delete"])
     def delete_message(self, request, pk=None):
         message = self.get_object()
 
-        if message.sender != request.user and message.hub.admin != request.user:
+        if message.sender_id != request.user.id and not access.is_admin(request.user, message.hub_id):
             raise PermissionDenied("Not allowed")
 
         message.is_deleted = True
         message.content = None
         message.media = None
         message.audio = None
-        message.save()
 
-        # 🔥 broadcast delete
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"hub_{message.hub_id}",
-            {
-                "type": "message_delete",
-                "message_id": message.id,
-            },
-        )
+        with transaction.atomic():
+            message.save()
+
+            # 🔥 broadcast delete
+            outbox.record(
+                message.hub_id,
+                {
+                    "type": "message_delete",
+                    "message_id": message.id,
+                    "seq": message.seq,
+                },
+                replay=True,
+                recent=recent.entries_for(message),
+            )
 
         return Response({"status": "deleted"})
 
@@ -511,14 +607,33 @@ class EventViewSet(viewsets.ModelViewSet):
         if hub_id:
             qs = qs.filter(hub_id=hub_id)
 
-        if start_date:
-            qs = qs.filter(start_time__date__gte=parse_date(start_date))
-
-        if end_date:
-            qs = qs.filter(start_time__date__lte=parse_date(end_date))
-
+        # Local days as [midnight, next midnight) ranges on the bare, indexed column
+        if start_date or end_date:
+            try:
+                tz = event_calendar.get_timezone(self.request.query_params.get("tz"))
+                first = event_calendar.parse_day(start_date) if start_date else None
+                last = event_calendar.parse_day(end_date) if end_date else None
+            except ValueError as e:
+                raise serializers.ValidationError(str(e))
+            start, end = event_calendar.day_range(first, last, tz)
+            if start:
+                qs = qs.filter(start_time__gte=start)
+            if end:
+                qs = qs.filter(start_time__lt=end)
+
+        if self.action in ("list", "retrieve"):
+            qs = event_listing.annotate(qs, self.request.user)
         return qs
 
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(event_listing.attach_attendees(page), many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(event_listing.attach_attendees(queryset), many=True)
+        return Response(serializer.data)
+
     def get_serializer_class(self):
         if self.action == "retrieve":
             return EventDetailSerializer
@@ -531,7 +646,7 @@ class EventViewSet(viewsets.ModelViewSet):
         if not hub_id:
             raise serializers.ValidationError({"hub": "Hub is required"})
 
-        if hub.admin != self.request.user:
+        if not access.is_admin(self.request.user, hub):
             raise PermissionDenied("Only hub admin can create events")
 
         serializer.save(hub=hub, created_by=self.request.user)
@@ -541,41 +656,30 @@ class EventViewSet(viewsets.ModelViewSet):
     def attend(self, request, pk=None):
         event = self.get_object()
 
-        if not is_approved_member(request.user, event.hub):
+        if not is_approved_member(request.user, event.hub_id):
             raise PermissionDenied("Not a hub member")
 
-        attendance, created = EventAttendance.objects.get_or_create(
-            event=event,
-            user=request.user,
-            defaults={"attending": True},
-        )
-
-        if not created and attendance.attending:
-            # already attending → do nothing
-            return Response({
-                "attending": True,
-                "attendees_count": event.attendances.filter(attending=True).count()
-            })
-
-        attendance.attending = True
-        attendance.save()
-
-        # 🔥 broadcast AFTER DB commit
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"hub_{event.hub_id}",
-            {
-                "type": "event_update",
-                "event": {
-                    "event_id": event.id,
-                    "action": "attending",
-                },
-            }
-        )
+        with transaction.atomic():
+            changed, count = attendance.attend(event, request.user)
+
+            # already attending → nothing to broadcast
+            if changed:
+                # 🔥 broadcast AFTER DB commit
+                outbox.record(
+                    event.hub_id,
+                    {
+                        "type": "event_update",
+                        "event": {
+                            "event_id": event.id,
+                            "action": "attending",
+                            "attendees_count": count,
+                        },
+                    }
+                )
 
         return Response({
             "attending": True,
-            "attendees_count": event.attendances.filter(attending=True).count()
+            "attendees_count": count
         })
 
 
@@ -583,26 +687,25 @@ class EventViewSet(viewsets.ModelViewSet):
     def unattend(self, request, pk=None):
         event = self.get_object()
 
-        EventAttendance.objects.filter(
-            event=event,
-            user=request.user
-        ).update(attending=False)
-
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"hub_{event.hub_id}",
-            {
-                "type": "event_update",
-                "event": {
-                    "event_id": event.id,
-                    "action": "not_attending",
-                },
-            }
-        )
+        with transaction.atomic():
+            changed, count = attendance.unattend(event, request.user)
+
+            if changed:
+                outbox.record(
+                    event.hub_id,
+                    {
+                        "type": "event_update",
+                        "event": {
+                            "event_id": event.id,
+                            "action": "not_attending",
+                            "attendees_count": count,
+                        },
+                    }
+                )
 
         return Response({
             "attending": False,
-            "attendees_count": event.attendances.filter(attending=True).count()
+            "attendees_count": count
         })
     
     
@@ -610,7 +713,7 @@ class EventViewSet(viewsets.ModelViewSet):
     def update_event(self, request, pk=None):
         event = self.get_object()
 
-        if event.hub.admin != request.user:
+        if not access.is_admin(request.user, event.hub_id):
             return Response({"error": "Not allowed"}, status=403)
 
         serializer = EventSerializer(event, data=request.data, partial=True, context={"request": request})
@@ -618,30 +721,50 @@ class EventViewSet(viewsets.ModelViewSet):
         serializer.save()
         return Response(serializer.data)
     
+    @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
+    def calendar(self, request):
+        """
+        Events of the month or week (``view``) holding ``date`` (default
+        today) in the caller's hubs, grouped per day in the ``tz`` timezone.
+        """
+        params = request.query_params
+        view = params.get("view", "month")
+        try:
+            tz = event_calendar.get_timezone(params.get("tz"))
+            anchor = event_calendar.parse_day(params["date"]) if params.get("date") else event_calendar.today(tz)
+            first, after = event_calendar.view_days(view, anchor)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
+        events = Event.objects.filter(
+            start_time__gte=event_calendar.day_start(first, tz),
+            start_time__lt=event_calendar.day_start(after, tz),
+        ).filter(event_listing.member_hub_filter(request.user))
+        hub_id = params.get("hub")
+        if hub_id:
+            if not hub_id.isdigit():
+                raise serializers.ValidationError("hub must be a number")
+            events = events.filter(hub_id=hub_id)
+
+        return Response({
+            "view": view,
+            "start": first,
+            "end": after,
+            "timezone": tz.key,
+            "days": event_calendar.day_buckets(events, tz),
+        })
+
     @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
     def upcoming(self, request):
         now = timezone.now()
 
-        # 🔥 Superuser sees EVERYTHING
-        if request.user.is_superuser:
-            events = Event.objects.filter(
-                start_time__gte=now
-            ).select_related("hub").order_by("start_time")
+        events = Event.objects.filter(start_time__gte=now).order_by("start_time")
 
-        # 👤 Regular users: only approved hubs
-        else:
-            events = Event.objects.filter(
-                start_time__gte=now
-            ).filter(
-                Q(hub__admin=request.user) |
-                Q(
-                    hub__hubmembership__user=request.user,
-                    hub__hubmembership__is_approved=True
-                )
-            ).select_related("hub").order_by("start_time")
+        # 👤 Regular users: only approved hubs (🔥 superuser sees EVERYTHING)
+        events = events.filter(event_listing.member_hub_filter(request.user))
 
         serializer = EventSerializer(
-            events,
+            event_listing.attach_attendees(event_listing.annotate(events, request.user)),
             many=True,
             context={"request": request}
         )
@@ -651,7 +774,7 @@ class EventViewSet(viewsets.ModelViewSet):
     def delete_event(self, request, pk=None):
         event = self.get_object()
 
-        if event.hub.admin != request.user:
+        if not access.is_admin(request.user, event.hub_id):
             return Response({"error": "Only hub admin can delete events"}, status=403)
 
         event.delete()
@@ -20,6 +20,8 @@ export function EventsTable() {
               search: query,
               start_date: startDate || undefined,
               end_date: endDate || undefined,
+              // Dates are days in the browser's timezone
+              tz: Intl.DateTimeFormat().resolvedOptions().timeZone,
               limit: 10,
             },
       });
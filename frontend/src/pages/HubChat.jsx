@@ -395,6 +395,18 @@ const OnlineSidebar = ({ onlineUsers, currentUsername, compact = false }) => (
   </div>
 );
 
+const ThrottleNotice = ({ throttle }) => {
+  if (!throttle) return null;
+  return (
+    <div className="px-4 py-1.5 text-xs text-amber-400 border-t border-zinc-800">
+      {throttle.scope === "hub"
+        ? "This hub is busy right now"
+        : "You're sending messages too quickly"}
+      {" "}— try again in {Math.ceil(throttle.retry_after)}s.
+    </div>
+  );
+};
+
 /* ---------- ChatPanel ---------- */
 // FIX: defined OUTSIDE HubChat — all sub-components passed as props
 const ChatPanel = ({
@@ -404,6 +416,7 @@ const ChatPanel = ({
   text, setText, file, setFile, sendMessage, handleTyping, handleKeyDown,
   textareaRef, emojiButtonRef, fileInputRef, showEmojiPicker,
   setShowEmojiPicker, insertEmoji, numericHubId, onlineUsers, currentUsername,
+  throttle,
 }) => (
   <div className="flex flex-1 min-h-0 overflow-hidden">
     <div className="flex flex-col flex-1 min-h-0 min-w-0 relative">
@@ -426,6 +439,7 @@ const ChatPanel = ({
           <ChevronDown className="w-3.5 h-3.5" /> New messages
         </button>
       )}
+      <ThrottleNotice throttle={throttle} />
       <EditBanner editingMessage={editingMessage} cancelEdit={cancelEdit} />
       <ReplyBar replyTo={replyTo} setReplyTo={setReplyTo} />
       <InputArea
@@ -471,15 +485,20 @@ export default function HubChat() {
   const [editingMessage, setEditingMessage] = useState(null);
   const [showEmojiPicker, setShowEmojiPicker] = useState(false);
   const [showScrollBtn, setShowScrollBtn] = useState(false);
+  const [olderPageUrl, setOlderPageUrl] = useState(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
+  const [throttle, setThrottle] = useState(null);
 
   const textareaRef = useRef(null);
   const emojiButtonRef = useRef(null);
   const socketRef = useRef(null);
+  const lastEidRef = useRef(null);
   const messagesEndRef = useRef(null);
   const fileInputRef = useRef(null);
   const messagesContainerRef = useRef(null);
   const typingTimeoutRef = useRef(null);
   const typingTimersRef = useRef({});
+  const throttleTimerRef = useRef(null);
 
   const token = localStorage.getItem("access");
   const currentUsername = localStorage.getItem("username");
@@ -497,21 +516,43 @@ export default function HubChat() {
 
   const navigate = useNavigate();
 
-  // Scroll button visibility
+  // History is cursor-paginated: fetch the previous (older) page and keep the viewport anchored
+  const loadOlderMessages = useCallback(async () => {
+    if (!olderPageUrl || loadingOlder) return;
+    const el = messagesContainerRef.current;
+    const prevHeight = el ? el.scrollHeight : 0;
+    setLoadingOlder(true);
+    try {
+      const res = await api.get(olderPageUrl);
+      setMessages((prev) => {
+        const seen = new Set(prev.map((m) => m.id));
+        return [...res.data.results.filter((m) => !seen.has(m.id)), ...prev];
+      });
+      setOlderPageUrl(res.data.previous);
+      requestAnimationFrame(() => {
+        if (el) el.scrollTop = el.scrollHeight - prevHeight;
+      });
+    } catch (err) { console.error("Loading older messages failed:", err); }
+    finally { setLoadingOlder(false); }
+  }, [olderPageUrl, loadingOlder]);
+
+  // Scroll button visibility + load older messages when reaching the top
   useEffect(() => {
     const el = messagesContainerRef.current;
     if (!el) return;
     const onScroll = () => {
       setShowScrollBtn(el.scrollHeight - el.scrollTop - el.clientHeight > 120);
+      if (el.scrollTop < 80) loadOlderMessages();
     };
     el.addEventListener("scroll", onScroll);
     return () => el.removeEventListener("scroll", onScroll);
-  }, []);
+  }, [loadOlderMessages]);
 
   // FIX: scroll to bottom instantly on initial load so last message is visible
-  useEffect(() => {
-    api.get(`/messages/?hub=${numericHubId}`).then((res) => {
-      setMessages(res.data);
+  const loadLatestMessages = useCallback(() => {
+    return api.get(`/messages/?hub=${numericHubId}`).then((res) => {
+      setMessages(res.data.results);
+      setOlderPageUrl(res.data.previous);
       // Use two rAF passes to ensure the DOM has fully painted before scrolling
       requestAnimationFrame(() => {
         requestAnimationFrame(() => {
@@ -521,25 +562,26 @@ export default function HubChat() {
     });
   }, [numericHubId, scrollToBottom]);
 
+  useEffect(() => {
+    loadLatestMessages();
+  }, [loadLatestMessages]);
+
   useEffect(() => {
     textareaRef.current?.focus();
   }, []);
 
   useEffect(() => {
     if (!hubId || !token) return;
-    const ws = new WebSocket(`ws://127.0.0.1:8000/ws/hub/${numericHubId}/?token=${token}`);
-    socketRef.current = ws;
-
-    ws.onopen = () => {
-      if (currentUsername) {
-        setOnlineUsers((prev) =>
-          prev.some((u) => u.username === currentUsername) ? prev : [...prev, { username: currentUsername }]
-        );
+    let closedByUs = false;
+    let retry = 0;
+    let reconnectTimer = null;
+
+    const applyFrame = (data) => {
+      // Replayable hub events carry a per-hub event id; skip ones already applied
+      if (data.eid) {
+        if (data.eid <= lastEidRef.current) return;
+        lastEidRef.current = data.eid;
       }
-    };
-
-    ws.onmessage = (e) => {
-      const data = JSON.parse(e.data);
       switch (data.type) {
         case "chat_message":
           setMessages((prev) => prev.some((m) => m.id === data.message.id) ? prev : [...prev, data.message]);
@@ -551,6 +593,22 @@ export default function HubChat() {
         case "message_delete":
           setMessages((prev) => prev.map((m) => m.id === data.message_id ? { ...m, is_deleted: true, content: null } : m));
           break;
+        case "session":
+          lastEidRef.current = data.last_eid;
+          break;
+        case "replay":
+          // Missed events while disconnected; reset means the gap is too old, reload from the DB
+          if (data.reset) {
+            lastEidRef.current = data.last_eid;
+            loadLatestMessages();
+          } else {
+            data.events.forEach(applyFrame);
+          }
+          break;
+        case "batch":
+          // Backlog the server merged into one frame for a slow connection
+          data.events.forEach(applyFrame);
+          break;
         case "typing": {
           const { user: typingUser, is_typing } = data;
           if (typingUser === currentUsername) break;
@@ -567,6 +625,13 @@ export default function HubChat() {
           }
           break;
         }
+        case "typing_snapshot": {
+          // Server-side coalesced "who is typing" state for the whole hub
+          Object.values(typingTimersRef.current).forEach(clearTimeout);
+          typingTimersRef.current = {};
+          setTypingUsers((data.users || []).filter((u) => u !== currentUsername));
+          break;
+        }
         case "presence":
           setOnlineUsers((prev) => {
             if (!data.user?.username) return prev;
@@ -578,16 +643,55 @@ export default function HubChat() {
         case "online_users":
           setOnlineUsers(Array.from(new Map((data.users || []).map((u) => [u.username, u])).values()));
           break;
+        case "throttled":
+          // Rate limited by the server; typing throttles are not worth showing
+          if (data.kind !== "message") break;
+          setThrottle(data);
+          clearTimeout(throttleTimerRef.current);
+          throttleTimerRef.current = setTimeout(() => setThrottle(null), data.retry_after * 1000);
+          break;
         default: break;
       }
     };
 
+    const connect = () => {
+      const since = lastEidRef.current !== null ? `&since=${lastEidRef.current}` : "";
+      const ws = new WebSocket(`ws://127.0.0.1:8000/ws/hub/${numericHubId}/?token=${token}${since}`);
+      socketRef.current = ws;
+
+      ws.onopen = () => {
+        retry = 0;
+        if (currentUsername) {
+          setOnlineUsers((prev) =>
+            prev.some((u) => u.username === currentUsername) ? prev : [...prev, { username: currentUsername }]
+          );
+        }
+      };
+
+      ws.onmessage = (e) => applyFrame(JSON.parse(e.data));
+
+      // Reconnect with backoff and resume from the last seen event (this also
+      // covers 4008, the server dropping us for falling too far behind)
+      ws.onclose = () => {
+        if (closedByUs) return;
+        retry += 1;
+        reconnectTimer = setTimeout(connect, Math.min(1000 * 2 ** (retry - 1), 15000));
+      };
+    };
+
+    lastEidRef.current = null;
+    connect();
+
     return () => {
+      closedByUs = true;
+      clearTimeout(reconnectTimer);
+      clearTimeout(throttleTimerRef.current);
       Object.values(typingTimersRef.current).forEach(clearTimeout);
       typingTimersRef.current = {};
-      if (ws.readyState === WebSocket.OPEN || ws.readyState === WebSocket.CONNECTING) ws.close();
+      const ws = socketRef.current;
+      if (ws && (ws.readyState === WebSocket.OPEN || ws.readyState === WebSocket.CONNECTING)) ws.close();
     };
-  }, [hubId, token, numericHubId, currentUsername, scrollToBottom]);
+  }, [hubId, token, numericHubId, currentUsername, scrollToBottom, loadLatestMessages]);
 
   const handleTyping = useCallback(() => {
     const ws = socketRef.current;
@@ -685,7 +789,7 @@ export default function HubChat() {
     text, setText, file, setFile, sendMessage,
     handleTyping, handleKeyDown, textareaRef, emojiButtonRef,
     fileInputRef, showEmojiPicker, setShowEmojiPicker,
-    insertEmoji, numericHubId, onlineUsers, currentUsername,
+    insertEmoji, numericHubId, onlineUsers, currentUsername, throttle,
   };
 
   if (!numericHubId || Number.isNaN(numericHubId)) {
@@ -77,29 +77,22 @@ export default function SuperUserDashboard() {
     try {
       setLoading(true);
 
-      const hubsRes = await api.get("/hubs/gallery_hubs/");
-      const hubs = hubsRes.data;
+      // Hubs, their next events and totals in one (server-cached) call
+      const { data } = await api.get("/dashboard/summary/");
 
       const collectedEvents = [];
-      let totalUpcomingEvents = 0; // Only upcoming events
-
-      for (const hub of hubs) {
-        const res = await api.get(`/hubs/${hub.id}/upcoming_events/`);
-        const hubEvents = res.data;
-        totalUpcomingEvents += hubEvents.length;
 
+      data.events.forEach(({ hub_id, hub_name, events: hubEvents }) => {
         hubEvents.forEach((event) => {
           collectedEvents.push({
             ...event,
-            hub: hub.id,
-            hubName: hub.name,
+            hub: hub_id,
+            hubName: hub_name,
             eventId: event.id,
             image: event.image_url || DEFAULT_IMAGE,
           });
         });
-      }
-
-      const usersRes = await api.get("/users/");
+      });
 
       const attending = {};
       const membership = {};
@@ -114,9 +107,10 @@ export default function SuperUserDashboard() {
       setMembershipStatus(membership);
 
       setStats({
-        hubs: hubs.length,
-        events: totalUpcomingEvents, // Only upcoming events
-        users: usersRes.data.length,
+        hubs: data.totals.hubs,
+        // As before: the upcoming events listed, at most five per hub
+        events: collectedEvents.length,
+        users: data.totals.users,
       });
     } catch (err) {
       console.error("Dashboard fetch failed:", err);